@@ -22,6 +22,8 @@ Following the creation of the graph, all possible starting points are searched f
 To do this, we look for all possible paths from all tables that contain all columns listed in ``starting_columns`` to all tables that contain all columns listed in ``ending_columns`` and count how many steps there are between each table.
 The ``run_graph()`` method prints out a numbered list of possible paths.
 
+If the path must go through specific columns (say, you need the MSOA21CD column somewhere between wards and local authorities), you can list them in the ``via_columns`` argument of ``run_graph()``. The search is then guided through tables containing those columns, in the order given, and only the shortest of such paths are returned.
+
 The user can get their chosen data using the ``geodata()`` method by providing an integer matching their chosen path to the ``selected_path`` argument.
 This will then initiate the download phase, in which the code creates sequential SQL commands and uses ``FeatureServer()`` class to download the intended data.
 
@@ -59,13 +61,18 @@ Once you've decided you want to look at 2022 wards, you can do the following:
 From here, you can take the WD22CD column from ``output`` and use it as input to the ``Consensus.Nomis.DownloadFromNomis()`` class if you wanted to.
 """
 import pandas as pd
+import geopandas as gpd
+import numpy as np
+import shapely
+import duckdb
 import asyncio
 from Consensus.EsriConnector import FeatureServer
 from Consensus.utils import where_clause_maker, read_lookup
 from Consensus.server_selector_util import get_server
 from numpy import random
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Set, Tuple
+from collections import deque
 import platform
 
 if platform.system() == 'Windows':
@@ -123,6 +130,59 @@ def BFS_SP(graph: Dict[str, List[Tuple[str, str]]], start: str, goal: str) -> Li
     return 'no_connecting_path'
 
 
+def BFS_SP_via(graph: Dict[str, List[Tuple[str, str]]], start: str, goal: str, via_tables: List[Set[str]]) -> List[Any]:
+    """
+    Staged breadth-first search that only accepts paths passing through the ``via_tables`` in order.
+
+    The search state is a pair of (table, stage), where the stage counts how many of the sets in ``via_tables`` the path has already visited. This way the precomputed graph is traversed once per stage instead of enumerating and filtering all possible paths.
+
+    Args:
+        graph (Dict[str, List[Tuple[str, str]]]): Dictionary of connected tables based on shared columns.
+        start (str): Starting table.
+        goal (str): Final table.
+        via_tables (List[Set[str]]): An ordered list of sets of tables. The path must visit at least one table from each set, in the given order.
+
+    Returns:
+        List[Any]: A path as a list in the same format as the output of ``BFS_SP()``.
+    """
+    final_stage = len(via_tables)
+
+    def advance(table: str, stage: int) -> int:
+        # a single table can satisfy several consecutive stages if it contains more than one of the via columns
+        while stage < final_stage and table in via_tables[stage]:
+            stage += 1
+        return stage
+
+    start_state = (start, advance(start, 0))
+
+    if start == goal and start_state[1] == final_stage:
+        print("Start and end point are the same")
+        return
+
+    parents = {start_state: None}
+    queue = deque([start_state])
+
+    while queue:
+        state = queue.popleft()
+        table, stage = state
+        for neighbour in graph.get(table, []):
+            next_state = (neighbour[0], advance(neighbour[0], stage))
+            if next_state in parents:
+                continue
+            parents[next_state] = (state, neighbour)
+
+            if neighbour[0] == goal and next_state[1] == final_stage:
+                path = []
+                while parents[next_state] is not None:
+                    next_state, edge = parents[next_state]
+                    path.append(edge)
+                path.append(start)
+                return path[::-1]
+            queue.append(next_state)
+
+    return 'no_connecting_path'
+
+
 class InvalidColumnError(Exception):
     """Raise if invalid column"""
 
@@ -135,6 +195,310 @@ class InvalidPathError(Exception):
     """Raise if graph path length less than one"""
 
 
+class PandasPathMerger:
+    """
+    Left join the tables of a ``SmartLinker()`` path one by one using ``pandas.DataFrame.merge()``.
+
+    Columns that already exist in the merged table are dropped from the joined table (they are first suffixed with "_DROP" and then filtered out).
+
+    Attributes:
+        table (pd.DataFrame): The merged table so far.
+
+    Methods:
+        unique_values(column: str): Get the unique values of the connecting column in the merged table.
+        merge(next_table: pd.DataFrame, connecting_column: str): Left join the next table of the path.
+        result(): Get the deduplicated, merged table.
+    """
+
+    def __init__(self, start_table: pd.DataFrame) -> None:
+        """
+        Initialise the merger with the first table of the path.
+
+        Args:
+            start_table (pd.DataFrame): The first table of the path.
+
+        Returns:
+            None
+        """
+        self.table = start_table
+
+    def unique_values(self, column: str) -> Tuple[str, List[Any]]:
+        """
+        Get the sorted, unique, non-null values of the connecting column in the merged table. The column name is matched as is, in upper case, or in lower case.
+
+        Args:
+            column (str): The name of the connecting column.
+
+        Raises:
+            KeyError: If the column is not in the merged table.
+
+        Returns:
+            Tuple[str, List[Any]]: The name of the column as found in the merged table and a list of its unique values.
+        """
+        for candidate in [column, column.upper(), column.lower()]:
+            if candidate in self.table.columns:
+                return candidate, sorted(self.table[candidate].dropna().unique(), key=str)
+        raise KeyError(column)
+
+    def merge(self, next_table: pd.DataFrame, connecting_column: str) -> None:
+        """
+        Left join the next table of the path on the connecting column.
+
+        Args:
+            next_table (pd.DataFrame): The next table of the path.
+            connecting_column (str): The name of the shared column.
+
+        Returns:
+            None
+        """
+        self.table.columns = [i.upper() for i in self.table.columns]
+        next_table.columns = [col.upper() for col in next_table.columns]
+        self.table = self.table.merge(next_table, on=connecting_column, how='left', suffixes=('', '_DROP')).filter(regex='^(?!.*_DROP)')  # always perform left join on the common column (based on its name), add "_DROP" to column names that are duplicated and then filter them out.
+
+    def result(self) -> pd.DataFrame:
+        """
+        Get the merged table without duplicate rows and empty columns.
+
+        Returns:
+            pd.DataFrame: The merged table.
+        """
+        table = self.table.drop_duplicates()
+        table.dropna(axis='columns', how='all', inplace=True)
+        if "GEOMETRY" in table.columns:
+            table.rename(columns={'GEOMETRY': 'geometry'}, inplace=True)
+        return table
+
+
+class DuckDBPathMerger:
+    """
+    Left join the tables of a ``SmartLinker()`` path with a single DuckDB SQL query.
+
+    Each table is registered as a relation in an in-memory DuckDB database and the merged table is only materialised once, when ``result()`` is called. Only the columns that survive the merge are selected so that DuckDB can push the projection down to the joined relations.
+    The output matches that of ``PandasPathMerger()``: columns that already exist in the merged table are not taken from the joined tables.
+
+    Attributes:
+        conn (duckdb.DuckDBPyConnection): In-memory DuckDB connection.
+        crs (Any): The coordinate reference system of the geometry column, if any.
+        selected_columns (Dict[str, str]): A dictionary of column names and the alias of the relation that provides the column.
+        joins (List[str]): The SQL join clauses.
+
+    Methods:
+        unique_values(column: str): Get the unique values of the connecting column in the merged table.
+        merge(next_table: pd.DataFrame, connecting_column: str): Register the next table of the path and add it to the join.
+        result(): Run the join and get the deduplicated, merged table.
+    """
+
+    def __init__(self, start_table: pd.DataFrame) -> None:
+        """
+        Initialise the merger with the first table of the path.
+
+        Args:
+            start_table (pd.DataFrame): The first table of the path.
+
+        Returns:
+            None
+        """
+        self.conn = duckdb.connect()
+        self.crs = None
+        self.selected_columns = {}
+        self.joins = []
+        self._columns = {}
+        alias = self._register(start_table)
+        for column in self._columns[alias]:
+            self.selected_columns.setdefault(column, alias)
+
+    def _register(self, table: pd.DataFrame) -> str:
+        """
+        Register a table as a DuckDB relation. The column names are upper-cased and geometries are stored as WKB.
+
+        Args:
+            table (pd.DataFrame): The table to register.
+
+        Returns:
+            str: The alias of the registered relation.
+        """
+        alias = f"t{len(self._columns)}"
+        table = table.copy()
+        if isinstance(table, gpd.GeoDataFrame):
+            self.crs = self.crs or table.crs
+            geometry_column = table.geometry.name
+            table = pd.DataFrame(table)
+            table[geometry_column] = shapely.to_wkb(table[geometry_column].values)
+        table.columns = [col.upper() for col in table.columns]
+        self.conn.register(alias, table)
+        self._columns[alias] = list(table.columns)
+        return alias
+
+    @staticmethod
+    def _quote(column: str) -> str:
+        """
+        Quote a column name for SQL.
+
+        Args:
+            column (str): Column name.
+
+        Returns:
+            str: Quoted column name.
+        """
+        return '"' + column.replace('"', '""') + '"'
+
+    def _from_clause(self) -> str:
+        """
+        Create the FROM clause that joins all registered relations.
+
+        Returns:
+            str: The FROM clause.
+        """
+        return " ".join(["FROM t0"] + self.joins)
+
+    def unique_values(self, column: str) -> Tuple[str, List[Any]]:
+        """
+        Get the sorted, unique, non-null values of the connecting column in the merged table.
+
+        Args:
+            column (str): The name of the connecting column.
+
+        Raises:
+            KeyError: If the column is not in the merged table.
+
+        Returns:
+            Tuple[str, List[Any]]: The name of the column and a list of its unique values.
+        """
+        column = column.upper()
+        if column not in self.selected_columns:
+            raise KeyError(column)
+        quoted_column = f"{self.selected_columns[column]}.{self._quote(column)}"
+        values = self.conn.execute(f"SELECT DISTINCT {quoted_column} {self._from_clause()} WHERE {quoted_column} IS NOT NULL ORDER BY {quoted_column}").fetchall()
+        return column, [value[0] for value in values]
+
+    def merge(self, next_table: pd.DataFrame, connecting_column: str) -> None:
+        """
+        Register the next table of the path and add it to the join on the connecting column.
+
+        Args:
+            next_table (pd.DataFrame): The next table of the path.
+            connecting_column (str): The name of the shared column.
+
+        Returns:
+            None
+        """
+        connecting_column = connecting_column.upper()
+        alias = self._register(next_table)
+        self.joins.append(f"LEFT JOIN {alias} ON {self.selected_columns[connecting_column]}.{self._quote(connecting_column)} = {alias}.{self._quote(connecting_column)}")
+        for column in self._columns[alias]:
+            self.selected_columns.setdefault(column, alias)
+
+    def result(self) -> pd.DataFrame:
+        """
+        Run the join and get the merged table without duplicate rows and empty columns.
+
+        Returns:
+            pd.DataFrame: The merged table. If the path contains geometries, a GeoDataFrame is returned.
+        """
+        columns = ", ".join(f"{alias}.{self._quote(column)}" for column, alias in self.selected_columns.items())
+        table = self.conn.execute(f"SELECT DISTINCT {columns} {self._from_clause()}").df()
+        self.conn.close()
+
+        table.dropna(axis='columns', how='all', inplace=True)
+        if "GEOMETRY" in table.columns:
+            table["GEOMETRY"] = gpd.GeoSeries.from_wkb(table["GEOMETRY"].map(lambda x: bytes(x) if x is not None else None), crs=self.crs)
+            table.rename(columns={'GEOMETRY': 'geometry'}, inplace=True)
+            table = gpd.GeoDataFrame(table, geometry='geometry', crs=self.crs)
+        return table
+
+
+class SharedTableDownloader:
+    """
+    Share table downloads between the queries of ``SmartLinker().batch_geodata()``.
+
+    Downloads are keyed by the table, the filter column, and the requested fields. Every value of the filter column is only downloaded once: later requests for the same table only download the values that have not been downloaded before, and are then answered from the rows already in memory. Requests for different tables run concurrently, each with its own ``FeatureServer()`` instance, up to ``max_concurrent_downloads`` at a time.
+
+    Attributes:
+        linker (SmartLinker): The ``SmartLinker()`` instance used to download the tables.
+        download_count (int): The number of requests sent to the server.
+
+    Methods:
+        download(table: str, filter_column: str, values: List[str], output_fields: str, return_geometry: bool): Download a table, optionally filtered by the values of a column. Has the same signature as ``SmartLinker()._download_table()``.
+    """
+
+    def __init__(self, linker: 'SmartLinker', max_concurrent_downloads: int = 4) -> None:
+        """
+        Initialise the downloader.
+
+        Args:
+            linker (SmartLinker): The ``SmartLinker()`` instance used to download the tables.
+            max_concurrent_downloads (int): The maximum number of requests sent at the same time. Defaults to 4.
+
+        Returns:
+            None
+        """
+        self.linker = linker
+        self.download_count = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent_downloads)
+        self._locks = {}
+        self._tables = {}
+        self._downloaded_values = {}
+
+    async def _fetch(self, table: str, where_clause: str = "1=1", output_fields: str = '*', return_geometry: bool = None, **kwargs) -> pd.DataFrame:
+        """
+        Send a single download request using a new ``FeatureServer()`` instance.
+
+        Args:
+            table (str): The full name of the table.
+            where_clause (str): The where clause to filter the data.
+            output_fields (str): A comma separated string of the fields to download.
+            return_geometry (bool): Whether to download the geometry.
+            **kwargs: Keyword arguments to pass to ``SmartLinker()._get_ogp_table()``.
+
+        Returns:
+            pd.DataFrame: The downloaded data.
+        """
+        async with self._semaphore:
+            self.download_count += 1
+            return await self.linker._get_ogp_table(table, where_clause=where_clause, output_fields=output_fields, return_geometry=return_geometry, feature_server=FeatureServer(), **kwargs)
+
+    async def download(self, table: str, filter_column: str = None, values: List[str] = None, output_fields: str = '*', return_geometry: bool = None, **kwargs) -> pd.DataFrame:
+        """
+        Download a table, optionally filtered by the values of a column, reusing earlier downloads where possible.
+
+        Args:
+            table (str): The full name of the table.
+            filter_column (str): The column to filter the table by. Defaults to None, which downloads the whole table.
+            values (List[str]): The values of ``filter_column`` to download.
+            output_fields (str): A comma separated string of the fields to download. Defaults to '*' (all fields).
+            return_geometry (bool): Whether to download the geometry. Defaults to None, in which case the geometry is downloaded whenever the table has one.
+            **kwargs: Keyword arguments to pass to ``SmartLinker()._get_ogp_table()``.
+
+        Returns:
+            pd.DataFrame: A copy of the downloaded table.
+        """
+        full_table_key = (table, None, output_fields, return_geometry)
+        key = (table, filter_column.upper(), output_fields, return_geometry) if filter_column else full_table_key
+
+        if key == full_table_key or full_table_key not in self._tables:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                if key == full_table_key:
+                    if key not in self._tables:
+                        self._tables[key] = await self._fetch(table, output_fields=output_fields, return_geometry=return_geometry, **kwargs)
+                    return self._tables[key].copy()
+
+                downloaded_values = self._downloaded_values.setdefault(key, set())
+                missing_values = [value for value in dict.fromkeys(values) if value not in downloaded_values]
+                if missing_values:
+                    print(f"Downloading {len(missing_values)} new items of {len(values)} requested from table {table}")
+                    chunks = await asyncio.gather(*[self._fetch(table, where_clause=where_clause_maker(missing_values[i:i + 100], filter_column), output_fields=output_fields, return_geometry=return_geometry, **kwargs) for i in range(0, len(missing_values), 100)])
+                    self._tables[key] = pd.concat([self._tables[key], *chunks] if key in self._tables else chunks)
+                    downloaded_values.update(missing_values)
+        else:
+            key = full_table_key
+
+        if key not in self._tables:  # nothing matched in the previous table
+            return pd.DataFrame(columns=[filter_column])
+        table_data = self._tables[key]
+        column = next(col for col in table_data.columns if col.upper() == filter_column.upper())
+        return table_data[table_data[column].astype(str).isin(values)].copy()
+
+
 class SmartLinker:
     """
 
@@ -150,6 +514,7 @@ class SmartLinker:
     Methods:
         run_graph: This method creates the graph by searching through the lookup.json file for data with shared column names, given the names of the starting and ending columns.
         geodata: This method outputs the geodata given the start and end columns.
+        batch_geodata: This method outputs the geodata for many queries at once, sharing the graph and the table downloads between the queries.
         allow_geometry: This method restricts the graph search space to tables with geometry. Counter-intuitively, you reset it by running it without any arguments.
 
     Usage:
@@ -177,6 +542,7 @@ class SmartLinker:
                 gss.allow_geometry('geometry_only')  # use this method to restrict the graph search space to tables with geometry
                 gss.allow_geometry('connected_tables')  # set this to ``True`` if you must have geometries in the *connected* table
                 gss.run_graph(starting_column='WD22CD', ending_column='LAD22CD', geographic_areas=['Lewisham', 'Southwark'], geographic_area_columns=['LAD22NM'])  # the starting and ending columns should end in CD
+                # gss.run_graph(starting_columns=['WD22CD'], ending_columns=['LAD22CD'], via_columns=['MSOA21CD'])  # alternatively, guide the path through a table containing MSOA21CD
                 codes = await gss.geodata(selected_path=9, chunk_size=50)  # the selected path is the ninth in the list of potential paths output by `run_graph()` method. Increase chunk_size if your download is slow and try decreasing it if you are being throttled (or encounter weird errors).
                 print(codes['table_data'][0])  # the output is a dictionary of ``{'path': [[table1_of_path_1, table2_of_path1], [table1_of_path2, table2_of_path2]], 'table_data':[data_for_path1, data_for_path2]}``.
 
@@ -200,6 +566,10 @@ class SmartLinker:
         self.initial_lookup = None
         self.lookup = None
         self.force_geometry = False
+        self.membership = None
+        self.column_index = {}
+        self._membership_lookup = None
+        self._graph_cache = None
         self.server = get_server(server, **kwargs)
         # Initialise attributes that don't require async operations
         self.lookup_folder = lookup_folder
@@ -254,7 +624,7 @@ class SmartLinker:
             print('The graph search space has been reset. Using all available tables.')
             self.force_geometry = False
 
-    def run_graph(self, starting_columns: List[str] = None, ending_columns: List[str] = None, geographic_areas: List[str] = None, geographic_area_columns: List[str] = ['LAD22NM', 'UTLA22NM', 'LTLA22NM']) -> None:
+    def run_graph(self, starting_columns: List[str] = None, ending_columns: List[str] = None, geographic_areas: List[str] = None, geographic_area_columns: List[str] = ['LAD22NM', 'UTLA22NM', 'LTLA22NM'], via_columns: List[str] = None) -> None:
         """
             Use this method to create the graph given start and end points, as well as the local authority.
             The starting_column and ending_column parameters should end in "CD". For example LAD21CD or WD23CD.
@@ -264,6 +634,7 @@ class SmartLinker:
                 ending_columns (List[str]): The list of columns that should exist in the last table of the graph. This matching is done against matchable fields, not all fields of a table.
                 geographic_areas (List[str]): A list of geographic areas to filter the data by.
                 geographic_area_columns (List[str]): A list of columns to use when filtering the data using the ``geographic_areas`` list. Defaults to ['LAD22NM', 'UTLA22NM', 'LTLA22NM'].
+                via_columns (List[str]): An optional list of columns that the path must go through, in the given order. For each column, at least one table on the path must contain it in its matchable fields. Defaults to None.
 
             Raises:
                 Exception: If the starting_column or ending_column is not provided.
@@ -277,9 +648,10 @@ class SmartLinker:
         self.ending_columns = [i.upper() for i in ending_columns]  # end point in the path search
         self.geographic_areas = geographic_areas  # list of geographic areas to get the geodata for
         self.geographic_area_columns = [i.upper() for i in geographic_area_columns]  # column names to restrict the starting table to. Must only contain the alphabets before the "##CD" part of the column name, ## referring to a year. Defaults to using local authority columns.
+        self.via_columns = [i.upper() for i in via_columns] if via_columns else []  # columns that the path must be guided through
 
         if self.starting_columns and self.ending_columns:
-            self.graph, self.table_column_pairs = self._create_graph()  # create the graph for connecting columns
+            self.graph, self.table_column_pairs = self._get_graph()  # create the graph for connecting columns
             if self.geographic_areas:
                 self.starting_points = self._get_starting_point()  # find all possible starting points given criteria
             else:
@@ -289,13 +661,16 @@ class SmartLinker:
         else:
             raise Exception("You haven't provided all parameters. Make sure the local_authorities list is not empty.")
 
-    async def _get_ogp_table(self, pathway: str, where_clause: str = "1=1", **kwargs) -> Tuple[pd.DataFrame, str]:
+    async def _get_ogp_table(self, pathway: str, where_clause: str = "1=1", output_fields: str = '*', return_geometry: bool = None, feature_server: FeatureServer = None, **kwargs) -> Tuple[pd.DataFrame, str]:
         """
         Uses ``FeatureServer()`` to download data from Open Geography Portal. Keyword arguments are passed to ``FeatureServer()``.
 
         Args:
             pathway (str): The name of the service to download data for.
             where_clause (str): The where clause to filter the data.
+            output_fields (str): A comma separated string of the fields to download. Defaults to '*' (all fields).
+            return_geometry (bool): Whether to download the geometry. Defaults to None, in which case the geometry is downloaded whenever the table has one.
+            feature_server (FeatureServer): The ``FeatureServer()`` instance to download with. Defaults to None, which uses ``self.fs``. Concurrent downloads must each use their own instance.
             **kwargs: Keyword arguments to pass to ``FeatureServer().setup()``. Main keywords to use are ``max_retries``, ``timeout``, ``chunk_size``, and ``layer_number``. Change these if you're experiencing connectivity issues or know that you want to download a specific layer.
 
         Returns:
@@ -305,62 +680,191 @@ class SmartLinker:
         retry_delay = kwargs.get('retry_delay', 5)
         chunk_size = kwargs.get('chunk_size', 50)
 
-        await self.fs.setup(full_name=pathway, esri_server=self.server._name, max_retries=max_retries, retry_delay=retry_delay, chunk_size=chunk_size)
+        fs = feature_server or self.fs
+        await fs.setup(full_name=pathway, esri_server=self.server._name, max_retries=max_retries, retry_delay=retry_delay, chunk_size=chunk_size)
         print("Table fields:")
-        print(self.fs.feature_service)
-        print(self.fs.feature_service.fields)
-        if 'geometry' in self.fs.feature_service.fields:
-            return await self.fs.download(where_clause=where_clause, return_geometry=True)
-        else:
-            return await self.fs.download(where_clause=where_clause)
+        print(fs.feature_service)
+        print(fs.feature_service.fields)
+        if return_geometry is None:
+            return_geometry = 'geometry' in fs.feature_service.fields
+        return await fs.download(where_clause=where_clause, return_geometry=return_geometry, output_fields=output_fields)
 
-    async def geodata(self, selected_path: int = None, retun_all: bool = False, **kwargs) -> Dict[str, List[Any]]:
+    async def _download_table(self, table: str, filter_column: str = None, values: List[str] = None, output_fields: str = '*', return_geometry: bool = None, **kwargs) -> pd.DataFrame:
+        """
+        Download a table, optionally filtered by the values of a column. The values are sent to the server in chunks of 100.
+
+        Args:
+            table (str): The full name of the table.
+            filter_column (str): The column to filter the table by. Defaults to None, which downloads the whole table.
+            values (List[str]): The values of ``filter_column`` to download.
+            output_fields (str): A comma separated string of the fields to download. Defaults to '*' (all fields).
+            return_geometry (bool): Whether to download the geometry. Defaults to None, in which case the geometry is downloaded whenever the table has one.
+            **kwargs: Keyword arguments to pass to ``_get_ogp_table()``.
+
+        Returns:
+            pd.DataFrame: The downloaded table.
+        """
+        if not filter_column:
+            return await self._get_ogp_table(table, output_fields=output_fields, return_geometry=return_geometry, **kwargs)
+        if not values:  # nothing matched in the previous table
+            return pd.DataFrame(columns=[filter_column])
+
+        chunks = []
+        for i in range(0, len(values), 100):
+            print(f"Downloading tranche {i}-{i + 100} of table {table}")
+            print(f"Total items to download: {len(values)}")
+            where_clause = where_clause_maker(values[i:i + 100], filter_column)
+            chunks.append(await self._get_ogp_table(table, where_clause=where_clause, output_fields=output_fields, return_geometry=return_geometry, **kwargs))
+        return pd.concat(chunks)
+
+    def _download_plan(self, chosen_path: List[Any], output_columns: List[str] = None) -> List[Tuple[str, bool]]:
+        """
+        Decide which fields to download for each table of the path.
+
+        Without ``output_columns`` all fields (and geometry, if available) are downloaded for every table. With ``output_columns``, every table is downloaded with only the columns it needs: the connecting columns to the previous and the next table, the starting and geographic area columns for the first table, the ending columns for the last table, and each of the ``output_columns`` and ``via_columns`` from the first table on the path that contains it (any later copies would be dropped in the merge anyway).
+        Only the last table of the path returns geometry, unless 'geometry' is listed in ``output_columns``, in which case it is taken from the first table with geometry.
+
+        Args:
+            chosen_path (List[Any]): The path as output by ``run_graph()``.
+            output_columns (List[str]): A list of columns that should be included in the merged table. Defaults to None.
+
+        Returns:
+            List[Tuple[str, bool]]: A list of tuples of ``outFields`` string and a boolean for returning geometry, one for each table of the path.
+        """
+        tables = self._path_to_tables([chosen_path])[0]
+        if not output_columns:
+            return [('*', None) for _ in tables]
+
+        connecting_columns = [None] + [pathway[1].upper() for pathway in chosen_path[1:]]
+        remaining_columns = list(dict.fromkeys([col.upper() for col in output_columns] + self.via_columns))
+
+        plan = []
+        for position, table in enumerate(tables):
+            row = self.lookup[self.lookup['full_name'] == table].iloc[0]
+            fields = {field.upper(): field for field in row['fields'] if field.upper() != 'GEOMETRY'}  # geometry is requested separately with returnGeometry
+            has_geometry = bool(row['has_geometry'] == True)
+            is_last_table = position == len(tables) - 1
+
+            wanted_columns = []
+            if position == 0:
+                wanted_columns.extend(self.starting_columns)
+                if self.geographic_areas:
+                    wanted_columns.extend(self.geographic_area_columns)
+            if is_last_table:
+                wanted_columns.extend(self.ending_columns)
+            if connecting_columns[position]:
+                wanted_columns.append(connecting_columns[position])
+            if not is_last_table:
+                wanted_columns.append(connecting_columns[position + 1])
+            wanted_columns.extend(col for col in remaining_columns if col in fields)
+            remaining_columns = [col for col in remaining_columns if col not in fields]
+
+            return_geometry = has_geometry and is_last_table
+            if has_geometry and 'GEOMETRY' in remaining_columns:
+                return_geometry = True
+                remaining_columns.remove('GEOMETRY')
+
+            output_fields = ','.join(dict.fromkeys(fields[col] for col in wanted_columns if col in fields))
+            plan.append((output_fields or '*', return_geometry))
+        return plan
+
+    async def geodata(self, selected_path: int = None, retun_all: bool = False, engine: str = 'pandas', output_columns: List[str] = None, **kwargs) -> Dict[str, List[Any]]:
         """
         Get a dictionary of pandas dataframes that have been either merged and filtered by geographic_areas or all individual tables.
 
         Args:
             selected_path (int): Choose the path from the output of ``run_graph()`` method.
             retun_all (bool): Set this to True if you want to get individual tables that would otherwise get merged.
+            engine (str): The engine used to merge the tables of the path. Either 'pandas' (default), which left joins the tables one by one, or 'duckdb', which registers each downloaded table as a DuckDB relation and runs the whole path as one SQL join. The latter uses multiple cores and avoids copying the growing table at every step, which helps with long paths and national tables.
+            output_columns (List[str]): An optional list of columns you want in the merged table. If given, the tables are downloaded with only the connecting columns, the starting, ending and geographic area columns, and the ``output_columns`` (see ``_download_plan()``), and only the last table returns geometry. This greatly reduces the amount of data transferred on long paths. Defaults to None, which downloads all columns of all tables.
             **kwargs: These keyword arguments get passed to ``EsriConnector.FeatureServer().setup()``. Main keywords to use are ``max_retries``, ``timeout``, ``chunk_size``, and ``layer_number``. Change these if you're experiencing connectivity issues. For instance, add more retries and increase time between tries, and reduce ``chunk_size`` for each call so you're not being overwhelming the server. If you're not getting the layer you expected, you can try changing the ``layer_number`` - most should work with the default 0, but there is a possibility of multiple layers being available for a given dataset.
 
         Returns:
             Dict[str, List[Any]] -   A dictionary of merged tables, where the first key ('paths') refers to a list of lists that of the merged tables and the second key-value pair ('table_data') contains a list of Pandas dataframe objects that are the left joined data tables.
         """
         print(selected_path)
-
-        final_tables_to_return = {'path': [], 'table_data': []}
-
+        assert engine in ['pandas', 'duckdb'], "engine must be one of 'pandas' or 'duckdb'"
         assert 0 <= selected_path < len(self.shortest_paths), f"selected_path not in the range (0, {len(self.shortest_paths)})"
         chosen_path = self.shortest_paths[selected_path]
 
         print(chosen_path)
         print("Chosen shortest path: ", chosen_path)
-        final_tables_to_return['path'].append(chosen_path)
+        download_plan = self._download_plan(chosen_path, output_columns)
+        return await self._download_path(chosen_path, download_plan, self.geographic_areas, self.geographic_area_columns, self._download_table, retun_all=retun_all, engine=engine, **kwargs)
+
+    async def batch_geodata(self, queries: List[Dict[str, Any]], retun_all: bool = False, engine: str = 'pandas', max_concurrent_downloads: int = 4, **kwargs) -> List[Dict[str, List[Any]]]:
+        """
+        Get the data for many path queries at once.
+
+        All queries are planned first using the same graph (the graph is only built once). The tables are then downloaded concurrently and shared between the queries with ``SharedTableDownloader()``, so that a table (or a set of rows of a table) that is needed by more than one query is only downloaded once.
+
+        Args:
+            queries (List[Dict[str, Any]]): A list of queries. Each query is a dictionary of the arguments of ``run_graph()`` (``starting_columns``, ``ending_columns``, ``geographic_areas``, ``geographic_area_columns``, ``via_columns``), and optionally ``selected_path`` (defaults to 0, the first of the shortest paths) and ``output_columns`` (see ``geodata()``).
+            retun_all (bool): Set this to True if you want to get individual tables that would otherwise get merged.
+            engine (str): The engine used to merge the tables of each path. Either 'pandas' (default) or 'duckdb'.
+            max_concurrent_downloads (int): The maximum number of tables downloaded at the same time. Defaults to 4.
+            **kwargs: These keyword arguments get passed to ``EsriConnector.FeatureServer().setup()``.
+
+        Returns:
+            List[Dict[str, List[Any]]]: A list with the output of ``geodata()`` for each query, in the same order as ``queries``.
+
+        Usage:
+
+            .. code-block:: python
+
+                gss = SmartLinker()
+                queries = [{'starting_columns': ['WD22CD'], 'ending_columns': ['LAD22CD'], 'geographic_areas': ['Lewisham'], 'geographic_area_columns': ['LAD22NM']},
+                           {'starting_columns': ['WD22CD'], 'ending_columns': ['LAD22CD'], 'geographic_areas': ['Southwark'], 'geographic_area_columns': ['LAD22NM'], 'selected_path': 1}]
+                outputs = asyncio.run(gss.batch_geodata(queries, chunk_size=100))
+                print(outputs[0]['table_data'][0])
+        """
+        assert engine in ['pandas', 'duckdb'], "engine must be one of 'pandas' or 'duckdb'"
+        graph_arguments = ['starting_columns', 'ending_columns', 'geographic_areas', 'geographic_area_columns', 'via_columns']
+
+        plans = []
+        for query in queries:
+            self.run_graph(**{key: value for key, value in query.items() if key in graph_arguments})
+            selected_path = query.get('selected_path', 0)
+            assert 0 <= selected_path < len(self.shortest_paths), f"selected_path not in the range (0, {len(self.shortest_paths)}) for query {query}"
+            chosen_path = self.shortest_paths[selected_path]
+            plans.append((chosen_path, self._download_plan(chosen_path, query.get('output_columns')), self.geographic_areas, self.geographic_area_columns))
+
+        downloader = SharedTableDownloader(self, max_concurrent_downloads=max_concurrent_downloads)
+        outputs = await asyncio.gather(*[self._download_path(chosen_path, download_plan, geographic_areas, geographic_area_columns, downloader.download, retun_all=retun_all, engine=engine, **kwargs) for chosen_path, download_plan, geographic_areas, geographic_area_columns in plans])
+        print(f"Finished {len(queries)} queries with {downloader.download_count} downloads.")
+        return list(outputs)
+
+    async def _download_path(self, chosen_path: List[Any], download_plan: List[Tuple[str, bool]], geographic_areas: List[str], geographic_area_columns: List[str], download_table: Callable, retun_all: bool = False, engine: str = 'pandas', **kwargs) -> Dict[str, List[Any]]:
+        """
+        Download and merge the tables of a path.
+
+        Args:
+            chosen_path (List[Any]): The path as output by ``run_graph()``.
+            download_plan (List[Tuple[str, bool]]): The output of ``_download_plan()`` for the path.
+            geographic_areas (List[str]): A list of geographic areas to filter the first table by.
+            geographic_area_columns (List[str]): A list of columns to use when filtering the first table.
+            download_table (Callable): A coroutine function with the signature of ``_download_table()`` that is used to download each table.
+            retun_all (bool): Set this to True if you want to get individual tables that would otherwise get merged.
+            engine (str): The engine used to merge the tables of the path. Either 'pandas' or 'duckdb'.
+            **kwargs: Keyword arguments passed to ``download_table``.
+
+        Returns:
+            Dict[str, List[Any]]: See ``geodata()``.
+        """
+        final_tables_to_return = {'path': [chosen_path], 'table_data': []}
 
         print("Currently downloading:", chosen_path[0])
 
         table_downloads = {'table_name': [], 'download_order': [], 'connected_to_previous_table_by_column': [], 'data': []}
 
-        if self.geographic_areas:
+        if geographic_areas:
             # if limiting the data to specific local authorities, we need to modify the where_clause from "1=1" to the correct name of the column (e.g. LAD21NM) so that e.g. a list of ['Lewisham', 'Greenwich'] becomes an SQL call "LAD21NM IN ('Lewisham', 'Greenwich')".
             # This has an upper limit, however, so if the list is too long, we need to handle those cases too.
-            column_names = [i for i in self.lookup[self.lookup['full_name'] == chosen_path[0]]['fields'][0] if i.upper() in self.geographic_area_columns]  # and i.upper().endswith('NM')]
-            for final_table_col in column_names:
-                if final_table_col.upper() in self.geographic_area_columns:  # and final_table_col.upper().endswith('NM'):
-                    string_list = [f'{i}' for i in self.geographic_areas]
-                    start_chunks = []
-                    for i in range(0, len(string_list), 100):
-                        string_chunk = string_list[i:i + 100]
-                        where_clause = where_clause_maker(string_chunk, final_table_col)
-                        start_chunk = await self._get_ogp_table(chosen_path[0], where_clause=where_clause, **kwargs)
-                        start_chunks.append(start_chunk)
-                    start_table = pd.concat(start_chunks)
-                    start_table.drop_duplicates(inplace=True)
-                    break
-
+            column_names = [i for i in self.lookup[self.lookup['full_name'] == chosen_path[0]]['fields'].iloc[0] if i.upper() in geographic_area_columns]
+            start_table = await download_table(chosen_path[0], column_names[0], [f'{i}' for i in geographic_areas], *download_plan[0], **kwargs)
         else:
-            start_table = await self._get_ogp_table(chosen_path[0], **kwargs)
-            start_table.drop_duplicates(inplace=True)
+            start_table = await download_table(chosen_path[0], None, None, *download_plan[0], **kwargs)
+        start_table.drop_duplicates(inplace=True)
         table_downloads['table_name'].append(chosen_path[0])
         table_downloads['download_order'].append(0)
         table_downloads['connected_to_previous_table_by_column'].append('NA')
@@ -370,56 +874,38 @@ class SmartLinker:
             final_tables_to_return['table_data'].append(start_table)
             return final_tables_to_return
 
+        merger = DuckDBPathMerger(start_table) if engine == 'duckdb' else PandasPathMerger(start_table)
+        for enum, pathway in enumerate(chosen_path[1:]):
+            connecting_column = pathway[1]
+            if geographic_areas:
+                filter_column, unique_values = merger.unique_values(connecting_column)
+                next_table = await download_table(pathway[0], filter_column, [f'{i}' for i in unique_values], *download_plan[enum + 1], **kwargs)
+            else:
+                next_table = await download_table(pathway[0], None, None, *download_plan[enum + 1], **kwargs)
+
+            next_table.columns = [col.upper() for col in next_table.columns]
+            table_downloads['table_name'].append(pathway[0])
+            table_downloads['download_order'].append(enum + 1)
+            table_downloads['connected_to_previous_table_by_column'].append(pathway[1])
+            table_downloads['data'].append(next_table)
+            merger.merge(next_table, connecting_column)
+        final_tables_to_return['table_data'].append(merger.result())
+
+        if retun_all:
+            return table_downloads
         else:
-            for enum, pathway in enumerate(chosen_path[1:]):
-                connecting_column = pathway[1]
-                if self.geographic_areas:
-
-                    try:
-                        string_list = [f'{i}' for i in start_table[connecting_column].unique()]
-                        filter_column = connecting_column
-                        start_table.columns = start_table.columns
-                    except KeyError:
-                        try:
-                            string_list = [f'{i}' for i in start_table[connecting_column.upper()].unique()]
-                            filter_column = connecting_column.upper()
-                            start_table.columns = [i.upper() for i in start_table.columns]
-                        except KeyError:
-                            string_list = [f'{i}' for i in start_table[connecting_column.lower()].unique()]
-                            filter_column = connecting_column.lower()
-                            start_table.columns = [i.lower() for i in start_table.columns]
-
-                    next_chunks = []
-                    for enum, i in enumerate(range(0, len(string_list), 100)):
-                        print(f"Downloading tranche {i}-{i + 100} of connected table {pathway[0]}")
-                        print(f"Total items to download: {len(string_list)}")
-                        string_chunk = string_list[i:i + 100]
-                        where_clause = where_clause_maker(string_chunk, filter_column)
-                        next_chunk = await self._get_ogp_table(pathway[0], where_clause=where_clause, **kwargs)
-                        next_chunks.append(next_chunk)
-
-                    next_table = pd.concat(next_chunks)
+            return final_tables_to_return
 
-                else:
-                    next_table = await self._get_ogp_table(pathway[0], **kwargs)
-
-                start_table.columns = [i.upper() for i in start_table.columns]
-                next_table.columns = [col.upper() for col in next_table.columns]
-                table_downloads['table_name'].append(pathway[0])
-                table_downloads['download_order'].append(enum + 1)
-                table_downloads['connected_to_previous_table_by_column'].append(pathway[1])
-                table_downloads['data'].append(next_table)
-                start_table = start_table.merge(next_table, on=connecting_column, how='left', suffixes=('', '_DROP')).filter(regex='^(?!.*_DROP)')  # always perform left join on the common column (based on its name), add "_DROP" to column names that are duplicated and then filter them out.
-            start_table = start_table.drop_duplicates()
-            start_table.dropna(axis='columns', how='all', inplace=True)
-            if "GEOMETRY" in start_table.columns:
-                start_table.rename(columns={'GEOMETRY': 'geometry'}, inplace=True)
-            final_tables_to_return['table_data'].append(start_table)
+    def _get_graph(self) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
+        """
+        Get the graph of connections between tables. The graph only depends on the lookup and the ``allow_geometry()`` setting, so it is built once with ``_create_graph()`` and reused by later calls of ``run_graph()`` and ``batch_geodata()``.
 
-            if retun_all:
-                return table_downloads
-            else:
-                return final_tables_to_return
+        Returns:
+            Tuple[Dict[str, List[Tuple[str, str]]], List[str]]: A tuple containing a dictionary representing the graph and a list of table-column pairs.
+        """
+        if self._graph_cache is None or self._graph_cache[0] is not self.lookup or self._graph_cache[1] != self.force_geometry:
+            self._graph_cache = (self.lookup, self.force_geometry, *self._create_graph())
+        return self._graph_cache[2], self._graph_cache[3]
 
     def _create_graph(self) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
         """
@@ -451,19 +937,74 @@ class SmartLinker:
                                 graph[table].append((comparison_table, shared_column))
         return graph, table_column_pairs
 
-    def _check_intersection_of_two_lists(self, columns: List[str], fields_to_match: List[str]) -> bool:
+    def _build_membership_matrix(self) -> None:
         """
-        Check if a list of columns exists in a row of data in the lookup table.
+        Precompute a table by column membership matrix of the (upper case) matchable fields in the lookup.
+
+        Each row of the matrix is a table in the lookup and each bit of the row tells whether the table contains a given column. The bits are packed with ``numpy.packbits()`` so that the matrix stays small even for thousands of columns.
 
         Returns:
-            bool: Returns true if all the columns listed in starting_columns are present in the layer.
+            None
+        """
+        matchable_fields = [[col.upper() for col in cols] if isinstance(cols, list) else [] for cols in self.lookup['matchable_fields']]
+        self.column_index = {col: position for position, col in enumerate(sorted({col for cols in matchable_fields for col in cols}))}
+
+        rows = np.repeat(np.arange(len(matchable_fields)), [len(cols) for cols in matchable_fields])
+        columns = np.fromiter((self.column_index[col] for cols in matchable_fields for col in cols), dtype=np.intp, count=len(rows))
+        membership = np.zeros((len(matchable_fields), len(self.column_index)), dtype=bool)
+        membership[rows, columns] = True
 
+        self.membership = np.packbits(membership, axis=1)
+        self._membership_lookup = self.lookup
+
+    def _tables_with_columns(self, columns: List[str]) -> np.ndarray:
         """
-        intersect = set(columns).intersection(fields_to_match)
-        if sorted(list(intersect)) == sorted(columns):
-            return True
-        else:
-            return False
+        Find the tables in the lookup that contain all the given columns in their matchable fields.
+
+        Args:
+            columns (List[str]): A list of column names.
+
+        Returns:
+            np.ndarray: A boolean mask over the rows of the lookup.
+        """
+        if self._membership_lookup is not self.lookup:  # the lookup changes when allow_geometry() is called
+            self._build_membership_matrix()
+
+        mask = np.ones(self.membership.shape[0], dtype=bool)
+        for column in columns:
+            position = self.column_index.get(column.upper())
+            if position is None:
+                return np.zeros(self.membership.shape[0], dtype=bool)
+            mask &= ((self.membership[:, position >> 3] >> (7 - (position & 7))) & 1).astype(bool)
+        return mask
+
+    def _tables_with_any_column(self, columns: List[str]) -> np.ndarray:
+        """
+        Find the tables in the lookup that contain at least one of the given columns in their matchable fields.
+
+        Args:
+            columns (List[str]): A list of column names.
+
+        Returns:
+            np.ndarray: A boolean mask over the rows of the lookup.
+        """
+        mask = np.zeros(len(self.lookup), dtype=bool)
+        for column in columns:
+            mask |= self._tables_with_columns([column])
+        return mask
+
+    def _starting_points_from_mask(self, mask: np.ndarray) -> Dict[str, List[str]]:
+        """
+        Turn a boolean mask over the rows of the lookup to a dictionary of starting points.
+
+        Args:
+            mask (np.ndarray): A boolean mask over the rows of the lookup.
+
+        Returns:
+            Dict[str, List[str]]: A dictionary containing the starting tables and their columns.
+        """
+        selected = self.lookup.iloc[np.flatnonzero(mask)]
+        return {table: {'columns': fields, 'useful_columns': matchable_fields} for table, fields, matchable_fields in zip(selected['full_name'], selected['fields'], selected['matchable_fields'])}
 
     def _get_starting_point_without_local_authority_constraint(self) -> Dict[str, List[str]]:
         """
@@ -473,12 +1014,7 @@ class SmartLinker:
             Dict[str, List[str]]: A dictionary containing the starting tables and their columns.
         """
 
-        starting_points = {}
-
-        for _, row in self.lookup.iterrows():
-            matchable_fields = [col.upper() for col in row['matchable_fields']]
-            if self._check_intersection_of_two_lists(self.starting_columns, matchable_fields):
-                starting_points[row['full_name']] = {'columns': row['fields'], 'useful_columns': row['matchable_fields']}
+        starting_points = self._starting_points_from_mask(self._tables_with_columns(self.starting_columns))
         if starting_points:
             return starting_points
         else:
@@ -492,47 +1028,57 @@ class SmartLinker:
             Dict[str, List[str]]: A dictionary containing the starting tables and their columns.
         """
 
-        starting_points = {}
+        mask = self._tables_with_columns(self.starting_columns)
+        intersect = list(set(self.geographic_area_columns).intersection(self.starting_columns))  # check if any columns defined in self.geographic_area_columns already exist in self.starting columns
+        if not intersect:  # if the intersection is empty, the table must also contain at least one of the geographic_area_columns
+            mask &= self._tables_with_any_column(self.geographic_area_columns)
 
-        for _, row in self.lookup.iterrows():
-            intersect = list(set(self.geographic_area_columns).intersection(self.starting_columns))  # check if any columns defined in self.geographic_area_columns already exist in self.starting columns
-            matchable_fields = [col.upper() for col in row['matchable_fields']]
-            if intersect:  # if the intersection is true, only pass starting columns
-                if self._check_intersection_of_two_lists(self.starting_columns, matchable_fields):
-                    starting_points[row['full_name']] = {'columns': row['fields'], 'useful_columns': row['matchable_fields']}
-            else:
-                for geo_col in self.geographic_area_columns:
-                    test_columns = self.starting_columns + [geo_col]  # loop through geographic_area_columns and add them one by one to the list of starting_columns and then check if all those columns exist in the row
-                    if self._check_intersection_of_two_lists(test_columns, matchable_fields):
-                        starting_points[row['full_name']] = {'columns': row['fields'], 'useful_columns': row['matchable_fields']}
-                        break
+        starting_points = self._starting_points_from_mask(mask)
         if starting_points:
             return starting_points
         else:
             raise MissingDataError(f"Sorry, no tables containing all columns in {self.starting_columns} - try reducing the list of starting columns or remove geographic_areas argument")
 
+    def _get_via_tables(self) -> List[Set[str]]:
+        """
+        Find the tables containing each of the ``via_columns``.
+
+        Raises:
+            MissingDataError: If no table in the graph contains one of the ``via_columns``.
+
+        Returns:
+            List[Set[str]]: A list of sets of table names, one set per column in ``via_columns``.
+        """
+        via_tables = []
+        for via_column in self.via_columns:
+            tables = {table for table in self.lookup['full_name'].values[self._tables_with_columns([via_column])] if table in self.graph}
+            if not tables:
+                raise MissingDataError(f"Sorry, no connected tables containing {via_column} - try a different via column")
+            via_tables.append(tables)
+        return via_tables
+
     def _find_paths(self) -> Dict[str, List]:
         """
-        Find all paths given all start and end options using ``BFS_SP()`` function.
+        Find all paths given all start and end options using ``BFS_SP()`` function. If ``via_columns`` were given, ``BFS_SP_via()`` is used instead so that the paths are guided through the tables containing those columns.
 
         Returns:
             Dict[str, List]: A dictionary containing the possible paths. Paths are sorted alphabetically.
         """
 
-        end_options = []
-        for table, columns, _ in self.table_column_pairs:
-            if self._check_intersection_of_two_lists(self.ending_columns, columns):
-                if self.force_geometry:
-                    if self.lookup[self.lookup['full_name'] == table]['has_geometry'].values[0] == True:
-                        end_options.append(table)
-                else:
-                    end_options.append(table)
+        end_mask = self._tables_with_columns(self.ending_columns)
+        if self.force_geometry:
+            end_mask &= (self.lookup['has_geometry'] == True).to_numpy()
+        end_options = list(self.lookup['full_name'].values[end_mask])
+        via_tables = self._get_via_tables() if self.via_columns else None
         path_options = {}
         for start_table in self.starting_points.keys():
             path_options[start_table] = {}
             for end_table in end_options:
                 # print(start_table, end_table)
-                shortest_path = BFS_SP(self.graph, start_table, end_table)
+                if via_tables:
+                    shortest_path = BFS_SP_via(self.graph, start_table, end_table, via_tables)
+                else:
+                    shortest_path = BFS_SP(self.graph, start_table, end_table)
                 # print('\n Shortest path: ', shortest_path, '\n')
                 if shortest_path != 'no_connecting_path':
                     path_options[start_table][end_table] = shortest_path
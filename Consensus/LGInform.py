@@ -1,40 +1,243 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import hmac
 import hashlib
 import base64
 import requests
-from typing import Dict, Any, List
-import multiprocessing as mp
-import more_itertools
+import asyncio
+import platform
+import aiohttp
+import json
+import threading
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Dict, Any, List, Tuple, Optional, Union
 from Consensus.config_utils import load_config
 
+if platform.system() == 'Windows':
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
 JSONDict = Dict[str, Any]
 
 
+class RateLimiter:
+    """
+    Asynchronous context manager that limits both the number of concurrent requests and the rate at which requests are started.
+
+    Attributes:
+        interval (float): Minimum time in seconds between the starts of two requests.
+        semaphore (asyncio.Semaphore): Semaphore limiting the number of concurrent requests.
+
+    Usage:
+
+        .. code-block:: python
+
+            limiter = RateLimiter(requests_per_second=10, max_concurrent_requests=8)
+            async with limiter:
+                ...  # make the request
+    """
+
+    def __init__(self, requests_per_second: float = 10, max_concurrent_requests: int = 8) -> None:
+        """
+        Initialise the rate limiter. Must be created inside the event loop that uses it.
+
+        Args:
+            requests_per_second (float): Maximum number of requests started per second. None or 0 disables the rate limit. Defaults to 10.
+            max_concurrent_requests (int): Maximum number of concurrent requests. Defaults to 8.
+        """
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self) -> None:
+        await self.semaphore.acquire()
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.semaphore.release()
+
+
+class LGInformMetadataCache:
+    """
+    Locally cached metadata of LG Inform Plus datasets and metricTypes.
+
+    The metricTypes of each dataset (``/metricTypes?dataset=``) and the metadata of each metricType (``/metricTypes/{identifier}``), such as its labels, help text and whether it is discontinued, rarely change. They are saved in ``metadata.json`` in the cache folder together with the time they were downloaded, and are used until they are older than ``ttl``.
+
+    Attributes:
+        cache_path (Path): Path of the cached metadata.
+        ttl (timedelta): How long the cached metadata is used before it is downloaded again.
+
+    Methods:
+        get_dataset(identifier: int): Returns the cached metricTypes of a dataset.
+        set_dataset(identifier: int, variables: JSONDict): Caches the metricTypes of a dataset.
+        get_metric(identifier: int): Returns the cached metadata of a metricType.
+        set_metric(identifier: int, metadata: JSONDict): Caches the metadata of a metricType.
+        save(): Saves the cached metadata.
+    """
+
+    def __init__(self, cache_folder: str = None, ttl: timedelta = timedelta(days=7)) -> None:
+        """
+        Initialise LGInformMetadataCache.
+
+        Args:
+            cache_folder (str): Folder for the cached metadata. Defaults to None, in which case the ``lg_inform_cache`` folder of the package is used.
+            ttl (timedelta): How long the cached metadata is used before it is downloaded again. Defaults to seven days.
+        """
+        cache_folder = Path(cache_folder) if cache_folder else Path(__file__).resolve().parent / 'lg_inform_cache'
+        self.cache_path = cache_folder / 'metadata.json'
+        self.ttl = ttl
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def get_dataset(self, identifier: int) -> Optional[JSONDict]:
+        """
+        Returns the cached metricTypes of a dataset.
+
+        Args:
+            identifier (int): The dataset identifier.
+
+        Returns:
+            Optional[JSONDict]: The metricTypes JSON of the dataset, or None if it is not cached or is older than ``ttl``.
+        """
+        return self._get('datasets', identifier)
+
+    def set_dataset(self, identifier: int, variables: JSONDict) -> None:
+        """
+        Caches the metricTypes of a dataset. Call ``save()`` to save them to file.
+
+        Args:
+            identifier (int): The dataset identifier.
+            variables (JSONDict): The metricTypes JSON of the dataset.
+
+        Returns:
+            None
+        """
+        self._set('datasets', identifier, variables)
+
+    def get_metric(self, identifier: int) -> Optional[JSONDict]:
+        """
+        Returns the cached metadata of a metricType.
+
+        Args:
+            identifier (int): The metricType identifier.
+
+        Returns:
+            Optional[JSONDict]: The metadata JSON of the metricType, or None if it is not cached or is older than ``ttl``.
+        """
+        return self._get('metricTypes', identifier)
+
+    def set_metric(self, identifier: int, metadata: JSONDict) -> None:
+        """
+        Caches the metadata of a metricType. Call ``save()`` to save it to file.
+
+        Args:
+            identifier (int): The metricType identifier.
+            metadata (JSONDict): The metadata JSON of the metricType.
+
+        Returns:
+            None
+        """
+        self._set('metricTypes', identifier, metadata)
+
+    def save(self) -> None:
+        """
+        Saves the cached metadata.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            cache = self._load()
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.cache_path.with_suffix(f'.{threading.get_ident()}.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump(cache, f)
+            temp_path.replace(self.cache_path)
+
+    def _get(self, kind: str, identifier: int) -> Optional[JSONDict]:
+        """
+        Returns a cached entry if it is younger than ``ttl``.
+
+        Args:
+            kind (str): 'datasets' or 'metricTypes'.
+            identifier (int): The identifier of the dataset or metricType.
+
+        Returns:
+            Optional[JSONDict]: The cached JSON, or None.
+        """
+        entry = self._load()[kind].get(str(identifier))
+        if entry is None or datetime.now() - datetime.fromisoformat(entry['fetched_at']) >= self.ttl:
+            return None
+        return entry['json']
+
+    def _set(self, kind: str, identifier: int, value: JSONDict) -> None:
+        """
+        Caches an entry with the current time.
+
+        Args:
+            kind (str): 'datasets' or 'metricTypes'.
+            identifier (int): The identifier of the dataset or metricType.
+            value (JSONDict): The JSON to cache.
+
+        Returns:
+            None
+        """
+        self._load()[kind][str(identifier)] = {'fetched_at': datetime.now().isoformat(), 'json': value}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Loads the cached metadata.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Cached metricTypes by dataset and metadata by metricType.
+        """
+        if self._cache is None:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._cache = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._cache = {'datasets': {}, 'metricTypes': {}}
+        return self._cache
+
+
 class LGInform:
 
     """
     The class takes a dictionary of LG Inform datasets (such as {'IMD_2010': 841, 'IMD_2009': 842, 'Death_of_enterprises': 102}), finds all metrics, downloads the data, and merges them into one. The dictionary keys can be any string of your choosing, but the integer values must be one of https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
-    The main method to download data for multiple datasets is the ``mp_download()`` method, which uses multiprocessing to download data from multiple datasets simultaneously. However, this requires that the class is called within ``if __name__ == '__main__'``.
-    If multiprocessing is not necessary, it's better to use ``download()`` method, which is what the multiprocessing wrapper method also calls.
+    The main method to download data for multiple datasets is the ``mp_download()`` method, which downloads several datasets simultaneously with a pool of asynchronous workers that take the next dataset from a shared queue as soon as they finish the previous one. All requests share one rate limit, so the API is not overloaded however many workers are used.
+    The ``download()`` method downloads the datasets one at a time. Both methods return a report of the downloaded datasets.
+    The periods stored for each metricType are recorded in 'manifest.json' in the folder of each dataset. With ``incremental=True``, only the periods newer than the stored periods are downloaded and added to the stored table, which makes regular refreshes much cheaper than downloading the latest n periods again.
 
     Attributes:
         api_key (str): Application Key to LG Inform Plus.
         api_secret (str): Application Secret to LG Inform Plus.
         proxies (Dict[str, str]): Proxy address if known.
         area (str): A comma separated string of areas, excluding whitespace. You can either use GSS codes or use LG Inform's off-the-shelf groups for areas. For instance, Lewisham GSS code is E09000023 and it's CIPFA nearest neighbours is called Lewisham_CIPFA_Near_Neighbours. Together these would be input as 'E09000023,Lewisham_CIPFA_Near_Neighbours'.
+        metadata_cache (LGInformMetadataCache): Local cache of the metricTypes of each dataset and the metadata of each metricType.
+        max_url_length (int): Class attribute. Maximum length of a signed data request URL.
+        max_metrics_per_request (int): Class attribute. Maximum number of metricTypes requested in one data request.
+        retry_statuses (Tuple[int, ...]): Class attribute. HTTP statuses of responses that are retried.
 
     Methods:
         json_to_pandas(json_data: JSONDict): Transform downloaded json data to Pandas dataframe.
         sign_url(url: str): Sign all url calls with your unique secret and key.
         download_variable_data(identifier: int, latest_n: int): Download data for a given metricType, area, and period.
         download_data_for_many_variables(variables: JSONDict, latest_n: int = 20, arraytype: str = 'metricType-array'): Download the variables for an array of metricTypes.
+        download_dataset_async(variables: JSONDict, latest_n: int = 20, arraytype: str = 'metricType-array', include_metadata: bool = True, drop_discontinued: bool = False): Download the data and metadata of all metricTypes of a dataset concurrently.
+        download_dataset_incremental_async(variables: JSONDict, stored_periods: Dict[int, List[str]], latest_n: int = 20, arraytype: str = 'metricType-array', drop_discontinued: bool = False): Download only the periods of each metricType that are newer than the periods already stored.
+        get_metadata_async(identifiers: List[int]): Get the metadata of metricTypes from the cache or LG Inform Plus.
         get_dataset_table_variables(dataset: int): Given a dataset, output all the metricType numbers (dataset columns).
-        format_tables(outputs: List[JSONDict], drop_discontinued: bool = True): Format the data for each variable and create a metadata table.
-        merge_tables(dataset_name: str): Merge the variables to form a table for a given dataset.
-        download(datasets: Dict[str, int], output_folder: Path, latest_n: int = 5, drop_discontinued: bool = True): Download data for one or more datasets.
-        mp_download(datasets: Dict[str, int], output_folder: Path, latest_n: int = 20, drop_discontinued: bool = True, max_workers: int = 8): Multiprocessing wrapper to download data for multiple datasets simultaneously.
+        format_tables(outputs: List[JSONDict], drop_discontinued: bool = True, metadata: Dict[int, JSONDict] = None, output_folder: Path = None, raw_data_folder: Path = None, dataset_name: str = None, save_raw_data: bool = False, append_metadata: bool = False): Format the data for each variable and create a metadata table.
+        merge_tables(dataset_name: str, output_folder: Path = None, raw_data_folder: Path = None, tables: Dict[int, pd.DataFrame] = None, file_format: str = 'csv', append: bool = False): Merge the variables to form a table for a given dataset.
+        download(datasets: Dict[str, int], output_folder: Path, latest_n: int = 5, drop_discontinued: bool = True, file_format: str = 'csv', save_raw_data: bool = False, incremental: bool = False): Download data for one or more datasets, one dataset at a time.
+        mp_download(datasets: Dict[str, int], output_folder: Path, latest_n: int = 20, drop_discontinued: bool = True, max_workers: int = 8, file_format: str = 'csv', save_raw_data: bool = False, incremental: bool = False): Download data for multiple datasets simultaneously.
 
     Usage:
 
@@ -57,14 +260,19 @@ class LGInform:
             out_folder = Path('./data/mp_test/')  # folder to store final data
             datasets = {'IMD_2010': 841, 'IMD_2009': 842, 'Death_of_enterprises': 102}  # a dictionary of datasets. The key can be any string, but the integer value must be an identifier from https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
 
-            if __name__ '__main__':  # when using the multiprocessing wrapper method, you have to run it under if __name__ '__main__' statement.
-                api_call = LGInform(area='E09000023,Lewisham_CIPFA_Near_Neighbours')
-                #api_call.download(datasets=datasets, output_folder=out_folder, latest_n=20, drop_discontinued=False)  # normal, single threaded download
-                api_call.mp_download(datasets, output_folder=out_folder, latest_n=20, drop_discontinued=False, max_workers=8)
+            api_call = LGInform(area='E09000023,Lewisham_CIPFA_Near_Neighbours')
+            #api_call.download(datasets=datasets, output_folder=out_folder, latest_n=20, drop_discontinued=False)  # one dataset at a time
+            report = api_call.mp_download(datasets, output_folder=out_folder, latest_n=20, drop_discontinued=False, max_workers=8)
+            print(report)
 
     """
 
-    def __init__(self, api_key: str = None, api_secret: str = None, proxies: Dict[str, str] = {}, area: str = 'E09000023,Lewisham_CIPFA_Near_Neighbours') -> None:
+    max_url_length = 2000
+    max_metrics_per_request = 20
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key: str = None, api_secret: str = None, proxies: Dict[str, str] = {}, area: str = 'E09000023,Lewisham_CIPFA_Near_Neighbours',
+                 max_concurrent_requests: int = 8, requests_per_second: float = 10, cache_folder: str = None, metadata_ttl: timedelta = timedelta(days=7)) -> None:
         """
         Initialise the class with API key, secret, and proxy address.
 
@@ -73,12 +281,14 @@ class LGInform:
             api_secret (str): Application Secret to LG Inform Plus.
             proxies (Dict[str, str]): Proxy address if known.
             area (str): A comma separated string of areas, excluding whitespace. You can either use GSS codes or use LG Inform's off-the-shelf groups for areas. For instance, Lewisham GSS code is E09000023 and it's CIPFA nearest neighbours is called Lewisham_CIPFA_Near_Neighbours. Together these would be input as 'E09000023,Lewisham_CIPFA_Near_Neighbours'.
+            max_concurrent_requests (int): Maximum number of concurrent requests to LG Inform Plus. Defaults to 8.
+            requests_per_second (float): Maximum number of requests started per second. Defaults to 10.
+            cache_folder (str): Folder for the locally cached metadata. Defaults to None, in which case the ``lg_inform_cache`` folder of the package is used.
+            metadata_ttl (timedelta): How long the cached metadata is used before it is downloaded again. Defaults to seven days.
 
         Returns:
             None
         """
-        mp.set_start_method('spawn')
-
         self.config = load_config()
         self.api_key = api_key or self.config.get('lg_inform_key', None).strip()
         self.api_secret = api_secret or self.config.get('lg_inform_secret', None).strip()
@@ -88,23 +298,29 @@ class LGInform:
         assert self.api_secret, 'Please provide Application Secret to LG Inform Plus - if using ContextManager, name variable as "lg_inform_secret"'
 
         self.area = area
+        self.max_concurrent_requests = max_concurrent_requests
+        self.requests_per_second = requests_per_second
+        self.metadata_cache = LGInformMetadataCache(cache_folder, ttl=metadata_ttl)
 
         self.base_url = "https://webservices.esd.org.uk"
 
-    def json_to_pandas(self, json_data: JSONDict) -> pd.DataFrame:
+    def json_to_pandas(self, json_data: JSONDict, value_name: str = 'Value') -> pd.DataFrame:
         """
-        Transform downloaded json data to Pandas.
+        Transform downloaded json data to Pandas in long format, with one row for each area and period. The values are read as numbers and the areas and periods are stored as categorical columns.
 
         Args:
             json_data (JSONDict): JSON data to transform.
+            value_name (str): Name of the value column. Default is 'Value'.
 
         Returns:
-            pd.DataFrame: Downloaded data as Pandas dataframe.
+            pd.DataFrame: Downloaded data as Pandas dataframe with columns 'Area', 'Time period' and ``value_name``.
         """
-
-        column_names = [col['period']['label'] for col in json_data['columns']]
-        data = {i['area']['label']: [val['formatted'] for val in i['values']] for i in json_data['rows']}
-        return pd.DataFrame.from_dict(data, orient='index', columns=column_names)
+        area_codes, area_labels = pd.factorize(pd.Series([row['area']['label'] for row in json_data['rows']], dtype=object))
+        period_codes, period_labels = pd.factorize(pd.Series([col['period']['label'] for col in json_data['columns']], dtype=object))
+        values = pd.Series([val.get('value') for row in json_data['rows'] for val in row['values']], dtype=object)
+        return pd.DataFrame({'Area': pd.Categorical.from_codes(np.repeat(area_codes, len(period_codes)), categories=area_labels),
+                             'Time period': pd.Categorical.from_codes(np.tile(period_codes, len(area_codes)), categories=period_labels),
+                             value_name: pd.to_numeric(values, errors='coerce').astype('float64')})
 
     def sign_url(self, url: str) -> str:
         """
@@ -136,14 +352,14 @@ class LGInform:
             JSONDict: Downloaded data as JSON.
         """
 
-        url = f"{self.base_url}/data?value.valueType=raw&metricType={str(identifier)}&area={str(self.area)}&period=latest{str(latest_n)}&rowGrouping=area&"
+        url = self._variable_data_url(identifier, latest_n)
         data_url = self.sign_url(url)
         output = requests.get(data_url).json()
         return output
 
     def download_data_for_many_variables(self, variables: JSONDict, latest_n: int = 20, arraytype: str = 'metricType-array') -> List[JSONDict]:
         """
-        Download the variables for an array of metricTypes using download_variable_data method.
+        Download the variables for an array of metricTypes. The metricTypes are downloaded concurrently, limited by ``max_concurrent_requests`` and ``requests_per_second``.
 
         Args:
             variables (JSONDict): variables JSON from get_dataset_table_variables method.
@@ -153,17 +369,254 @@ class LGInform:
         Returns:
             List[JSONDict]: A list of JSON variables.
         """
+        outputs, _ = asyncio.run(self.download_dataset_async(variables, latest_n=latest_n, arraytype=arraytype, include_metadata=False))
+        return outputs
+
+    async def download_dataset_async(self, variables: JSONDict, latest_n: int = 20, arraytype: str = 'metricType-array', include_metadata: bool = True, drop_discontinued: bool = False,
+                                     session: aiohttp.ClientSession = None, limiter: RateLimiter = None) -> Tuple[List[JSONDict], Dict[int, JSONDict]]:
+        """
+        Download the data and metadata of all metricTypes of a dataset concurrently. The data of up to ``max_metrics_per_request`` metricTypes is requested at once and split back per metricType. Each URL is signed with ``sign_url()``, and the requests share one rate limit of ``max_concurrent_requests`` concurrent requests and ``requests_per_second`` requests per second. The metadata is read from ``metadata_cache`` where possible and is fetched before the data, so that the data of discontinued metricTypes is not downloaded if ``drop_discontinued`` is True.
+
+        Args:
+            variables (JSONDict): variables JSON from get_dataset_table_variables method.
+            latest_n (int): Latest n periods. Period could be year, quarter, month, week, or some other period such as the latest n publications.
+            arraytype (str): Type of variables to download. Default is metricType-array.
+            include_metadata (bool): Whether to get the metadata of each metricType. Default is True.
+            drop_discontinued (bool): Whether to skip the discontinued metricTypes. Requires ``include_metadata``. Default is False.
+            session (aiohttp.ClientSession): Session shared with other downloads. Defaults to None, in which case a new session is opened.
+            limiter (RateLimiter): Rate limit shared with other downloads. Defaults to None, in which case a new rate limit is created.
+
+        Returns:
+            Tuple[List[JSONDict], Dict[int, JSONDict]]: The data JSON of each downloaded metricType, in the order of ``variables``, and the metadata JSON of each metricType by identifier.
+        """
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.download_dataset_async(variables, latest_n, arraytype, include_metadata, drop_discontinued, session, limiter)
+
+        identifiers = [variable['identifier'] for variable in variables[arraytype]]
+        limiter = limiter or RateLimiter(self.requests_per_second, self.max_concurrent_requests)
+
+        metadata = await self.get_metadata_async(identifiers, session, limiter) if include_metadata else {}
+        if drop_discontinued and include_metadata:
+            identifiers = [identifier for identifier in identifiers if not metadata[identifier]['metricType']['discontinued']]
+
+        outputs = await self._download_batches(identifiers, latest_n, session, limiter)
+        return outputs, metadata
+
+    async def download_dataset_incremental_async(self, variables: JSONDict, stored_periods: Dict[int, List[str]], latest_n: int = 20, arraytype: str = 'metricType-array', drop_discontinued: bool = False,
+                                                 session: aiohttp.ClientSession = None, limiter: RateLimiter = None) -> Tuple[List[JSONDict], Dict[int, JSONDict]]:
+        """
+        Download only the periods of each metricType that are newer than the periods already stored. The latest period of each stored metricType is requested first. If it is not stored yet, the number of requested periods is doubled until the response overlaps the stored periods or reaches ``latest_n``. metricTypes without stored periods are downloaded for the latest ``latest_n`` periods.
+
+        Args:
+            variables (JSONDict): variables JSON from get_dataset_table_variables method.
+            stored_periods (Dict[int, List[str]]): Period labels already stored for each metricType.
+            latest_n (int): Maximum number of latest periods to download for each metricType.
+            arraytype (str): Type of variables to download. Default is metricType-array.
+            drop_discontinued (bool): Whether to skip the discontinued metricTypes. Default is False.
+            session (aiohttp.ClientSession): Session shared with other downloads. Defaults to None, in which case a new session is opened.
+            limiter (RateLimiter): Rate limit shared with other downloads. Defaults to None, in which case a new rate limit is created.
+
+        Returns:
+            Tuple[List[JSONDict], Dict[int, JSONDict]]: The data JSON of the new periods of each downloaded metricType, in the order of ``variables``, and the metadata JSON of each metricType by identifier.
+        """
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.download_dataset_incremental_async(variables, stored_periods, latest_n, arraytype, drop_discontinued, session, limiter)
+
+        identifiers = [variable['identifier'] for variable in variables[arraytype]]
+        limiter = limiter or RateLimiter(self.requests_per_second, self.max_concurrent_requests)
+
+        metadata = await self.get_metadata_async(identifiers, session, limiter)
+        if drop_discontinued:
+            identifiers = [identifier for identifier in identifiers if not metadata[identifier]['metricType']['discontinued']]
+
+        stored = {identifier: set(stored_periods.get(identifier, [])) for identifier in identifiers}
+        new_metrics = [identifier for identifier in identifiers if not stored[identifier]]
+        outputs = dict(zip(new_metrics, await self._download_batches(new_metrics, latest_n, session, limiter)))
+
+        pending = [identifier for identifier in identifiers if stored[identifier]]
+        periods_requested = 1
+        while pending:
+            responses = await self._download_batches(pending, periods_requested, session, limiter)
+            still_pending = []
+            for identifier, response in zip(pending, responses):
+                periods = [column['period']['label'] for column in response['columns']]
+                if periods_requested < latest_n and len(periods) == periods_requested and not stored[identifier].intersection(periods):
+                    still_pending.append(identifier)
+                else:
+                    outputs[identifier] = self._filter_periods(response, stored[identifier])
+            pending = still_pending
+            periods_requested = min(periods_requested * 2, latest_n)
+        return [outputs[identifier] for identifier in identifiers], metadata
+
+    async def _download_batches(self, identifiers: List[int], latest_n: int, session: aiohttp.ClientSession, limiter: RateLimiter) -> List[JSONDict]:
+        """
+        Download the data of metricTypes in batches and split the responses per metricType.
+
+        Args:
+            identifiers (List[int]): metricType integers.
+            latest_n (int): Latest n periods.
+            session (aiohttp.ClientSession): The aiohttp session.
+            limiter (RateLimiter): The shared rate limit.
+
+        Returns:
+            List[JSONDict]: Data JSON of each metricType, in the order of ``identifiers``.
+        """
+        batches = self._batch_identifiers(identifiers, latest_n)
+        responses = await asyncio.gather(*[self._get_json(session, limiter, self._variable_data_url(batch, latest_n)) for batch in batches])
+        return [output for batch, response in zip(batches, responses) for output in self._split_by_metric(response, batch)]
+
+    def _batch_identifiers(self, identifiers: List[int], latest_n: int) -> List[List[int]]:
+        """
+        Group metricTypes into batches that are requested together. Each batch has at most ``max_metrics_per_request`` metricTypes and its signed URL is at most ``max_url_length`` characters long.
+
+        Args:
+            identifiers (List[int]): metricType integers.
+            latest_n (int): Latest n periods.
+
+        Returns:
+            List[List[int]]: The batches of metricTypes, in the order of ``identifiers``.
+        """
+        batches = []
+        for identifier in identifiers:
+            if batches and len(batches[-1]) < self.max_metrics_per_request and len(self.sign_url(self._variable_data_url(batches[-1] + [identifier], latest_n))) <= self.max_url_length:
+                batches[-1].append(identifier)
+            else:
+                batches.append([identifier])
+        return batches
+
+    @staticmethod
+    def _split_by_metric(json_data: JSONDict, identifiers: List[int]) -> List[JSONDict]:
+        """
+        Split the data JSON of a batched request into one data JSON per metricType, using the metricType of each column.
+
+        Args:
+            json_data (JSONDict): Data JSON of several metricTypes.
+            identifiers (List[int]): The requested metricTypes.
+
+        Returns:
+            List[JSONDict]: Data JSON of each metricType, in the order of ``identifiers``. metricTypes without data have no columns.
+        """
+        positions = {identifier: [] for identifier in identifiers}
+        for position, column in enumerate(json_data['columns']):
+            positions.setdefault(column['metricType']['identifier'], []).append(position)
 
         outputs = []
-        for variable in variables[arraytype]:
-            identifier = variable['identifier']
-            output = self.download_variable_data(identifier, latest_n)
-            outputs.append(output)
+        for identifier in identifiers:
+            columns = [json_data['columns'][position] for position in positions[identifier]]
+            rows = [{**row, 'values': [row['values'][position] for position in positions[identifier]]} for row in json_data['rows']] if columns else []
+            outputs.append({**json_data, 'columns': columns, 'rows': rows})
         return outputs
 
+    @staticmethod
+    def _filter_periods(json_data: JSONDict, exclude: set) -> JSONDict:
+        """
+        Remove the columns of the given periods from the data JSON of a metricType.
+
+        Args:
+            json_data (JSONDict): Data JSON of one metricType.
+            exclude (set): Period labels to remove.
+
+        Returns:
+            JSONDict: Data JSON without the excluded periods. Has no columns if all periods were excluded.
+        """
+        positions = [position for position, column in enumerate(json_data['columns']) if column['period']['label'] not in exclude]
+        columns = [json_data['columns'][position] for position in positions]
+        rows = [{**row, 'values': [row['values'][position] for position in positions]} for row in json_data['rows']] if columns else []
+        return {**json_data, 'columns': columns, 'rows': rows}
+
+    async def get_metadata_async(self, identifiers: List[int], session: aiohttp.ClientSession, limiter: RateLimiter) -> Dict[int, JSONDict]:
+        """
+        Get the metadata of metricTypes from ``metadata_cache``. Metadata that is not cached or is older than the cache's time-to-live is downloaded concurrently and cached.
+
+        Args:
+            identifiers (List[int]): The metricType identifiers.
+            session (aiohttp.ClientSession): The aiohttp session.
+            limiter (RateLimiter): The shared rate limit.
+
+        Returns:
+            Dict[int, JSONDict]: The metadata JSON of each metricType by identifier.
+        """
+        metadata = {identifier: self.metadata_cache.get_metric(identifier) for identifier in identifiers}
+        missing = [identifier for identifier, meta_data in metadata.items() if meta_data is None]
+        if missing:
+            downloaded = await asyncio.gather(*[self._get_json(session, limiter, f"{self.base_url}/metricTypes/{identifier}?") for identifier in missing])
+            for identifier, meta_data in zip(missing, downloaded):
+                metadata[identifier] = meta_data
+                self.metadata_cache.set_metric(identifier, meta_data)
+            self.metadata_cache.save()
+        return metadata
+
+    async def _get_dataset_variables_async(self, dataset: int, session: aiohttp.ClientSession, limiter: RateLimiter) -> JSONDict:
+        """
+        Get the metricTypes of a dataset from ``metadata_cache`` or LG Inform Plus.
+
+        Args:
+            dataset (int): The dataset identifier.
+            session (aiohttp.ClientSession): The aiohttp session.
+            limiter (RateLimiter): The shared rate limit.
+
+        Returns:
+            JSONDict: The metricTypes JSON of the dataset.
+        """
+        variables = self.metadata_cache.get_dataset(dataset)
+        if variables is None:
+            variables = await self._get_json(session, limiter, f'{self.base_url}/metricTypes?dataset={str(dataset)}&')
+            self.metadata_cache.set_dataset(dataset, variables)
+            self.metadata_cache.save()
+        return variables
+
+    async def _get_json(self, session: aiohttp.ClientSession, limiter: RateLimiter, url: str, retries: int = 3) -> JSONDict:
+        """
+        Sign a URL and download its JSON, retrying connection errors, timeouts and 429 and 5xx responses with exponential backoff. Other error responses, such as a bad signature or an unknown metricType, are raised straight away.
+
+        Args:
+            session (aiohttp.ClientSession): The aiohttp session.
+            limiter (RateLimiter): The shared rate limit.
+            url (str): The unsigned URL, ending with '?' or '&'.
+            retries (int): Number of retries. Defaults to 3.
+
+        Raises:
+            aiohttp.ClientResponseError: If LG Inform answers with an error that is not retried, or the retries are exhausted.
+
+        Returns:
+            JSONDict: The downloaded JSON.
+        """
+        signed_url = self.sign_url(url)
+        for attempt in range(retries + 1):
+            try:
+                async with limiter:
+                    async with session.get(signed_url, proxy=self.proxies.get('https') or None) as response:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in self.retry_statuses or attempt == retries:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    def _variable_data_url(self, identifier: Union[int, List[int]], latest_n: int) -> str:
+        """
+        Create the unsigned data URL for one or more metricTypes.
+
+        Args:
+            identifier (Union[int, List[int]]): metricType integer or a list of metricType integers.
+            latest_n (int): Latest n periods.
+
+        Returns:
+            str: The unsigned URL.
+        """
+        if isinstance(identifier, (list, tuple)):
+            identifier = ','.join(str(i) for i in identifier)
+        return f"{self.base_url}/data?value.valueType=raw&metricType={str(identifier)}&area={str(self.area)}&period=latest{str(latest_n)}&rowGrouping=area&"
+
     def get_dataset_table_variables(self, dataset: int) -> JSONDict:
         """
-        Given a dataset, output all the metricType numbers (dataset columns). The output dictionary is a JSON.
+        Given a dataset, output all the metricType numbers (dataset columns). The output dictionary is a JSON. The metricTypes are read from ``metadata_cache`` if they have been downloaded within its time-to-live.
 
         Args:
             dataset (int): The number of the dataset from https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
@@ -172,22 +625,41 @@ class LGInform:
             JSONDict:  A JSON dictionary object
         """
 
-        url = f'{self.base_url}/metricTypes?dataset={str(dataset)}&'
-        data_url = self.sign_url(url)
-        variables = requests.get(data_url, proxies=self.proxies).json()
+        variables = self.metadata_cache.get_dataset(dataset)
+        if variables is None:
+            url = f'{self.base_url}/metricTypes?dataset={str(dataset)}&'
+            data_url = self.sign_url(url)
+            variables = requests.get(data_url, proxies=self.proxies).json()
+            self.metadata_cache.set_dataset(dataset, variables)
+            self.metadata_cache.save()
         return variables
 
-    def format_tables(self, outputs: List[JSONDict], drop_discontinued: bool = True) -> None:
+    def format_tables(self, outputs: List[JSONDict], drop_discontinued: bool = True, metadata: Dict[int, JSONDict] = None, output_folder: Path = None, raw_data_folder: Path = None, dataset_name: str = None,
+                      save_raw_data: bool = False, append_metadata: bool = False) -> Dict[int, pd.DataFrame]:
         """
-        Format the data for each variable and create a metadata table.
+        Format the data for each variable and create a metadata table. The formatted tables are returned so that they can be merged in memory with ``merge_tables()``.
 
         Args:
             outputs (List[JSONDict]): A list of JSONDict objects.
             drop_discontinued (bool): Boolean to select whether to include discontinued metrics.
+            metadata (Dict[int, JSONDict]): Metadata JSON of each metricType by identifier, as returned by ``download_dataset_async()``. Defaults to None, in which case the metadata is read from ``metadata_cache`` or downloaded for each metricType.
+            output_folder (Path): Dataset specific folder for the metadata table. Defaults to None, in which case the instance attribute of the same name is used.
+            raw_data_folder (Path): Folder for the table of each variable. Defaults to None, in which case the instance attribute of the same name is used.
+            dataset_name (str): Name of the dataset, used in progress messages. Defaults to None.
+            save_raw_data (bool): Whether to also save the table of each variable as CSV in ``raw_data_folder``, e.g., for debugging. Default is False.
+            append_metadata (bool): Whether to add the metadata rows to the 'metadata.csv' already saved in ``output_folder``. Rows of the same metricType are replaced. Default is False.
 
         Returns:
-            None
+            Dict[int, pd.DataFrame]: Table of each variable by metricType identifier, with columns 'Area', 'Time period' and the name of the variable.
         """
+        output_folder = output_folder or getattr(self, 'dataset_specific_output_folder', None)
+        raw_data_folder = raw_data_folder or getattr(self, 'raw_data_folder', None)
+        assert output_folder, 'Please provide output_folder'
+        assert raw_data_folder or not save_raw_data, 'Please provide raw_data_folder or set save_raw_data to False'
+        dataset_name = dataset_name or getattr(self, 'dataset_key', '')
+
+        tables = {}
+        metadata_downloaded = False
 
         table_headers = {'MetricType': [], 'Column name': [], 'Original table name': [], 'Alternative table name(s)': [], 'Short label': [], 'Discontinued': [], 'Metric help text': [], 'Notes': []}
         tables_excluded = 0
@@ -197,15 +669,19 @@ class LGInform:
                 table_name = download['columns'][0]['metricType']['label']
 
                 try:
-                    dl_df = self.json_to_pandas(download)
-                    dl_df.reset_index(inplace=True, names=['Area'])
-
-                    df_melt = pd.melt(dl_df, id_vars=['Area'], value_vars=dl_df.columns, var_name='Time period', value_name=table_name)
+                    df_melt = self.json_to_pandas(download, value_name=table_name)
 
                     # check if data is discontinued:
-                    metric_data = f"{self.base_url}/metricTypes/{metrictype_identifier}?"
-                    metadata_url = self.sign_url(metric_data)
-                    meta_data = requests.get(metadata_url).json()
+                    if metadata is not None and metrictype_identifier in metadata:
+                        meta_data = metadata[metrictype_identifier]
+                    elif self.metadata_cache.get_metric(metrictype_identifier) is not None:
+                        meta_data = self.metadata_cache.get_metric(metrictype_identifier)
+                    else:
+                        metric_data = f"{self.base_url}/metricTypes/{metrictype_identifier}?"
+                        metadata_url = self.sign_url(metric_data)
+                        meta_data = requests.get(metadata_url, proxies=self.proxies).json()
+                        self.metadata_cache.set_metric(metrictype_identifier, meta_data)
+                        metadata_downloaded = True
                     is_discontinued = meta_data['metricType']['discontinued']
 
                     if is_discontinued and drop_discontinued:
@@ -234,7 +710,10 @@ class LGInform:
                         table_headers['Column name'].append(table_name)
                         table_headers['MetricType'].append(metrictype_identifier)
                         table_headers['Notes'].append('')
-                        df_melt.to_csv(self.raw_data_folder.joinpath(f"table for metricType {metrictype_identifier}.csv"), index=False)
+                        tables[metrictype_identifier] = df_melt
+                        if save_raw_data:
+                            raw_data_folder.mkdir(parents=True, exist_ok=True)
+                            df_melt.to_csv(raw_data_folder.joinpath(f"table for metricType {metrictype_identifier}.csv"), index=False)
 
                 except TypeError:
                     table_headers['MetricType'].append(metrictype_identifier)
@@ -248,121 +727,228 @@ class LGInform:
                     print('Error with table', table_name)
                     tables_excluded += 1
 
+        if metadata_downloaded:
+            self.metadata_cache.save()
         table_name_lookup = pd.DataFrame.from_dict(table_headers)
-        table_name_lookup.to_csv(self.dataset_specific_output_folder.joinpath('metadata.csv'))
-        print(f'Finished formatting table for dataset {self.dataset_key}, number of columns dropped due to errors: {tables_excluded}')
-
-    def merge_tables(self, dataset_name: str) -> pd.DataFrame:
+        metadata_path = output_folder.joinpath('metadata.csv')
+        if append_metadata and metadata_path.exists():
+            stored_lookup = pd.read_csv(metadata_path, index_col=0)
+            table_name_lookup = pd.concat([stored_lookup[~stored_lookup['MetricType'].isin(table_name_lookup['MetricType'])], table_name_lookup], ignore_index=True)
+        table_name_lookup.to_csv(metadata_path)
+        print(f'Finished formatting table for dataset {dataset_name}, number of columns dropped due to errors: {tables_excluded}')
+        return tables
+
+    def merge_tables(self, dataset_name: str, output_folder: Path = None, raw_data_folder: Path = None, tables: Dict[int, pd.DataFrame] = None, file_format: str = 'csv', append: bool = False) -> pd.DataFrame:
         """
-        Merge the variables to form a table for a given dataset.
+        Merge the variables to form a table for a given dataset. All variables are aligned on 'Area' and 'Time period' with one concatenation and the result is written to file once.
 
         Args:
             dataset_name (str): Dataset name string.
+            output_folder (Path): Dataset specific folder for the merged table. Defaults to None, in which case the instance attribute of the same name is used.
+            raw_data_folder (Path): Folder of the table of each variable. Only used if ``tables`` is None. Defaults to None, in which case the instance attribute of the same name is used.
+            tables (Dict[int, pd.DataFrame]): Table of each variable, as returned by ``format_tables()``. Defaults to None, in which case the tables saved in ``raw_data_folder`` are read.
+            file_format (str): Format of the merged table, either 'csv' or 'parquet'. Default is 'csv'.
+            append (bool): Whether to add the tables to the merged table already saved in ``output_folder``. Values of the same area and time period are replaced. Default is False.
 
         Returns:
             pd.DataFrame: All variables of the dataset merged as one Pandas dataframe.
         """
-        all_tables = [i for i in self.raw_data_folder.glob("*.csv")]
-        try:
-            df = pd.read_csv(all_tables[0])
-
-            for i in all_tables[1:]:
-                df_to_merge = pd.read_csv(i)
-                df = df.merge(df_to_merge, how='left', on=['Area', 'Time period'])
-
-            df.to_csv(self.dataset_specific_output_folder.joinpath(f'data for dataset {dataset_name}.csv'), index=False)
-            return df
-        except IndexError:
-            print(f"No data found in {self.raw_data_folder}. Maybe the variables are discontinued? Try changing drop_discontinued parameter to False.")
+        assert file_format in ['csv', 'parquet'], "file_format must be either 'csv' or 'parquet'"
+        output_folder = output_folder or getattr(self, 'dataset_specific_output_folder', None)
+        assert output_folder, 'Please provide output_folder'
+        if tables is None:
+            raw_data_folder = raw_data_folder or getattr(self, 'raw_data_folder', None)
+            assert raw_data_folder, 'Please provide tables or raw_data_folder'
+            tables = {i.stem: pd.read_csv(i) for i in raw_data_folder.glob("*.csv")}
+
+        if not tables:
+            print(f"No data found for dataset {dataset_name}. Maybe the variables are discontinued? Try changing drop_discontinued parameter to False.")
             return None
 
-    def download(self, datasets: Dict[str, int], output_folder: Path, latest_n: int = 5, drop_discontinued: bool = True) -> None:
+        df = pd.concat([table.set_index(['Area', 'Time period']) for table in tables.values()], axis=1, join='outer')
+        output_path = output_folder.joinpath(f'data for dataset {dataset_name}.{file_format}')
+        if append and output_path.exists():
+            stored_df = pd.read_parquet(output_path) if file_format == 'parquet' else pd.read_csv(output_path, dtype={'Area': str, 'Time period': str})
+            df = df.combine_first(stored_df.set_index(['Area', 'Time period']))[list(dict.fromkeys([*stored_df.columns[2:], *df.columns]))]
+        df = df.reset_index()
+        if file_format == 'parquet':
+            df.to_parquet(output_path, index=False)
+        else:
+            df.to_csv(output_path, index=False)
+        return df
+
+    def download(self, datasets: Dict[str, int], output_folder: Path, latest_n: int = 5, drop_discontinued: bool = True, file_format: str = 'csv', save_raw_data: bool = False, incremental: bool = False) -> pd.DataFrame:
         """
-        Download all variables for many datasets, merging the variables to one table by area and time period.
+        Download all variables for many datasets, one dataset at a time, merging the variables to one table by area and time period.
 
         Args:
 
             datasets (Dict[str,int]): Dictionary of format {"some_name": some_integer}', where the integer value is an identifier from https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
+            output_folder (Path): Folder for the downloaded data. Each dataset is stored in a subfolder named after its key in ``datasets``.
             latest_n (int): The period is currently restricted to using the latest n periods. This means that the period can be years, quarters, months, weeks or some other period (e.g. for Indices of Multiple Deprivation, the period refers to publications so that latest_n=2 would get data for 2019 and 2015).
             drop_discontinued (bool): If you set this to False, the downloaded data will include discontinued metrics. Default is True.
+            file_format (str): Format of the merged table of each dataset, either 'csv' or 'parquet'. Default is 'csv'.
+            save_raw_data (bool): Whether to also save the table of each variable as CSV in the 'raw_data' subfolder of the dataset. Default is False.
+            incremental (bool): Whether to download only the periods newer than those already stored in ``output_folder`` and add them to the stored table of each dataset. Datasets without a stored table, or stored for other areas, are downloaded in full. Default is False.
 
         Returns:
-            None
+            pd.DataFrame: Report of the downloaded datasets with their status, number of metrics and rows, duration and error message.
         """
-        assert output_folder, 'Please provide a storage location for merged data'
+        return self.mp_download(datasets, output_folder, latest_n=latest_n, drop_discontinued=drop_discontinued, max_workers=1, file_format=file_format, save_raw_data=save_raw_data, incremental=incremental)
+
+    def mp_download(self, datasets: Dict[str, int], output_folder: Path, latest_n: int = 20, drop_discontinued: bool = True, max_workers: int = 8, file_format: str = 'csv', save_raw_data: bool = False,
+                    incremental: bool = False) -> pd.DataFrame:
+        """
+        Download data for multiple datasets simultaneously. ``max_workers`` asynchronous workers take datasets from one shared queue, so a worker that finishes a small dataset immediately starts the next one instead of waiting for the slowest dataset. All requests share one rate limit of ``max_concurrent_requests`` concurrent requests and ``requests_per_second`` requests per second. A report of all datasets is printed and returned at the end.
 
-        if not output_folder.exists():
-            output_folder.mkdir(parents=True)
+        Args:
+            datasets (Dict[str,int]): Dictionary of format {"some_name": some_integer}', where the integer value is an identifier from https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
+            output_folder (Path): Folder for the downloaded data. Each dataset is stored in a subfolder named after its key in ``datasets``.
+            latest_n (int): The period is currently restricted to using the latest n periods. This means that the period can be years, quarters, months, weeks or some other period (e.g. for Indices of Multiple Deprivation, the period refers to publications so that latest_n=2 would get data for 2019 and 2015).
+            drop_discontinued (bool): If you set this to False, the downloaded data will include discontinued metrics. Default is True.
+            max_workers (int): Number of datasets processed at the same time. Default is 8.
+            file_format (str): Format of the merged table of each dataset, either 'csv' or 'parquet'. Default is 'csv'.
+            save_raw_data (bool): Whether to also save the table of each variable as CSV in the 'raw_data' subfolder of the dataset. Default is False.
+            incremental (bool): Whether to download only the periods newer than those already stored in ``output_folder`` and add them to the stored table of each dataset. Datasets without a stored table, or stored for other areas, are downloaded in full. Default is False.
 
+        Returns:
+            pd.DataFrame: Report of the downloaded datasets with their status, number of metrics and rows, duration and error message.
+        """
+        assert output_folder, 'Please provide a storage location for merged data'
         assert isinstance(datasets, dict), 'Please make sure "datasets" variable is a dictionary of format {"some_name": some_int}'
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
 
-        for dataset_key, d in datasets.items():
-            print(f"Starting download for {dataset_key}")
-            self.dataset_key = dataset_key
-            dataset_specific_output_folder = output_folder.joinpath(f"{self.dataset_key}")
-            self.dataset_specific_output_folder = dataset_specific_output_folder
-            self.raw_data_folder = self.dataset_specific_output_folder.joinpath('raw_data')
-            if not self.raw_data_folder.exists():
-                self.raw_data_folder.mkdir(parents=True)
-            variables = self.get_dataset_table_variables(d)
-            output = self.download_data_for_many_variables(variables, latest_n=latest_n)
-            self.format_tables(output, drop_discontinued=drop_discontinued)
-            merged_df = self.merge_tables(self.dataset_key)
-            if merged_df is not None:
-                print(f"Dataset {dataset_key} downloaded, merged, and stored in {self.dataset_specific_output_folder}")
+        assert file_format in ['csv', 'parquet'], "file_format must be either 'csv' or 'parquet'"
+        results = asyncio.run(self._download_datasets(datasets, output_folder, latest_n, drop_discontinued, max_workers, file_format=file_format, save_raw_data=save_raw_data, incremental=incremental))
+        report = pd.DataFrame(results, columns=['Dataset', 'Identifier', 'Status', 'Metrics', 'Rows', 'Seconds', 'Error'])
+        print(f"Downloaded {(report['Status'] == 'ok').sum()} of {len(report)} datasets:")
+        print(report.to_string(index=False))
+        return report
 
-    def _multiprocessing_wrapper(self, input_queue: mp.Queue) -> None:
+    async def _download_datasets(self, datasets: Dict[str, int], output_folder: Path, latest_n: int, drop_discontinued: bool, max_workers: int, **options) -> List[Dict[str, Any]]:
         """
-        This is just the same as download() method, but wrapped to be used with multiprocessing library.
+        Process the datasets with a pool of workers sharing one queue, one aiohttp session and one rate limit.
 
         Args:
-            input_queue (mp.Queue): A multiprocessing queue.
+            datasets (Dict[str,int]): Dictionary of format {"some_name": some_integer}.
+            output_folder (Path): Folder for the downloaded data.
+            latest_n (int): Latest n periods.
+            drop_discontinued (bool): Whether to drop discontinued metrics.
+            max_workers (int): Number of datasets processed at the same time.
+            **options: ``file_format``, ``save_raw_data`` and ``incremental`` options passed to ``_download_dataset()``.
 
         Returns:
-            None
+            List[Dict[str, Any]]: Report row of each dataset, in the order of ``datasets``.
         """
-        args = input_queue.get()
-        (datasets, latest_n, drop_discontinued) = args
-        self.download(datasets, latest_n, drop_discontinued)
-
-    def mp_download(self, datasets: Dict[str, int], output_folder: Path, latest_n: int = 20, drop_discontinued: bool = True, max_workers: int = 8) -> None:
+        queue = asyncio.Queue()
+        for item in datasets.items():
+            queue.put_nowait(item)
+        results = {}
+        limiter = RateLimiter(self.requests_per_second, self.max_concurrent_requests)
+
+        async def worker(session: aiohttp.ClientSession) -> None:
+            while not queue.empty():
+                dataset_key, identifier = queue.get_nowait()
+                results[dataset_key] = await self._download_dataset(session, limiter, dataset_key, identifier, output_folder, latest_n, drop_discontinued, **options)
+                print(f"[{len(results)}/{len(datasets)}] {dataset_key}: {results[dataset_key]['Status']}")
+
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*[worker(session) for _ in range(max(1, min(max_workers, len(datasets))))])
+        return [results[dataset_key] for dataset_key in datasets]
+
+    async def _download_dataset(self, session: aiohttp.ClientSession, limiter: RateLimiter, dataset_key: str, identifier: int, output_folder: Path, latest_n: int, drop_discontinued: bool,
+                                file_format: str = 'csv', save_raw_data: bool = False, incremental: bool = False) -> Dict[str, Any]:
         """
-        Multiprocessing method for downloading data for multiple datasets. Use max_workers to split the dataset dictionary to chunks of size max_workers.
+        Download, format and merge one dataset. Errors are recorded in the report instead of stopping the other datasets. The periods stored for each metricType are recorded in 'manifest.json' in the dataset folder.
 
         Args:
-            datasets (Dict[str,int]): Dictionary of format {"some_name": some_integer}', where the integer value is an identifier from https://webservices.esd.org.uk/datasets?ApplicationKey=ExamplePPK&Signature=YChwR9HU0Vbg8KZ5ezdGZt+EyL4=
-            latest_n (int): The period is currently restricted to using the latest n periods. This means that the period can be years, quarters, months, weeks or some other period (e.g. for Indices of Multiple Deprivation, the period refers to publications so that latest_n=2 would get data for 2019 and 2015).
-            drop_discontinued (bool): If you set this to False, the downloaded data will include discontinued metrics. Default is True.
-            max_workers (int): Set the number of workers for multiprocessing. Typically this would be the number of logical CPUs in your system. This will also process the datasets in chunks, so that if you list 16 datasets in your datasets dictionary and have 8 workers, the script will work through the datasets in two steps (16/8 = 2).
+            session (aiohttp.ClientSession): The shared aiohttp session.
+            limiter (RateLimiter): The shared rate limit.
+            dataset_key (str): Name of the dataset.
+            identifier (int): LG Inform Plus identifier of the dataset.
+            output_folder (Path): Folder for the downloaded data.
+            latest_n (int): Latest n periods.
+            drop_discontinued (bool): Whether to drop discontinued metrics.
+            file_format (str): Format of the merged table, either 'csv' or 'parquet'. Default is 'csv'.
+            save_raw_data (bool): Whether to also save the table of each variable as CSV. Default is False.
+            incremental (bool): Whether to download only the periods newer than those in the manifest and add them to the stored table. Default is False.
 
         Returns:
-            None
+            Dict[str, Any]: Report row of the dataset.
         """
-        sliding_dataset = more_itertools.windowed([{i: k} for i, k in datasets.items()], n=max_workers, step=max_workers)
-
-        for enum, subset in enumerate(sliding_dataset):
-            print(f"Step {enum + 1} of {round(len(datasets) / max_workers) + 1}")
-            new_subset = [item for item in subset if item is not None]
-
-            print(f"Employing workers {1 + max_workers * enum} to {max_workers + max_workers * enum}")
-            q = mp.Queue()
-            workers = []
-
-            for data_set in new_subset:
-                q.put((data_set, output_folder, latest_n, drop_discontinued))
+        start = perf_counter()
+        report = {'Dataset': dataset_key, 'Identifier': identifier, 'Status': 'ok', 'Metrics': 0, 'Rows': 0, 'Seconds': 0.0, 'Error': ''}
+        dataset_folder = output_folder.joinpath(f"{dataset_key}")
+        raw_data_folder = dataset_folder.joinpath('raw_data')
+        dataset_folder.mkdir(parents=True, exist_ok=True)
+        try:
+            variables = await self._get_dataset_variables_async(identifier, session, limiter)
+            manifest = self._read_manifest(dataset_folder) if incremental else None
+            if manifest is not None and (manifest['area'] != self.area or not dataset_folder.joinpath(f'data for dataset {dataset_key}.{file_format}').exists()):
+                manifest = None  # the stored table is for other areas or is missing, so everything is downloaded again
+
+            if manifest is None:
+                outputs, metadata = await self.download_dataset_async(variables, latest_n=latest_n, drop_discontinued=drop_discontinued, session=session, limiter=limiter)
+                manifest = {'area': self.area, 'periods': {}}
+            else:
+                outputs, metadata = await self.download_dataset_incremental_async(variables, manifest['periods'], latest_n=latest_n, drop_discontinued=drop_discontinued, session=session, limiter=limiter)
+                outputs = [output for output in outputs if output['columns']]
+                if not outputs:
+                    report['Status'] = 'up to date'
+                    report['Seconds'] = round(perf_counter() - start, 2)
+                    return report
+            report['Metrics'] = len(outputs)
+            appending = bool(manifest['periods'])
+            # formatting and merging are CPU bound and write files, so they run in a thread to keep the downloads of other datasets going
+            tables = await asyncio.to_thread(self.format_tables, outputs, drop_discontinued, metadata, dataset_folder, raw_data_folder, dataset_key, save_raw_data, appending)
+            merged_df = await asyncio.to_thread(self.merge_tables, dataset_key, dataset_folder, tables=tables, file_format=file_format, append=appending)
+            if merged_df is None:
+                report['Status'] = 'no data'
+            else:
+                report['Rows'] = len(merged_df)
+                for output in outputs:
+                    # only the metrics that format_tables() kept are recorded, so that a dropped metric is downloaded again next time
+                    if output['columns'] and output['columns'][0]['metricType']['identifier'] in tables:
+                        metric_periods = manifest['periods'].setdefault(output['columns'][0]['metricType']['identifier'], [])
+                        metric_periods.extend(period for period in dict.fromkeys(column['period']['label'] for column in output['columns']) if period not in metric_periods)
+                self._write_manifest(dataset_folder, manifest)
+        except Exception as e:
+            report['Status'] = 'failed'
+            report['Error'] = f"{type(e).__name__}: {e}"
+        report['Seconds'] = round(perf_counter() - start, 2)
+        return report
+
+    @staticmethod
+    def _read_manifest(dataset_folder: Path) -> Optional[Dict[str, Any]]:
+        """
+        Read the manifest of the areas and the periods of each metricType stored in a dataset folder.
 
-            for i in range(len(new_subset)):
-                p = mp.Process(target=self._multiprocessing_wrapper, args=(q,))
-                workers.append(p)
-                p.start()
+        Args:
+            dataset_folder (Path): The dataset folder.
 
-            for w in workers:
-                q.put(None)
+        Returns:
+            Optional[Dict[str, Any]]: The area string and the stored period labels by metricType identifier, or None if there is no manifest.
+        """
+        try:
+            with open(dataset_folder.joinpath('manifest.json'), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        manifest['periods'] = {int(identifier): periods for identifier, periods in manifest['periods'].items()}
+        return manifest
 
-            # Wait for workers to quit.
-            for w in workers:
-                w.join()
+    @staticmethod
+    def _write_manifest(dataset_folder: Path, manifest: Dict[str, Any]) -> None:
+        """
+        Write the manifest of the areas and the periods of each metricType stored in a dataset folder.
 
-            print(f"Completed step {enum + 1}")
+        Args:
+            dataset_folder (Path): The dataset folder.
+            manifest (Dict[str, Any]): The area string and the stored period labels by metricType identifier.
 
-        print('Done')
+        Returns:
+            None
+        """
+        with open(dataset_folder.joinpath('manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
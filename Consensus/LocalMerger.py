@@ -4,9 +4,14 @@ This module is not yet fully implemented and is a work in progress. Please let m
 """
 
 import pandas as pd
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Any, Tuple, Union
 import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
 import networkx as nx
 
 
@@ -18,11 +23,12 @@ class DatabaseManager:
     Attributes:
         db_path (str): Path to the DuckDB database file.
         conn (duckdb.DuckDBPyConnection): Connection to the DuckDB database.
+        join_types (Dict[str, str]): Class attribute. Supported join types and their SQL keywords.
 
     Methods:
         __init__(db_path: str): Initializes the DatabaseManager with the provided database path.
-        create_database(table_paths: Dict[str, Path]): Creates tables in the DuckDB database from CSV or Excel files.
-        query_tables_from_path(path: List[str], table_paths: Dict[str, Path], join_type: str = 'left'): Queries multiple tables specified in the path and joins them using the specified join type.
+        create_database(table_paths: Dict[str, Path], max_workers: int = 4): Creates tables in the DuckDB database from CSV, Parquet or Excel files.
+        query_tables_from_path(path: List[str], table_paths: Dict[str, Path] = None, join_type: str = 'left', columns: List[str] = None, filters: Dict[str, Any] = None, output: str = 'pandas'): Queries multiple tables specified in the path and joins them in the database using the specified join type.
         query_tables_from_graph(graph: nx.DiGraph, join_type: str = 'left'): Queries tables based on a directed graph and joins them using the specified join type.
         query_tables_from_dict(graph: Dict[str, List[str]], join_type: str = 'left'): Queries tables based on a dictionary representation of a graph and joins them using the specified join type.
 
@@ -33,7 +39,7 @@ class DatabaseManager:
             from Consensus.LocalMerger import DatabaseManager
             db_manager = DatabaseManager('path/to/database.db')
             db_manager.create_database({'table1': Path('path/to/table1.csv'), 'table2': Path('path/to/table2.csv')})
-            result = db_manager.query_tables_from_path(['table1', 'table2'], {'table1': Path('path/to/table1.csv'), 'table2': Path('path/to/table2.csv')}, 'left')
+            result = db_manager.query_tables_from_path(['table1', 'table2'], join_type='left', columns=['col1', 'col3'], filters={'col1': [1, 2]})
     """
 
     def __init__(self, db_path: str):
@@ -45,114 +51,231 @@ class DatabaseManager:
         """
         self.db_path = db_path
         self.conn = duckdb.connect(database=self.db_path, read_only=False)
+        self._excel_extension = None
+        self._lock = threading.Lock()
 
-    def create_database(self, table_paths: Dict[str, Path]):
+    def create_database(self, table_paths: Dict[str, Path], max_workers: int = 4) -> None:
         """
-        Creates tables in the DuckDB database from CSV or Excel files.
+        Creates tables in the DuckDB database from CSV, Parquet or Excel files.
 
         Args:
             table_paths (Dict[str, Path]): A dictionary mapping table names to file paths.
+            max_workers (int): Number of files loaded at the same time. Defaults to 4.
 
         This method loads data from the specified file paths and creates tables
-        in the database. The file paths must point to CSV or Excel files.
+        in the database with ``CREATE OR REPLACE TABLE ... AS SELECT``, so that
+        DuckDB parses the files itself (``read_csv_auto()``, ``read_parquet()`` and,
+        if the Excel extension is available, ``read_xlsx()``) instead of pandas.
+        Excel files are read with pandas if the extension is not available.
+        The files are loaded concurrently, each on its own cursor.
         """
+        files = {}
         for node, path in table_paths.items():
-            file_path = str(path)  # Convert Path object to string
-
-            if Path(file_path).exists():
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                elif file_path.endswith('.xlsx'):
-                    df = pd.read_excel(file_path)
-                else:
-                    print(f"Unsupported file type: {file_path}")
-                    continue
-
-                print(f"Loading data from {file_path}")
-                print(f"Preview of {node}:\n", df.head())
+            if not Path(path).exists():
+                print(f"Node {node} does not have a corresponding file path.")
+            elif Path(path).suffix.lower() not in ('.csv', '.parquet', '.xlsx', '.xls'):
+                print(f"Unsupported file type: {path}")
+            else:
+                files[node] = Path(path)
 
-                df.to_sql(node, self.conn, if_exists='replace', index=False)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {node: executor.submit(self._load_table, node, path) for node, path in files.items()}
+            for node, future in futures.items():
+                future.result()
                 print(f"Table {node} created.")
-            else:
-                print(f"Node {node} does not have a corresponding file path.")
 
-    def query_tables_from_path(self, path: List[str], table_paths: Dict[str, Path], join_type: str = 'left') -> pd.DataFrame:
+    def _load_table(self, node: str, path: Path) -> None:
         """
-        Queries multiple tables specified in the path and joins them using the specified join type.
+        Creates one table from a file on a separate cursor of the database connection.
 
         Args:
-            path (List[str]): A list of table names to include in the query.
-            table_paths (Dict[str, Path]): A dictionary mapping table names to file paths.
-            join_type (str): The type of join to perform. Default is 'outer'.
+            node (str): The table name.
+            path (Path): The path to the CSV, Parquet or Excel file.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the result of the join operation.
+            None
+        """
+        print(f"Loading data from {path}")
+        cursor = self.conn.cursor()
+        try:
+            suffix = path.suffix.lower()
+            sql = f"CREATE OR REPLACE TABLE {self._quote(node)} AS SELECT * FROM "
+            if suffix == '.csv':
+                try:
+                    cursor.execute(sql + "read_csv_auto(?)", [str(path)])
+                except duckdb.Error:
+                    # the types are guessed from a sample of rows, which fails if a later row does not fit (e.g., E09000023 after numeric codes), so the types are guessed from all rows instead
+                    cursor.execute(sql + "read_csv_auto(?, sample_size = -1)", [str(path)])
+                return
+            if suffix == '.parquet':
+                cursor.execute(sql + "read_parquet(?)", [str(path)])
+                return
+            if suffix == '.xlsx' and self._excel_extension_available():
+                try:
+                    cursor.execute(sql + "read_xlsx(?)", [str(path)])
+                    return
+                except duckdb.Error:
+                    # older DuckDB versions have an Excel extension without read_xlsx()
+                    self._excel_extension = False
+            df = pd.read_excel(path)
+            cursor.register('excel_df', df)
+            cursor.execute(sql + "excel_df")
+            cursor.unregister('excel_df')
+        finally:
+            cursor.close()
+
+    def _excel_extension_available(self) -> bool:
+        """
+        Checks once whether DuckDB's Excel extension can be loaded.
 
-        Raises:
-            ValueError: If no valid tables are found in the provided path.
+        Returns:
+            bool: True if ``read_xlsx()`` is available.
         """
-        tables = [node for node in path if node in table_paths]
-        if not tables:
-            raise ValueError("No valid tables found in the provided path.")
+        with self._lock:
+            if self._excel_extension is None:
+                try:
+                    self.conn.execute("LOAD excel")
+                    self._excel_extension = True
+                except duckdb.Error:
+                    self._excel_extension = False
+            return self._excel_extension
 
-        # Load data from each table into a dictionary of DataFrames
-        dfs = {}
-        for table in tables:
-            file_path = str(table_paths[table])
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith('.xlsx'):
-                df = pd.read_excel(file_path)
-            else:
-                print(f"Unsupported file type for table {table}: {file_path}")
-                continue
+    @staticmethod
+    def _quote(name: str) -> str:
+        """
+        Returns a quoted SQL identifier.
 
-            dfs[table] = df
+        Args:
+            name (str): The table or column name.
 
-        # Perform joins on the DataFrames
-        try:
-            result_df = self._join_tables(dfs, join_type)
-            return result_df
-        except Exception as e:
-            print(f"Failed to join tables: {e}")
-            raise
+        Returns:
+            str: The quoted identifier.
+        """
+        return '"' + str(name).replace('"', '""') + '"'
 
-    def _join_tables(self, dfs: Dict[str, pd.DataFrame], join_type: str = 'left') -> pd.DataFrame:
+    join_types = {'left': 'LEFT', 'right': 'RIGHT', 'inner': 'INNER', 'outer': 'FULL OUTER'}
+
+    def query_tables_from_path(self, path: List[str], table_paths: Dict[str, Path] = None, join_type: str = 'left', columns: List[str] = None,
+                               filters: Dict[str, Any] = None, output: str = 'pandas') -> Union[pd.DataFrame, pa.Table]:
         """
-        Joins multiple DataFrames using the specified join type.
+        Queries multiple tables specified in the path and joins them using the specified join type.
+
+        The tables are joined in the database with one SQL statement, so that DuckDB
+        runs the joins in parallel and out of core. Each table is joined on the first
+        column it shares with the tables before it, and other shared columns are
+        suffixed with the table name. Tables of the path that are not in the database
+        yet are loaded from ``table_paths`` first.
 
         Args:
-            dfs (Dict[str, pd.DataFrame]): A dictionary of table names to DataFrames to be joined.
-            join_type (str): The type of join to perform (e.g., 'inner', 'outer').
+            path (List[str]): A list of table names to include in the query.
+            table_paths (Dict[str, Path]): A dictionary mapping table names to file paths. Defaults to None, in which case only the tables already in the database are used.
+            join_type (str): The type of join to perform, one of 'left', 'right', 'inner' or 'outer'. Default is 'left'.
+            columns (List[str]): Columns to return. Defaults to None, in which case all columns are returned.
+            filters (Dict[str, Any]): Values to filter the rows by, e.g., ``{'LAD23CD': ['E09000023', 'E09000022']}``. A list matches any of its values. Defaults to None.
+            output (str): 'pandas' for a DataFrame or 'arrow' for a pyarrow Table. Default is 'pandas'.
 
         Returns:
-            pd.DataFrame: The resulting DataFrame after performing all joins.
+            Union[pd.DataFrame, pa.Table]: The result of the join operation.
 
         Raises:
-            ValueError: If no common columns are found between DataFrames for joining.
-        """
-        # Initialize result_df with the first DataFrame
-        tables = list(dfs.keys())
+            ValueError: If no valid tables are found in the provided path, the join type or output is not supported, a requested column does not exist, or two consecutive tables have no common columns.
+        """
+        if output not in ('pandas', 'arrow'):
+            raise ValueError(f"Unsupported output: {output}. Use one of ['pandas', 'arrow']")
+        if join_type not in self.join_types:
+            raise ValueError(f"Unsupported join type: {join_type}. Use one of {list(self.join_types)}")
+
+        stored = {table.lower() for table in self.list_all_tables()}
+        table_paths = table_paths or {}
+        missing = {node: table_paths[node] for node in path if node.lower() not in stored and node in table_paths}
+        if missing:
+            self.create_database(missing)
+        tables = [node for node in path if node.lower() in stored or node in missing]
         if not tables:
-            raise ValueError("No tables to join.")
+            raise ValueError("No valid tables found in the provided path.")
+
+        sql, params = self._join_sql(tables, join_type, columns, filters)
+        result = self.conn.execute(sql, params)
+        if output == 'arrow':
+            fetch_arrow = getattr(result, 'to_arrow_table', None) or result.fetch_arrow_table  # fetch_arrow_table() is deprecated in newer DuckDB versions
+            return fetch_arrow()
+        return result.df()
+
+    def _join_sql(self, tables: List[str], join_type: str = 'left', columns: List[str] = None, filters: Dict[str, Any] = None) -> Tuple[str, List[Any]]:
+        """
+        Builds the SQL statement that joins the tables, selects the columns and filters the rows.
 
-        result_df = dfs[tables[0]]
-        for table in tables[1:]:
-            df_to_join = dfs[table]
-            print(f"Joining with table {table} using {join_type} join")
+        Args:
+            tables (List[str]): Names of the tables in the database, in join order.
+            join_type (str): The type of join to perform (e.g., 'inner', 'outer').
+            columns (List[str]): Columns to return. Defaults to None, in which case all columns are returned.
+            filters (Dict[str, Any]): Values to filter the rows by. Defaults to None.
+
+        Returns:
+            Tuple[str, List[Any]]: The SQL statement and its parameters.
 
-            # Identify common columns for the join
-            common_columns = list(set(result_df.columns) & set(df_to_join.columns))
-            if not common_columns:
-                raise ValueError(f"No common columns to join on between {result_df.columns} and {df_to_join.columns}")
+        Raises:
+            ValueError: If a column does not exist or two consecutive tables have no common columns.
+        """
+        # output columns by lowercase name, as DuckDB identifiers are case insensitive: (output name, SQL expression)
+        selected = {}
+        for column in self._table_columns(tables[0]):
+            selected[column.lower()] = (column, f't0.{self._quote(column)}')
+        from_clause = f"{self._quote(tables[0])} AS t0"
+
+        for n, table in enumerate(tables[1:], start=1):
+            table_columns = self._table_columns(table)
+            common = [name for name in selected if name in {column.lower() for column in table_columns}]
+            if not common:
+                raise ValueError(f"No common columns to join on between {[name for name, _ in selected.values()]} and {table_columns}")
+            join_name, join_expr = selected[common[0]]
+            right_join_column = next(column for column in table_columns if column.lower() == common[0])
+            right_expr = f't{n}.{self._quote(right_join_column)}'
+            print(f"Joining with table {table} using {join_type} join on {join_name}")
+            from_clause += f" {self.join_types[join_type]} JOIN {self._quote(table)} AS t{n} ON {join_expr} = {right_expr}"
+            if join_type == 'outer':
+                selected[common[0]] = (join_name, f'COALESCE({join_expr}, {right_expr})')
+            elif join_type == 'right':
+                selected[common[0]] = (join_name, right_expr)
+
+            for column in table_columns:
+                if column == right_join_column:
+                    continue
+                name = column if column.lower() not in selected else f'{column}_{table}'
+                selected[name.lower()] = (name, f't{n}.{self._quote(column)}')
+
+        def expression(column: str) -> str:
+            if column.lower() not in selected:
+                raise ValueError(f"Column {column} not found in the tables {tables}")
+            return selected[column.lower()][1]
+
+        select = [f'{expression(column)} AS {self._quote(column)}' for column in columns] if columns else [f'{expr} AS {self._quote(name)}' for name, expr in selected.values()]
+        sql = f"SELECT {', '.join(select)} FROM {from_clause}"
+
+        params = []
+        conditions = []
+        for column, values in (filters or {}).items():
+            if isinstance(values, (list, tuple, set)):
+                conditions.append(f'{expression(column)} IN (SELECT UNNEST(?))')
+                params.append(list(values))
+            else:
+                conditions.append(f'{expression(column)} = ?')
+                params.append(values)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, params
 
-            join_column = common_columns[0]
-            # Perform the left join, adding suffixes to handle duplicate column names
-            result_df = result_df.merge(df_to_join, how=join_type, on=join_column, suffixes=('', f'_{table}'))
+    def _table_columns(self, table: str) -> List[str]:
+        """
+        Returns the column names of a table in the database.
 
-            print(f"Result after join with {table}:\n", result_df.head())
+        Args:
+            table (str): The table name.
 
-        return result_df
+        Returns:
+            List[str]: The column names.
+        """
+        return [row[0] for row in self.conn.execute(f"DESCRIBE {self._quote(table)}").fetchall()]
 
     def list_all_tables(self) -> List[str]:
         """
@@ -176,21 +299,23 @@ class DatabaseManager:
 
 class GraphBuilder:
     """
-    A class to build and manage a graph from CSV and Excel files in a directory.
+    A class to build and manage a graph from CSV, Parquet and Excel files in a directory.
 
     This class constructs a graph where nodes are tables and columns, and edges represent
     relationships between them. It provides methods to find paths between tables or columns.
+    Only the column names of the files are read, and they are cached so that only new and
+    changed files are read when the graph is built again.
 
     Attributes:
         directory_path (Path): The path to the directory containing the data files.
+        cache_path (Path): The path of the JSON file caching the columns of each file.
         graph (nx.DiGraph): The graph representing the relationships between tables and columns.
 
     Methods:
-        __init__(directory_path: str): Initializes the GraphBuilder with a directory containing CSV and Excel files.
-        _build_graph(): Scans the directory for CSV and Excel files and builds the graph.
-        _process_csv(file_path: Path): Processes a CSV file and updates the graph with table and column information.
-        _process_excel(file_path: Path): Processes an Excel file and updates the graph with table and column information.
-        _process_dataframe(df: pd.DataFrame, table_name: str, file_path: Path): Processes a DataFrame and updates the graph with table and column relationships.
+        __init__(directory_path: str, cache_path: str = None): Initializes the GraphBuilder with a directory containing CSV, Parquet and Excel files.
+        _build_graph(): Scans the directory for CSV, Parquet and Excel files and builds the graph.
+        _read_columns(file_path: Path): Reads the column names of a file from the cache or the file header.
+        _process_columns(columns: List[str], table_name: str, file_path: Path): Updates the graph with a table and its column relationships.
         get_table_paths(): Returns a dictionary of table names and their corresponding file paths.
         bfs_paths(start: str, end: str): Finds all paths between the start and end nodes using breadth-first search (BFS).
         find_paths(start: str, end: str, by: str = 'table'): Finds all paths between the start and end nodes, either by table name or column name.
@@ -208,77 +333,119 @@ class GraphBuilder:
             graph_builder.get_all_possible_paths('table1', 'table2')
     """
 
-    def __init__(self, directory_path: str):
+    def __init__(self, directory_path: str, cache_path: str = None):
         """
-        Initializes the GraphBuilder with a directory containing CSV and Excel files.
+        Initializes the GraphBuilder with a directory containing CSV, Parquet and Excel files.
 
         Args:
             directory_path (str): The path to the directory containing the data files.
+            cache_path (str): The path of the JSON file caching the columns of each file. Defaults to None, in which case ``local_merger_cache/schemas.json`` in the package folder is used.
         """
         self.directory_path = Path(directory_path)
+        self.cache_path = Path(cache_path) if cache_path else Path(__file__).resolve().parent / 'local_merger_cache' / 'schemas.json'
         self.graph = nx.Graph()
         self.table_paths = {}  # Dictionary to store table paths
+        self._schema_cache = None
         self._build_graph()
 
     def _build_graph(self) -> None:
         """
-        Scans the directory for CSV and Excel files and builds the graph.
+        Scans the directory for CSV, Parquet and Excel files and builds the graph.
 
-        This method iterates through all CSV and Excel files in the specified directory,
-        processes them, and adds the tables and columns to the graph.
+        This method iterates through all CSV, Parquet and Excel files in the specified directory,
+        reads only their column names, and adds the tables and columns to the graph.
+        The column names are cached by file path, modification time and size, so
+        only new and changed files are read again.
 
         Returns:
             None
         """
-        for file_path in self.directory_path.rglob('*.csv'):
-            self._process_csv(file_path)
-        for file_path in self.directory_path.rglob('*.xls*'):
-            self._process_excel(file_path)
-
-    def _process_csv(self, file_path: Path) -> None:
-        """
-        Processes a CSV file and updates the graph with table and column information.
-
-        Args:
-            file_path (Path): The path to the CSV file to process.
+        changed = False
+        for pattern in ('*.csv', '*.parquet', '*.xls*'):
+            for file_path in self.directory_path.rglob(pattern):
+                columns, read = self._read_columns(file_path)
+                changed = changed or read
+                self._process_columns(columns, file_path.stem, file_path)
+        if changed:
+            self._save_schema_cache()
 
-        Returns:
-            None
+    def _read_columns(self, file_path: Path) -> Tuple[List[str], bool]:
         """
-        df = pd.read_csv(file_path)
-        self._process_dataframe(df, file_path.stem, file_path)
+        Reads the column names of a file from the cache or, if the file is new or has changed, from the file header.
 
-    def _process_excel(self, file_path: Path) -> None:
-        """Processes an Excel file and updates the graph with table and column information.
+        CSV and Excel files are read with ``nrows=0`` and Parquet files by reading their schema, so that no rows are read.
 
         Args:
-            file_path (Path): The path to the Excel file to process.
+            file_path (Path): The path to the data file.
 
         Returns:
-            None
-        """
-        df = pd.read_excel(file_path)
-        self._process_dataframe(df, file_path.stem, file_path)
+            Tuple[List[str], bool]: The column names and whether they were read from the file.
+        """
+        cache = self._load_schema_cache()
+        stat = file_path.stat()
+        key = str(file_path.resolve())
+        entry = cache.get(key)
+        if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry['columns'], False
+
+        suffix = file_path.suffix.lower()
+        if suffix == '.csv':
+            columns = pd.read_csv(file_path, nrows=0).columns
+        elif suffix == '.parquet':
+            columns = pq.read_schema(file_path).names
+        else:
+            columns = pd.read_excel(file_path, nrows=0).columns
+        columns = [str(col) for col in columns]
+        cache[key] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'columns': columns}
+        return columns, True
 
-    def _process_dataframe(self, df: pd.DataFrame, table_name: str, file_path: Path) -> None:
+    def _process_columns(self, columns: List[str], table_name: str, file_path: Path) -> None:
         """
-        Processes a DataFrame and updates the graph with table and column relationships.
+        Updates the graph with a table and its column relationships.
 
         Args:
-            df (pd.DataFrame): The DataFrame containing the table's data.
+            columns (List[str]): The column names of the table.
             table_name (str): The name of the table.
             file_path (Path): The path to the data file.
 
         Returns:
             None
         """
-        df.columns = [col.upper() for col in df.columns]
-        self.graph.add_node(table_name, columns=df.columns.tolist())
+        columns = [col.upper() for col in columns]
+        self.graph.add_node(table_name, columns=columns)
         self.table_paths[table_name] = file_path  # Store path
-        for col in df.columns:
+        for col in columns:
             self.graph.add_node(col)
             self.graph.add_edge(table_name, col)
 
+    def _load_schema_cache(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Loads the cached column names.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Modification time, size and column names by file path.
+        """
+        if self._schema_cache is None:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._schema_cache = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._schema_cache = {}
+        return self._schema_cache
+
+    def _save_schema_cache(self) -> None:
+        """
+        Saves the cached column names.
+
+        Returns:
+            None
+        """
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self._schema_cache, f)
+        temp_path.replace(self.cache_path)
+
     def get_table_paths(self) -> Dict[str, Path]:
         """
         Returns a dictionary of table names and their corresponding file paths.
@@ -66,21 +66,134 @@ Example usage
     df_bulk = nomis.bulk_download('NM_2072_1')
     print(df_bulk)
 
+    # Very large tables can be streamed to a Parquet file without holding the whole table in memory:
+    nomis.bulk_download('NM_2072_1', data_format='parquet', save_location='../nomis_download/')
+
     # And if you want just an extract for a specific geography, in our case England:
     geography = {'geography': ['E92000001']}  # you can extend this list
     df_england = nomis.download('NM_2072_1', params=geography)
     print(df_england)
 
+    # Several tables for the same geographies can be downloaded concurrently. By default only the geography, category, measure and value columns are downloaded:
+    tables = nomis.download_many(['NM_2021_1', 'NM_2072_1'], params=geography)  # {'NM_2021_1': df, 'NM_2072_1': df}
+    df_long = nomis.download_many(['NM_2021_1', 'NM_2072_1'], params=geography, output='long')  # one DataFrame with a 'dataset' column
+
+
+Geography types
+---------------
+
+Instead of listing hundreds of GSS codes, you can ask for all geographies of a type within a parent area with ``NomisGeography()``. The selector is translated to the Nomis ``<parent>TYPE<type>`` syntax, so the query fits in one short request. The geography type can be given as a Nomis type number or as (part of) its name, and the available types and parent ids are looked up from Nomis once and cached locally:
+
+.. code-block:: python
+
+    from Consensus.Nomis import DownloadFromNomis, NomisGeography
+
+    nomis = DownloadFromNomis()
+    nomis.geography_types('NM_2072_1')  # list the geography types available for the dataset
+    wards_in_lewisham = NomisGeography(type='wards', parent='E09000023')
+    df = nomis.download('NM_2072_1', params={'geography': [wards_in_lewisham]})
+
+
+Cached dataset catalogue
+------------------------
+
+The list of Nomis datasets (``def.sdmx.json``) is large, so ``connect()`` fetches it once and stores it locally with ``NomisCatalogue()``. The cached copy is reused for ``catalogue_ttl`` (by default one day), after which it is revalidated with the server using its ETag so that an unchanged catalogue is not downloaded again. If Nomis cannot be reached, the cached copy is used instead, so that metadata lookups work offline after the first connection:
+
+.. code-block:: python
+
+    nomis = DownloadFromNomis()
+    nomis.connect()  # downloads the catalogue the first time, then uses the cached copy
+    table = nomis.catalogue.get('NM_2072_1')  # dictionary lookup by dataset id
+    tenure_tables = nomis.catalogue.find('tenure')  # all tables with 'tenure' in their name
+
+To find datasets without knowing their exact names, use ``search_tables()``. It ranks the tables by how well their names, annotations and columns match the query (BM25 over a local inverted index, ``NomisSearchIndex()``), so that you do not need to scroll through the output of ``print_table_info()``:
+
+.. code-block:: python
+
+    for table in nomis.search_tables('census 2021 tenure households', limit=5):
+        table.table_shorthand()
+
+
+Local result cache
+------------------
+
+If the same queries are run repeatedly, pass a ``NomisResultCache()`` to ``DownloadFromNomis()``. Results are saved as Parquet files keyed by the dataset, parameters, selected columns and measures, and reused until they are older than ``ttl``. Queries for a subset of a cached result (for example fewer geographies, or any geographies of a cached bulk download) are answered from the cached result without contacting Nomis. The least recently used results are removed when the cache grows beyond ``max_size_bytes``:
+
+.. code-block:: python
+
+    from datetime import timedelta
+    from Consensus.Nomis import DownloadFromNomis, NomisResultCache
+
+    cache = NomisResultCache(ttl=timedelta(days=7), max_size_bytes=2 * 1024**3)
+    nomis = DownloadFromNomis(cache=cache)
+    df = nomis.download('NM_2072_1', params={'geography': ['E92000001']})  # downloaded
+    df = nomis.download('NM_2072_1', params={'geography': ['E92000001']})  # read from the cache
+
+
+Bulk-download-once mode
+-----------------------
+
+Census tables rarely change, so instead of querying Nomis for every extract you can download each table once with ``NomisBulkStore()``. The bulk table is kept in a local DuckDB database together with the date the table was last updated on Nomis, according to the catalogue. ``download()`` calls that filter by geography are then answered with SQL on the local table, and the table is only downloaded again when Nomis publishes an update:
+
+.. code-block:: python
+
+    from Consensus.Nomis import DownloadFromNomis, NomisBulkStore
+
+    nomis = DownloadFromNomis(bulk_store=NomisBulkStore())
+    nomis.connect()
+    df = nomis.download('NM_2072_1', params={'geography': ['E92000001']})  # downloads the bulk table once
+    df = nomis.download('NM_2072_1', params={'geography': ['E09000001']})  # answered locally
+
+
+Large extracts with ``AsyncDownloadFromNomis``
+----------------------------------------------
+
+Nomis caps the number of rows returned by a single request. ``AsyncDownloadFromNomis()`` pages through the result with the ``recordoffset`` and ``recordlimit`` parameters, requesting several pages in parallel, and assembles the pages in order. This is much faster than a bulk download for large geography extracts, such as all output areas in London:
+
+.. code-block:: python
+
+    import asyncio
+    from Consensus.Nomis import AsyncDownloadFromNomis
+
+    nomis = AsyncDownloadFromNomis(max_concurrent_requests=4)
+    geography = {'geography': london_output_areas}  # e.g. a list of OA21CD codes from SmartLinker()
+    df = asyncio.run(nomis.download('NM_2072_1', params=geography))
+
 
 """
 from pathlib import Path
-from requests import get as request_get
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout, RetryError
+from urllib3.util.retry import Retry
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Union
 from shutil import copyfileobj
+from io import BytesIO
+from copy import copy, deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from collections import Counter
+import csv
+import hashlib
+import json
+import tempfile
+import threading
+import math
+import re
+import asyncio
+import platform
+import aiohttp
+import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from Consensus.config_utils import load_config
 
+if platform.system() == 'Windows':
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
 
 class ConnectToNomis:
     """
@@ -92,17 +205,31 @@ class ConnectToNomis:
         uid (str): Attribute. Unique identifier for API calls using the API key.
         base_url (str): Attribute. Base URL for the NOMIS API.
         url (str): Attribute. Complete URL for API requests.
+        urls (List[str]): Attribute. URLs for a data query. Queries with more geographies than fit in ``max_url_length`` characters are split into several URLs.
         r (requests.Response): Attribute. Response object from API requests.
         config (dict): Attribute. Loaded configuration details from `Consensus.config_utils.load_config()`, including API key and proxies.
+        catalogue (NomisCatalogue): Attribute. Locally cached and indexed catalogue of NOMIS tables.
+        geography_hierarchy (NomisGeographyHierarchy): Attribute. Locally cached geography types and ids used to resolve ``NomisGeography()`` selectors.
+        session (requests.Session): Attribute. Shared HTTP session with the proxies, connection pool and retry policy used for all requests to NOMIS.
+        timeout (Tuple[float, float]): Attribute. Connect and read timeouts in seconds. The read timeout applies to each read of a streamed download, not to the whole download.
+        max_url_length (int): Class attribute. Maximum length of a data query URL.
     """
 
-    def __init__(self, api_key: str = None, proxies: Dict[str, str] = None):
+    max_url_length = 4000
+
+    def __init__(self, api_key: str = None, proxies: Dict[str, str] = None, cache_folder: str = None, catalogue_ttl: timedelta = timedelta(days=1),
+                 timeout: Tuple[float, float] = (10, 300), max_retries: int = 3, backoff_factor: float = 0.5):
         """
         Initialise ConnectToNomis with API key and proxies.
 
         Args:
             api_key (str): NOMIS API key. Defaults to None, in which case it loads from the config file.
             proxies (Dict[str, str]): Proxy addresses. Defaults to None, in which case it loads from the config file.
+            cache_folder (str): Folder for the locally cached NOMIS catalogue. Defaults to None, in which case the ``nomis_cache`` folder of the package is used.
+            catalogue_ttl (timedelta): How long the cached catalogue is used before it is revalidated with NOMIS. Defaults to one day.
+            timeout (Tuple[float, float]): Connect and read timeouts in seconds. Defaults to (10, 300).
+            max_retries (int): Number of retries for connection errors and 429 and 5xx responses. Defaults to 3.
+            backoff_factor (float): Exponential backoff factor between retries in seconds. Defaults to 0.5.
 
         Raises:
             AssertionError: If no API key is provided or found in the config.
@@ -115,15 +242,53 @@ class ConnectToNomis:
         self.uid = f"?uid={self.api_key}"  # This comes at the end of each API call
         self.base_url = "http://www.nomisweb.co.uk/api/v01/dataset/"
         self.url = None
+        self.urls = []
+        self.r = None
         self.proxies = proxies or self.config.get('proxies', {})
+        self.timeout = timeout
+        self.session = self._create_session(max_retries, backoff_factor)
+        self.catalogue = NomisCatalogue(self, cache_folder=cache_folder, ttl=catalogue_ttl)
+        self.geography_hierarchy = NomisGeographyHierarchy(self, cache_folder=cache_folder)
+
+    def _create_session(self, max_retries: int, backoff_factor: float) -> Session:
+        """
+        Create the shared HTTP session. Connections are kept alive and reused between requests, and failed requests are retried with exponential backoff, respecting the Retry-After header of 429 and 503 responses.
+
+        Args:
+            max_retries (int): Number of retries for connection errors and 429 and 5xx responses.
+            backoff_factor (float): Exponential backoff factor between retries in seconds.
+
+        Returns:
+            requests.Session: The session.
+        """
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET', 'HEAD'])
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=16)
+        session = Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.proxies.update({scheme: address for scheme, address in (self.proxies or {}).items() if address})
+        return session
+
+    def _get(self, url: str, **kwargs) -> Response:
+        """
+        Send a GET request through the shared session.
+
+        Args:
+            url (str): The URL.
+            **kwargs: Arbitrary keyword arguments passed to ``requests.Session.get()``, e.g. ``stream`` or ``headers``.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self.session.get(url, timeout=self.timeout, **kwargs)
 
     def url_creator(self, dataset: str, params: Dict[str, List[str]] = None, select_columns: List[str] = None) -> None:
         """
-        Create a URL string for data download from NOMIS.
+        Create a URL string for data download from NOMIS. If the geographies do not fit in one URL of ``max_url_length`` characters, they are split over several URLs, which are stored in ``urls``. ``url`` is the first of them.
 
         Args:
             dataset (str): Name of the dataset to download.
-            params (Dict[str, List[str]]): Dictionary of query parameters for filtering data. Defaults to None.
+            params (Dict[str, List[str]]): Dictionary of query parameters for filtering data. The geographies can be GSS codes, NOMIS geography ids or ``NomisGeography()`` selectors. Defaults to None.
             select_columns (List[str]): List of columns to select in the API response. Defaults to None.
 
         Raises:
@@ -135,48 +300,48 @@ class ConnectToNomis:
         """
         if not dataset:
             self.url = f"{self.base_url}def.sdmx.json{self.uid}"
+            self.urls = [self.url]
             return
 
         table_url = f"{self.base_url}{dataset}.data.csv?"
+        geography_terms = None
 
         if params:
             for keyword, qualifier_codes in params.items():
                 assert isinstance(qualifier_codes, list), "params should be of type Dict[str, List[str]]."
                 if keyword == 'geography':
-                    search_string = self._unpack_geography_list(qualifier_codes)
+                    qualifier_codes = [self.geography_hierarchy.selector(dataset, code) if isinstance(code, NomisGeography) else code for code in qualifier_codes]
+                    geography_terms = self._compress_geography(qualifier_codes)
                 else:
-                    search_string = ','.join(qualifier_codes)
-                table_url += f"{keyword}={search_string}&"
+                    table_url += f"{keyword}={','.join(qualifier_codes)}&"
 
         if select_columns:
             selection = 'select=' + ','.join(select_columns) + '&'
             table_url += selection
 
-        self.url = f"{table_url}{self.uid[1:]}".strip()
+        if geography_terms is None:
+            self.urls = [f"{table_url}{self.uid[1:]}".strip()]
+        else:
+            self.urls = [f"{table_url}geography={','.join(chunk)}&{self.uid[1:]}".strip() for chunk in self._split_terms(geography_terms, self.max_url_length - len(table_url) - len(self.uid) - len('geography=&'))]
+        self.url = self.urls[0]
 
     def connect(self, url: str = None) -> None:
         """
-        Connect to the NOMIS API and fetch table structures.
+        Connect to the NOMIS API and fetch table structures. Without a custom URL, the table structures are read from the locally cached catalogue, which is refreshed from NOMIS if it is older than ``catalogue_ttl``.
 
         Args:
             url (str): Custom URL for API connection. Defaults to None.
 
-        Raises:
-            KeyError: If proxies are not set and the connection fails without proxies.
-
         Returns:
             None
         """
-        if url:
-            self.url = url
-        else:
-            self.url_creator(dataset=None)
+        if not url:
+            self.catalogue.sync()
+            print("Connection successful.")
+            return
 
-        try:
-            self.r = request_get(self.url, proxies=self.proxies)
-        except KeyError:
-            print("Proxies not set, attempting to connect without proxies.")
-            self.r = request_get(self.url)
+        self.url = url
+        self.r = self._get(self.url)
 
         if self.r.status_code == 200:
             print("Connection successful.")
@@ -187,16 +352,10 @@ class ConnectToNomis:
         """
         Get all available tables from NOMIS.
 
-        Raises:
-            AssertionError: If the API connection was not successful.
-
         Returns:
             List[Any]: List of NOMIS tables.
         """
-        assert self.r.status_code == 200, "Connection not successful."
-        main_dict = self.r.json()
-        tables_data = main_dict['structure']['keyfamilies']['keyfamily']
-        return [NomisTable(**table) for table in tables_data]
+        return list(self.catalogue.tables.values())
 
     def print_table_info(self) -> None:
         """
@@ -209,6 +368,31 @@ class ConnectToNomis:
         for table in tables:
             table.table_shorthand()
 
+    def geography_types(self, dataset: str) -> Dict[int, str]:
+        """
+        Get the geography types available for a dataset.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+
+        Returns:
+            Dict[int, str]: NOMIS geography type numbers and their names.
+        """
+        return self.geography_hierarchy.types(dataset)
+
+    def search_tables(self, query: str, limit: int = 10) -> List[Any]:
+        """
+        Search the tables by keywords in their names, annotations and columns.
+
+        Args:
+            query (str): Space separated keywords.
+            limit (int): Maximum number of tables to return. Defaults to 10.
+
+        Returns:
+            List[Any]: List of NOMIS tables, best match first.
+        """
+        return self.catalogue.search(query, limit=limit)
+
     def detailed_info_for_table(self, table_name: str) -> None:
         """
         Print detailed information for a specific table.
@@ -245,10 +429,7 @@ class ConnectToNomis:
         Returns:
             Any: The matching NOMIS table.
         """
-        tables = self.get_all_tables()
-        for table in tables:
-            if table.id == table_name:
-                return table
+        return self.catalogue.get(table_name)
 
     def _geography_edges(self, nums: List[int]) -> List[Any]:
         """
@@ -265,41 +446,58 @@ class ConnectToNomis:
         edges = iter(nums[:1] + sum(gaps, []) + nums[-1:])
         return list(zip(edges, edges))
 
-    def _create_geography_e_code(self, val: int) -> str:
+    def _compress_geography(self, geographies: List[str]) -> List[str]:
         """
-        Create a nine-character GSS code.
+        Compress a list of geography codes into NOMIS ranges. GSS codes are grouped by their three-character entity prefix (e.g., E00, W01, S12) and consecutive codes within a group are written as 'first...last'. Other codes, such as NOMIS geography ids, ranges and geography types, are passed through unchanged.
 
         Args:
-            val (int): Value for the GSS code.
+            geographies (List[str]): List of geographical codes.
 
         Returns:
-            str: GSS code in the format 'Exxxxxxxx'.
+            List[str]: Codes and ranges for the URL, grouped by entity prefix.
         """
-        return f"E{val:08}"
+        numbers_by_prefix = {}
+        other_codes = []
+        for code in geographies:
+            code = str(code).strip()
+            match = re.fullmatch(r'([A-Z]\d{2})(\d{6})', code)
+            if match:
+                numbers_by_prefix.setdefault(match.group(1), []).append(int(match.group(2)))
+            elif code not in other_codes:
+                other_codes.append(code)
+
+        terms = []
+        for prefix, numbers in sorted(numbers_by_prefix.items()):
+            for start, end in self._geography_edges(numbers):
+                if start == end:
+                    terms.append(f"{prefix}{start:06}")
+                elif end - start == 1:
+                    terms.extend([f"{prefix}{start:06}", f"{prefix}{end:06}"])
+                else:
+                    terms.append(f"{prefix}{start:06}...{prefix}{end:06}")
+        return terms + other_codes
 
-    def _unpack_geography_list(self, geographies: List[str]) -> str:
+    @staticmethod
+    def _split_terms(terms: List[str], max_length: int) -> List[List[str]]:
         """
-        Unpack a list of GSS codes, find edges, and format them for a URL.
+        Split URL terms into groups whose comma-separated length is at most ``max_length``. A term longer than ``max_length`` gets a group of its own.
 
         Args:
-            geographies (List[str]): List of geographical codes (as GSS codes).
+            terms (List[str]): The terms to split.
+            max_length (int): Maximum length of each comma-separated group.
 
         Returns:
-            str: Formatted string for the URL.
+            List[List[str]]: The groups of terms, in order.
         """
-        edited_geo = [int(i[1:]) for i in sorted(geographies)]
-        edges_list = self._geography_edges(edited_geo)
-        list_to_concat = []
-
-        for edge in edges_list:
-            if edge[1] == edge[0]:
-                list_to_concat.append(self._create_geography_e_code(edge[0]))
-            elif edge[1] - edge[0] == 1:
-                list_to_concat.extend([self._create_geography_e_code(edge[0]), self._create_geography_e_code(edge[1])])
-            else:
-                list_to_concat.append(f"{self._create_geography_e_code(edge[0])}...{self._create_geography_e_code(edge[1])}")
-
-        return ','.join(list_to_concat)
+        chunks = [[]]
+        length = 0
+        for term in terms:
+            if chunks[-1] and length + 1 + len(term) > max_length:
+                chunks.append([])
+                length = 0
+            length += len(term) + (1 if chunks[-1] else 0)
+            chunks[-1].append(term)
+        return chunks
 
 
 class DownloadFromNomis(ConnectToNomis):
@@ -317,13 +515,17 @@ class DownloadFromNomis(ConnectToNomis):
         url (str): Complete URL for API requests.
         r (requests.Response): Response object from API requests.
         config (dict): Loaded configuration details, including API key and proxies.
+        max_concurrent_urls (int): Class attribute. Maximum number of concurrent requests when a query is split over several URLs.
+        cache (NomisResultCache): Optional local cache of downloaded results.
+        bulk_store (NomisBulkStore): Optional local store of bulk downloaded tables used to answer geography queries.
 
     Methods:
-        __init__(*args, **kwargs): Initializes the ``DownloadFromNomis()`` instance.
+        __init__(*args, cache: NomisResultCache = None, bulk_store: NomisBulkStore = None, **kwargs): Initializes the ``DownloadFromNomis()`` instance.
         _bulk_download_url(dataset: str): Creates a URL for bulk downloading a dataset.
         _download_checks(dataset: str, params: Dict[str, List], value_or_percent: str, table_columns: List[str]): Prepares the parameters and URL for downloading data.
         table_to_csv(dataset: str, params: Dict[str, List] = None, file_name: str = None, table_columns: List[str] = None, save_location: str = '../nomis_download/', value_or_percent: str = None): Downloads a dataset as a CSV file.
         bulk_download(dataset: str, save_location: str = '../nomis_download/'): Downloads a dataset as a Pandas DataFrame.
+        download_many(datasets: List[str], params: Dict[str, List] = None, select: Union[str, List[str]] = 'default', value_or_percent: str = None, max_workers: int = 8, output: str = 'dict'): Downloads several datasets for the same parameters concurrently.
 
     Usage:
 
@@ -371,15 +573,21 @@ class DownloadFromNomis(ConnectToNomis):
             df = self.conn.download('NM_2072_1', params=geography)
     """
 
-    def __init__(self, *args, **kwargs):
+    max_concurrent_urls = 4
+
+    def __init__(self, *args, cache: 'NomisResultCache' = None, bulk_store: 'NomisBulkStore' = None, **kwargs):
         """
         Initialises the ``DownloadFromNomis()`` instance.
 
         Args:
             *args: Variable length argument list passed to the parent class.
+            cache (NomisResultCache): Local cache of downloaded results. Defaults to None, in which case every download goes to NOMIS.
+            bulk_store (NomisBulkStore): Local store of bulk downloaded tables. When given, ``download()`` queries that only filter by GSS codes are answered from the store, and each table is bulk downloaded once per update on NOMIS. Defaults to None.
             **kwargs: Arbitrary keyword arguments passed to the parent class.
         """
         super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.bulk_store = bulk_store
 
     def _bulk_download_url(self, dataset: str) -> None:
         """
@@ -392,8 +600,9 @@ class DownloadFromNomis(ConnectToNomis):
             None
         """
         self.url = f"{self.base_url}{dataset}.bulk.csv{self.uid}"
+        self.urls = [self.url]
 
-    def _download_checks(self, dataset: str, params: Dict['str', List], value_or_percent: str, table_columns: List[str]) -> None:
+    def _download_checks(self, dataset: str, params: Dict['str', List], value_or_percent: str, table_columns: List[str]) -> Dict[str, List]:
         """
         Prepares the parameters and URL for downloading data.
 
@@ -404,10 +613,9 @@ class DownloadFromNomis(ConnectToNomis):
             table_columns (List[str]): List of columns to include in the query.
 
         Returns:
-            None
+            Dict[str, List]: The parameters of the query, including the measures selected by ``value_or_percent``. A copy, so the caller's dictionary is not changed.
         """
-        if params is None:
-            params = {'geography': None}
+        params = dict(params) if params is not None else {'geography': None}
 
         if value_or_percent == 'percent':
             params['measures'] = ['20301']
@@ -415,6 +623,7 @@ class DownloadFromNomis(ConnectToNomis):
             params['measures'] = ['20100']
 
         self.url_creator(dataset, params, table_columns)
+        return params
 
     def table_to_csv(self, dataset: str, params: Dict[str, List] = None, file_name: str = None, table_columns: List[str] = None, save_location: str = '../nomis_download/', value_or_percent: str = None) -> None:
         """
@@ -440,16 +649,19 @@ class DownloadFromNomis(ConnectToNomis):
         save_path.mkdir(parents=True, exist_ok=True)
 
         file_name = save_path.joinpath(file_name)
-        self._download_file(file_name)
+        if len(self.urls) > 1:
+            self._download_urls_to_pandas().to_csv(file_name, index=False)
+        else:
+            self._download_file(file_name)
 
     def bulk_download(self, dataset: str, data_format: str = 'pandas', save_location: str = '../nomis_download/') -> pd.DataFrame:
         """
-        Performs a bulk download of a dataset as either CSV or a Pandas DataFrame.
+        Performs a bulk download of a dataset as either CSV, Parquet or a Pandas DataFrame. Parquet files are written one row group at a time while the CSV is streamed, so that tables larger than the available memory can be downloaded.
 
         Args:
             dataset (str): The dataset identifier (e.g., NM_2021_1).
-            data_format (str): Format of the downloaded data. Can be 'csv', 'download', 'pandas', or 'df'. Defaults to 'pandas'.
-            save_location (str): Directory to save the CSV file if `data_format` is 'csv'. Defaults to '../nomis_download/'.
+            data_format (str): Format of the downloaded data. Can be 'csv', 'download', 'parquet', 'pandas', or 'df'. Defaults to 'pandas'.
+            save_location (str): Directory to save the file if `data_format` is 'csv' or 'parquet'. Defaults to '../nomis_download/'.
 
         Raises:
             AssertionError: If data_format is not in the specified format
@@ -458,16 +670,27 @@ class DownloadFromNomis(ConnectToNomis):
             pd.DataFrame: The downloaded data as a Pandas DataFrame if `data_format` is 'pandas'.
         """
         self._bulk_download_url(dataset)
-        assert data_format in ['csv', 'download', 'pandas', 'df'], 'Data format must be one of "csv" (or "download") or "pandas" (or "df").'
+        assert data_format in ['csv', 'download', 'parquet', 'pandas', 'df'], 'Data format must be one of "csv" (or "download"), "parquet" or "pandas" (or "df").'
 
-        if data_format in ['csv', 'download']:
-            file_name = f"{dataset}_bulk.csv"
+        if data_format in ['csv', 'download', 'parquet']:
+            file_extension = 'parquet' if data_format == 'parquet' else 'csv'
+            file_name = f"{dataset}_bulk.{file_extension}"
             save_path = Path(save_location)
             save_path.mkdir(parents=True, exist_ok=True)
             file_name = save_path.joinpath(file_name)
-            self._download_file(file_name)
+            if data_format == 'parquet':
+                self._download_to_parquet(file_name)
+            else:
+                self._download_file(file_name)
         elif data_format in ['pandas', 'df']:
-            return self._download_to_pandas()
+            if self.cache is not None:
+                cached = self.cache.get(dataset, bulk=True)
+                if cached is not None:
+                    return cached
+            df = self._download_to_pandas()
+            if self.cache is not None and not df.empty:
+                self.cache.put(dataset, df, bulk=True)
+            return df
 
     def download(self, dataset: str, params: Dict[str, List] = None, table_columns: List[str] = None, value_or_percent: str = None) -> pd.DataFrame:
         """
@@ -482,16 +705,129 @@ class DownloadFromNomis(ConnectToNomis):
         Returns:
             pd.DataFrame: The downloaded data as a Pandas DataFrame.
         """
-        self._download_checks(dataset, params, value_or_percent, table_columns)
-        df = self._download_to_pandas()
+        if self.bulk_store is not None and self.bulk_store.can_answer(params, table_columns, value_or_percent):
+            return self._download_from_bulk_store(dataset, params)
+
+        params = self._download_checks(dataset, params, value_or_percent, table_columns)
+        if self.cache is not None:
+            cached = self.cache.get(dataset, params, table_columns)
+            if cached is not None:
+                return cached
+
+        df = self._download_urls_to_pandas()
 
         if not df.empty:
+            if self.cache is not None:
+                self.cache.put(dataset, df, params, table_columns)
             return df
         else:
             print('Trying to download the data using the bulk_download() method instead. ')
-            print('Filtering to only relevant geographies. Other parameters untouched.')
             df = self.bulk_download(dataset)
-            return df[df['geography code'].isin(params['geography'])]
+            geographies = params.get('geography') or []
+            if not all(isinstance(code, str) and re.fullmatch(r'[A-Z]\d{8}', code) for code in geographies):
+                # NOMIS geography ids and NomisGeography() or TYPE selectors cannot be matched against the geography code column of the bulk table
+                print('Warning: the geographies are not all GSS codes, returning all geographies. Other parameters untouched.')
+                return df
+            print('Filtering to only relevant geographies. Other parameters untouched.')
+            return df[df['geography code'].isin(geographies)] if geographies else df
+
+    def download_many(self, datasets: List[str], params: Dict[str, List] = None, select: Union[str, List[str]] = 'default', value_or_percent: str = None,
+                      max_workers: int = 8, output: str = 'dict') -> Union[Dict[str, pd.DataFrame], pd.DataFrame]:
+        """
+        Downloads several datasets for the same parameters concurrently.
+
+        Args:
+            datasets (List[str]): The dataset identifiers (e.g., ['NM_2021_1', 'NM_2072_1']).
+            params (Dict[str, List]): Dictionary of parameters used for every dataset (e.g., {'geography': ['E00016136']}). Defaults to None.
+            select (Union[str, List[str]]): Columns to download. 'default' selects the date, geography code and name, the category names, the measure name and the value of each dataset, based on its dimensions in the catalogue. None downloads all columns. A list of columns is used for every dataset. Defaults to 'default'.
+            value_or_percent (str): Specifies whether to download 'value' or 'percent'. Defaults to None.
+            max_workers (int): Maximum number of datasets downloaded at the same time. Defaults to 8.
+            output (str): 'dict' returns a dictionary of DataFrames by dataset. 'long' returns one DataFrame with a 'dataset' column, in which columns missing from a dataset are empty. Defaults to 'dict'.
+
+        Raises:
+            AssertionError: If output is not 'dict' or 'long'.
+
+        Returns:
+            Union[Dict[str, pd.DataFrame], pd.DataFrame]: The downloaded datasets.
+        """
+        assert output in ['dict', 'long'], 'output must be "dict" or "long".'
+        datasets = list(dict.fromkeys(datasets))
+        if select == 'default' or self.bulk_store is not None:
+            try:
+                self.catalogue.sync()
+            except ConnectionError:
+                print('Could not load the NOMIS catalogue, downloading all columns.')
+
+        def download_dataset(dataset: str) -> pd.DataFrame:
+            worker = self._worker()
+            dataset_params = deepcopy(params)
+            if select == 'default':
+                table_columns = None if self.bulk_store is not None and self.bulk_store.can_answer(dataset_params, None, value_or_percent) else self._default_select(dataset)
+            else:
+                table_columns = select
+            return worker.download(dataset, params=dataset_params, table_columns=table_columns, value_or_percent=value_or_percent)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(datasets)))) as executor:
+            frames = dict(zip(datasets, executor.map(download_dataset, datasets)))
+
+        if output == 'dict':
+            return frames
+        return pd.concat([df.assign(dataset=dataset)[['dataset'] + list(df.columns)] for dataset, df in frames.items()], ignore_index=True)
+
+    def _worker(self) -> 'DownloadFromNomis':
+        """
+        Returns a downloader for one thread of ``download_many()``. It has its own URL state and its own view of the catalogue, so that the URLs of one dataset are not overwritten by another and catalogue requests do not change this instance. The session, the catalogue tables and lock, the geography hierarchy, the result cache and the bulk store are shared.
+
+        Returns:
+            DownloadFromNomis: The downloader.
+        """
+        worker = copy(self)
+        worker.url, worker.urls, worker.r = None, [], None
+        worker.catalogue = copy(self.catalogue)
+        worker.catalogue.connection = worker
+        return worker
+
+    def _default_select(self, dataset: str) -> Optional[List[str]]:
+        """
+        Returns the default columns of a dataset: the date, geography code and name, the names of the categories, the measure name and the value.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+
+        Returns:
+            Optional[List[str]]: The columns, or None if the dataset is not in the loaded catalogue.
+        """
+        table = self.catalogue.tables.get(dataset)
+        if table is None:
+            return None
+        categories = [f"{column}_NAME" for column, _ in table.get_table_cols() if column not in ('GEOGRAPHY', 'MEASURES', 'FREQ')]
+        return ['DATE', 'GEOGRAPHY_CODE', 'GEOGRAPHY_NAME'] + categories + ['MEASURES_NAME', 'OBS_VALUE']
+
+    def _download_from_bulk_store(self, dataset: str, params: Dict[str, List] = None) -> pd.DataFrame:
+        """
+        Answers a geography query from the bulk store, bulk downloading the table first if it is not in the store or NOMIS has updated it since.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            params (Dict[str, List]): Dictionary of parameters with at most a 'geography' key. Defaults to None.
+
+        Returns:
+            pd.DataFrame: The rows of the bulk table for the requested geographies, or all rows if no geographies were given.
+        """
+        try:
+            self.catalogue.sync()
+            table = self.catalogue.get(dataset)
+            last_updated = table.last_updated() if table else None
+        except ConnectionError:
+            last_updated = None  # offline without a cached catalogue, use whatever is in the store
+
+        if not self.bulk_store.is_current(dataset, last_updated):
+            with tempfile.TemporaryDirectory() as temp_folder:
+                self.bulk_download(dataset, data_format='parquet', save_location=temp_folder)
+                self.bulk_store.load_parquet(dataset, Path(temp_folder) / f"{dataset}_bulk.parquet", last_updated)
+
+        geographies = (params or {}).get('geography')
+        return self.bulk_store.query(dataset, geographies)
 
     def _download_file(self, file_path: Path) -> None:
         """
@@ -503,116 +839,1391 @@ class DownloadFromNomis(ConnectToNomis):
         Returns:
             None
         """
+        with self._get(self.url, stream=True) as response:
+            response.raise_for_status()
+            with open(file_path, 'wb') as file:
+                copyfileobj(response.raw, file)
 
-        try:
-            with request_get(self.url, proxies=self.proxies, stream=True) as response:
-                with open(file_path, 'wb') as file:
-                    copyfileobj(response.raw, file)
-        except AttributeError:
-            with request_get(self.url, stream=True) as response:
-                with open(file_path, 'wb') as file:
-                    copyfileobj(response.raw, file)
+    def _download_urls_to_pandas(self) -> pd.DataFrame:
+        """
+        Downloads the query in ``urls`` into a Pandas DataFrame. Queries that were split over several URLs are downloaded concurrently, up to ``max_concurrent_urls`` at a time, and concatenated in order.
+
+        Returns:
+            pd.DataFrame: The downloaded data as a Pandas DataFrame. Empty if any of the URLs failed.
+        """
+        if len(self.urls) <= 1:
+            return self._download_to_pandas()
 
-    def _download_to_pandas(self) -> pd.DataFrame:
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrent_urls, len(self.urls))) as executor:
+            parts = list(executor.map(self._download_to_pandas, self.urls))
+        if any(part.empty for part in parts):
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    def _download_to_pandas(self, url: str = None) -> pd.DataFrame:
         """
-        Downloads data directly into a Pandas DataFrame.
+        Downloads data directly into a Pandas DataFrame. The CSV is parsed incrementally with pyarrow and text columns, such as geography names and codes and category labels, are returned as categorical columns.
+
+        Args:
+            url (str): The URL to download. Defaults to None, in which case ``url`` is used.
 
         Returns:
             pd.DataFrame: The downloaded data as a Pandas DataFrame.
         """
+        url = url or self.url
         try:
-            with request_get(self.url, proxies=self.proxies, stream=True) as response:
-                return pd.read_csv(response.raw)
-        except AttributeError:
-            with request_get(self.url, stream=True) as response:
-                return pd.read_csv(response.raw)
+            with self._get(url, stream=True) as response:
+                response.raise_for_status()
+                return self._csv_stream_to_pandas(response.raw)
         except Exception as e:
-            print(self.url)
+            print(url)
             print(e)
             return pd.DataFrame()
 
+    def _download_to_parquet(self, file_path: Path, block_size: int = 1 << 24) -> None:
+        """
+        Streams the CSV to a Parquet file, writing one row group per block of CSV so that memory use does not grow with the size of the table.
 
-@dataclass
-class NomisTable:
-    """
-    A dataclass representing a structured output from NOMIS.
+        Args:
+            file_path (Path): The file path where the Parquet file will be saved.
+            block_size (int): Number of bytes of CSV parsed per row group. Defaults to 16 MB.
 
-    This class is designed to encapsulate the metadata and structure of a table retrieved from the NOMIS API.
-    It provides methods for accessing detailed descriptions, annotations, and column information in a readable format.
+        Returns:
+            None
+        """
+        with self._get(self.url, stream=True) as response:
+            response.raise_for_status()
+            self._csv_stream_to_parquet(response.raw, file_path, block_size)
 
-    Attributes:
-        agencyid (str): The ID of the agency that owns the table.
-        annotations (Dict[str, Any]): A dictionary containing annotations related to the table.
-        id (str): The unique identifier of the table.
-        components (Dict[str, Any]): A dictionary containing information about the components (columns) of the table.
-        name (Dict[str, Any]): A dictionary containing the name of the table.
-        uri (str): The URI that links to more information about the table.
-        version (str): The version number of the table.
-        description (Optional[str]): An optional description of the table.
-    """
+    def _csv_stream_to_pandas(self, stream: Any, block_size: int = 1 << 24) -> pd.DataFrame:
+        """
+        Parses a CSV stream into a Pandas DataFrame with categorical text columns.
 
-    agencyid: str
-    annotations: Dict[str, Any]
-    id: str
-    components: Dict[str, Any]
-    name: Dict[str, Any]
-    uri: str
-    version: str
-    description: Optional[str] = None
+        Args:
+            stream (Any): File-like object with the CSV data.
+            block_size (int): Number of bytes of CSV parsed at a time. Defaults to 16 MB.
 
-    def detailed_description(self) -> None:
+        Returns:
+            pd.DataFrame: The data as a Pandas DataFrame.
         """
-        Prints a detailed and cleaned overview of the table, including its ID, description, annotations, and columns.
+        schema, batches = self._read_csv_batches(stream, block_size)
+        return pa.Table.from_batches(list(batches), schema=schema).to_pandas()
+
+    def _csv_stream_to_parquet(self, stream: Any, file_path: Path, block_size: int = 1 << 24) -> None:
+        """
+        Writes a CSV stream to a Parquet file one row group at a time. The file is written to a temporary path first so that an interrupted download does not leave a partial file behind.
+
+        Args:
+            stream (Any): File-like object with the CSV data.
+            file_path (Path): The file path where the Parquet file will be saved.
+            block_size (int): Number of bytes of CSV parsed per row group. Defaults to 16 MB.
 
         Returns:
             None
         """
-        print(f"\nTable ID: {self.id}\n")
-        print(f"Table Description: {self.name['value']}\n")
-        for table_annotation in self.clean_annotations():
-            print(table_annotation)
-        print("\n")
-        for column_codes in self.table_cols():
-            print(column_codes)
+        file_path = Path(file_path)
+        temp_path = file_path.with_suffix('.parquet.tmp')
+        try:
+            schema, batches = self._read_csv_batches(stream, block_size)
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+            temp_path.replace(file_path)
+        finally:
+            temp_path.unlink(missing_ok=True)  # only left behind if the stream failed part way
+
+    def _read_csv_batches(self, stream: Any, block_size: int) -> Tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+        """
+        Opens an incremental pyarrow CSV reader on the stream. The column types are set from the header instead of being inferred from the first block, because a later block can contradict the inferred type (e.g., a code column that is numeric in the first block). Value columns (``OBS_VALUE`` and the ``measures:`` columns of bulk downloads) are read as floats and all other columns as text. Text columns are dictionary encoded, which stores repeated geography and category labels only once per batch.
 
-    def clean_annotations(self) -> List[str]:
+        Args:
+            stream (Any): File-like object with the CSV data.
+            block_size (int): Number of bytes of CSV parsed at a time.
+
+        Returns:
+            Tuple[pa.Schema, Iterator[pa.RecordBatch]]: The schema of the batches and an iterator over the dictionary encoded batches.
         """
-        Cleans the annotations for more readable presentation and returns them as a list of strings.
+        header = stream.readline().decode('utf-8-sig').rstrip('\r\n')
+        column_names = next(csv.reader([header])) if header else []
+        column_types = {name: pa.float64() if self._is_value_column(name) else pa.string() for name in column_names}
+        reader = pa_csv.open_csv(stream, read_options=pa_csv.ReadOptions(block_size=block_size, column_names=column_names),
+                                 convert_options=pa_csv.ConvertOptions(column_types=column_types))
+        text_columns = [i for i, field in enumerate(reader.schema) if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)]
+        schema = reader.schema
+        for i in text_columns:
+            schema = schema.set(i, pa.field(schema.field(i).name, pa.dictionary(pa.int32(), schema.field(i).type)))
+
+        def dictionary_encoded_batches() -> Iterator[pa.RecordBatch]:
+            for batch in reader:
+                columns = [column.dictionary_encode() if i in text_columns else column for i, column in enumerate(batch.columns)]
+                yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+        return schema, dictionary_encoded_batches()
+
+    @staticmethod
+    def _is_value_column(name: str) -> bool:
+        """
+        Checks whether a CSV column holds the observation values of a NOMIS table.
+
+        Args:
+            name (str): The column name.
 
         Returns:
-            List[str]: List of cleaned annotations
+            bool: True for ``OBS_VALUE``, ``RECORD_OFFSET`` and ``RECORD_COUNT`` and for the ``measures:`` columns of bulk downloads.
         """
-        annotation_list = self.annotations['annotation']
-        cleaned_annotations = []
-        for item in annotation_list:
-            text_per_line = f"{item['annotationtitle']}: {item['annotationtext']}"
-            cleaned_annotations.append(text_per_line)
-        return cleaned_annotations
+        return name.upper() in ('OBS_VALUE', 'RECORD_OFFSET', 'RECORD_COUNT') or 'measures:' in name.lower()
 
-    def table_cols(self) -> List[str]:
+
+class AsyncDownloadFromNomis(DownloadFromNomis):
+    """
+    Asynchronous variant of ``DownloadFromNomis()`` that pages through large results in parallel.
+
+    Nomis limits the number of rows returned by a single request. Instead of falling back to a bulk download of the whole dataset, this class requests the result in pages of ``record_limit`` rows using the ``recordoffset`` and ``recordlimit`` parameters. Up to ``max_concurrent_requests`` pages are requested at a time and the pages are assembled in order.
+
+    Attributes:
+        max_concurrent_requests (int): The maximum number of pages requested at the same time.
+        record_limit (int): The number of rows per page.
+
+    Methods:
+        download(dataset: str, params: Dict[str, List], table_columns: List[str], value_or_percent: str): Downloads a dataset as a Pandas DataFrame, one page at a time.
+
+    Usage:
+
+        .. code-block:: python
+
+            import asyncio
+            from Consensus.Nomis import AsyncDownloadFromNomis
+
+            async def get_data():
+                nomis = AsyncDownloadFromNomis(max_concurrent_requests=4)
+                return await nomis.download('NM_2072_1', params={'geography': ['E92000001']})
+
+            df = asyncio.run(get_data())
+    """
+
+    def __init__(self, *args, max_concurrent_requests: int = 4, record_limit: int = 25000, **kwargs) -> None:
         """
-        Cleans and returns the column information for the table in a readable format.
+        Initialises the ``AsyncDownloadFromNomis()`` instance.
 
-        Returns:
-            List[str]: A list of column descriptions as strings
+        Args:
+            *args: Variable length argument list passed to the parent class.
+            max_concurrent_requests (int): The maximum number of pages requested at the same time. Defaults to 4.
+            record_limit (int): The number of rows per page. Defaults to 25000.
+            **kwargs: Arbitrary keyword arguments passed to the parent class.
         """
-        columns = self.components['dimension']
-        col_descriptions_and_codes = []
-        for col in columns:
-            text_per_line = f"Column: {col['conceptref']}, column code: {col['codelist']}"
-            col_descriptions_and_codes.append(text_per_line)
-        return col_descriptions_and_codes
+        super().__init__(*args, **kwargs)
+        assert max_concurrent_requests > 0, "max_concurrent_requests must be a positive integer"
+        assert record_limit > 0, "record_limit must be a positive integer"
+        self.max_concurrent_requests = max_concurrent_requests
+        self.record_limit = record_limit
 
-    def get_table_cols(self) -> List[Tuple[str, str]]:
+    async def download(self, dataset: str, params: Dict[str, List] = None, table_columns: List[str] = None, value_or_percent: str = None) -> pd.DataFrame:
         """
-        Returns a list of tuples, where each tuple contains a column code and its corresponding description.
+        Downloads a dataset as a Pandas DataFrame, requesting the pages of the result in parallel.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            params (Dict[str, List]): Dictionary of parameters (e.g., {'geography': ['E00016136'], 'age': [0, 2, 3]}). Defaults to None.
+            table_columns (List[str]): List of columns to include in the dataset. Defaults to None.
+            value_or_percent (str): Specifies whether to download 'value' or 'percent'. Defaults to None.
 
         Returns:
-            List[Tuple[str, str]]: A list of tuples of columns
+            pd.DataFrame: The downloaded data as a Pandas DataFrame.
         """
-        columns = self.components['dimension']
-        list_of_columns = [(col['conceptref'], col['codelist']) for col in columns]
-        return list_of_columns
+        if self.bulk_store is not None and self.bulk_store.can_answer(params, table_columns, value_or_percent):
+            return await asyncio.to_thread(self._download_from_bulk_store, dataset, params)
+
+        params = self._download_checks(dataset, params, value_or_percent, table_columns)
+        if self.cache is not None:
+            cached = self.cache.get(dataset, params, table_columns)
+            if cached is not None:
+                return cached
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            # queries split over several URLs share the same concurrency limit
+            results = await asyncio.gather(*[self._download_pages(session, semaphore, url) for url in self.urls])
+
+        df = pd.concat([page for pages in results for page in pages], ignore_index=True)
+        if self.cache is not None and not df.empty:
+            self.cache.put(dataset, df, params, table_columns)
+        return df
+
+    async def _download_pages(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, url: str) -> List[pd.DataFrame]:
+        """
+        Downloads all pages of the result of a URL, requesting ``max_concurrent_requests`` pages at a time until a page is not full.
+
+        Args:
+            session (aiohttp.ClientSession): The aiohttp session.
+            semaphore (asyncio.Semaphore): Semaphore limiting the number of concurrent requests.
+            url (str): The URL of the query.
+
+        Returns:
+            List[pd.DataFrame]: The pages in order.
+        """
+        pages = [await self._fetch_page(session, semaphore, url, 0)]
+        offset = self.record_limit
+        while len(pages[-1]) == self.record_limit:
+            # the previous page was full, so request the next window of pages in parallel
+            offsets = [offset + i * self.record_limit for i in range(self.max_concurrent_requests)]
+            window = await asyncio.gather(*[self._fetch_page(session, semaphore, url, page_offset) for page_offset in offsets])
+            for page in window:
+                pages.append(page)
+                if len(page) < self.record_limit:
+                    break
+            offset += len(offsets) * self.record_limit
+        return pages
+
+    async def _fetch_page(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, url: str, offset: int) -> pd.DataFrame:
+        """
+        Downloads a single page of the result. Connection errors, timeouts and 429 and 5xx responses are retried with exponential backoff, using the retry settings of the shared session. The page is parsed with the same header typed CSV reader as ``DownloadFromNomis()``, so that the columns have the same types.
+
+        Args:
+            session (aiohttp.ClientSession): The aiohttp session.
+            semaphore (asyncio.Semaphore): Semaphore limiting the number of concurrent requests.
+            url (str): The URL of the query.
+            offset (int): The number of rows to skip.
+
+        Raises:
+            aiohttp.ClientResponseError: If NOMIS answers with an error that is not retried, or the retries are exhausted.
+
+        Returns:
+            pd.DataFrame: The page as a Pandas DataFrame. Empty if there are no more rows.
+        """
+        page_url = f"{url}&recordoffset={offset}&recordlimit={self.record_limit}"
+        retry = self.session.get_adapter(page_url).max_retries
+        for attempt in range(retry.total + 1):
+            try:
+                async with semaphore:
+                    print(f"Downloading rows {offset}-{offset + self.record_limit}")
+                    async with session.get(page_url, proxy=self.proxies.get('http') or None) as response:
+                        response.raise_for_status()
+                        content = await response.read()
+                break
+            except aiohttp.ClientResponseError as e:
+                if e.status not in retry.status_forcelist or attempt == retry.total:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == retry.total:
+                    raise
+            await asyncio.sleep(retry.backoff_factor * 2 ** attempt)
+
+        if not content.strip():
+            return pd.DataFrame()
+        return self._csv_stream_to_pandas(BytesIO(content))
+
+
+@dataclass(frozen=True)
+class NomisGeography:
+    """
+    Selector for all geographies of a type, optionally within a parent area.
+
+    Translated to the NOMIS ``TYPE<type>`` or ``<parent>TYPE<type>`` geography syntax when the URL is created, so that e.g. all wards in a local authority can be requested without listing their codes.
+
+    Attributes:
+        type (Union[int, str]): NOMIS geography type number (e.g., 464 or 'TYPE464') or a unique part of its name (e.g., 'wards').
+        parent (Optional[str]): GSS code or NOMIS geography id of the parent area. Defaults to None, in which case all geographies of the type are selected.
+    """
+
+    type: Union[int, str]
+    parent: Optional[str] = None
+
+
+class NomisGeographyHierarchy:
+    """
+    Locally cached NOMIS geography types and geography ids.
+
+    Resolves ``NomisGeography()`` selectors to the NOMIS ``<parent>TYPE<type>`` syntax. The geography types of each dataset and the NOMIS ids of parent areas in each dataset are requested from NOMIS once and saved in ``geography.json`` in the cache folder. Ids are cached per dataset because they depend on the geography vintage of the dataset. The cache is only read and changed while holding a lock, so that it can be shared between threads.
+
+    Attributes:
+        connection (ConnectToNomis): The connection whose API key and proxies are used.
+        cache_path (Path): Path of the cached hierarchy.
+
+    Methods:
+        types(dataset: str): Returns the geography types available for a dataset.
+        type_number(dataset: str, geography_type: Union[int, str]): Returns the NOMIS type number for a type number or name.
+        geography_id(dataset: str, code: str): Returns the NOMIS geography id for a GSS code in a dataset.
+        selector(dataset: str, geography: NomisGeography): Returns the NOMIS geography syntax for a selector.
+    """
+
+    def __init__(self, connection: ConnectToNomis, cache_folder: str = None) -> None:
+        """
+        Initialise NomisGeographyHierarchy.
+
+        Args:
+            connection (ConnectToNomis): The connection whose API key and proxies are used.
+            cache_folder (str): Folder for the cached hierarchy. Defaults to None, in which case the ``nomis_cache`` folder of the package is used.
+        """
+        self.connection = connection
+        cache_folder = Path(cache_folder) if cache_folder else Path(__file__).resolve().parent / 'nomis_cache'
+        self.cache_path = cache_folder / 'geography.json'
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def types(self, dataset: str) -> Dict[int, str]:
+        """
+        Returns the geography types available for a dataset.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+
+        Returns:
+            Dict[int, str]: NOMIS geography type numbers and their names.
+        """
+        with self._lock:
+            types = self._load()['types'].get(dataset)
+        if types is None:
+            codes = self._request_codelist(f"{self.connection.base_url}{dataset}/geography/TYPE.def.sdmx.json{self.connection.uid}")
+            types = {str(self._type_number(code['value'])): code['description']['value'] for code in codes}
+            with self._lock:
+                self._load()['types'][dataset] = types
+                self._save()
+        return {int(number): name for number, name in types.items()}
+
+    def type_number(self, dataset: str, geography_type: Union[int, str]) -> int:
+        """
+        Returns the NOMIS type number for a type number or name.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            geography_type (Union[int, str]): NOMIS geography type number (e.g., 464 or 'TYPE464') or a unique part of its name.
+
+        Raises:
+            ValueError: If the name matches no geography type or several geography types.
+
+        Returns:
+            int: The NOMIS type number.
+        """
+        if isinstance(geography_type, int) or re.fullmatch(r'(TYPE)?\d+', str(geography_type).upper()):
+            return self._type_number(geography_type)
+
+        types = self.types(dataset)
+        name = geography_type.lower()
+        matches = [number for number, type_name in types.items() if type_name.lower() == name] or [number for number, type_name in types.items() if name in type_name.lower()]
+        if len(matches) != 1:
+            candidates = ', '.join(f"{number}: {types[number]}" for number in matches) if matches else ', '.join(f"{number}: {type_name}" for number, type_name in types.items())
+            raise ValueError(f"Geography type '{geography_type}' matches {len(matches)} geography types of {dataset}. Use one of the type numbers: {candidates}")
+        return matches[0]
+
+    def geography_id(self, dataset: str, code: str) -> str:
+        """
+        Returns the NOMIS geography id for a GSS code in a dataset. NOMIS ids are returned unchanged.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            code (str): GSS code or NOMIS geography id.
+
+        Raises:
+            ValueError: If NOMIS does not know the code.
+
+        Returns:
+            str: The NOMIS geography id.
+        """
+        code = str(code).strip()
+        if code.isdigit():
+            return code
+        with self._lock:
+            geography_id = self._load()['ids'].get(dataset, {}).get(code)
+        if geography_id is None:
+            codes = self._request_codelist(f"{self.connection.base_url}{dataset}/geography/{code}.def.sdmx.json{self.connection.uid}")
+            if not codes:
+                raise ValueError(f"NOMIS does not have a geography with the code {code} in {dataset}.")
+            geography_id = str(codes[0]['value'])
+            with self._lock:
+                self._load()['ids'].setdefault(dataset, {})[code] = geography_id
+                self._save()
+        return geography_id
+
+    def selector(self, dataset: str, geography: NomisGeography) -> str:
+        """
+        Returns the NOMIS geography syntax for a selector.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            geography (NomisGeography): The selector.
+
+        Returns:
+            str: 'TYPE<type>' or '<parent id>TYPE<type>'.
+        """
+        type_code = f"TYPE{self.type_number(dataset, geography.type)}"
+        if geography.parent is None:
+            return type_code
+        return f"{self.geography_id(dataset, geography.parent)}{type_code}"
+
+    def _request_codelist(self, url: str) -> List[Dict[str, Any]]:
+        """
+        Requests a NOMIS codelist.
+
+        Args:
+            url (str): The URL of the codelist.
+
+        Returns:
+            List[Dict[str, Any]]: The codes of the codelist. Empty if the codelist has no codes.
+        """
+        response = self.connection._get(url)
+        assert response.status_code == 200, f"Could not get {url.split('?')[0]} from NOMIS."
+        codelists = response.json()['structure'].get('codelists', {}).get('codelist', [])
+        if not codelists:
+            return []
+        codes = codelists[0].get('code', [])
+        return [codes] if isinstance(codes, dict) else codes
+
+    @staticmethod
+    def _type_number(value: Union[int, str]) -> int:
+        """
+        Converts a NOMIS type value such as 464 or 'TYPE464' to the type number.
+
+        Args:
+            value (Union[int, str]): The type value.
+
+        Returns:
+            int: The type number.
+        """
+        return int(str(value).upper().replace('TYPE', ''))
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Loads the cached hierarchy. Called while holding the lock.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Geography types by dataset and geography ids by dataset and GSS code.
+        """
+        if self._cache is None:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._cache = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._cache = {'types': {}, 'ids': {}}
+            if not all(isinstance(ids, dict) for ids in self._cache['ids'].values()):
+                self._cache['ids'] = {}  # ids cached by an earlier version were not keyed by dataset
+        return self._cache
+
+    def _save(self) -> None:
+        """
+        Saves the cached hierarchy. Called while holding the lock.
+
+        Returns:
+            None
+        """
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self._cache, f)
+        temp_path.replace(self.cache_path)
+
+
+class NomisCatalogue:
+    """
+    Locally cached and indexed catalogue of NOMIS tables.
+
+    The catalogue (``def.sdmx.json``) is downloaded once and saved as JSON in ``cache_folder`` together with its ETag and download time. Within ``ttl`` the saved copy is used without contacting NOMIS. After that, the catalogue is revalidated with a conditional request and only downloaded again if it has changed. If NOMIS cannot be reached, the saved copy is used regardless of its age.
+
+    Attributes:
+        connection (ConnectToNomis): The connection whose API key and proxies are used.
+        cache_path (Path): Path of the cached catalogue.
+        ttl (timedelta): How long the cached catalogue is used before it is revalidated.
+        tables (Dict[str, NomisTable]): Tables indexed by dataset id.
+        keyword_index (Dict[str, Set[str]]): Dataset ids indexed by the lowercase words in their id and name.
+        search_index (NomisSearchIndex): Ranked full-text index over the tables, built on first use.
+        fetched_at (datetime): When the catalogue was last downloaded or revalidated.
+
+    Methods:
+        sync(force: bool = False): Loads the catalogue from the cache or NOMIS and builds the indexes.
+        get(table_id: str): Returns the table with the given dataset id.
+        find(keywords: str): Returns the tables whose id or name contain all of the keywords.
+        search(query: str, limit: int = 10): Returns the tables that best match the query.
+
+    Usage:
+
+        .. code-block:: python
+
+            nomis = DownloadFromNomis()
+            nomis.catalogue.sync()
+            table = nomis.catalogue.get('NM_2072_1')
+            tables = nomis.catalogue.find('tenure')
+    """
+
+    def __init__(self, connection: ConnectToNomis, cache_folder: str = None, ttl: timedelta = timedelta(days=1)) -> None:
+        """
+        Initialise NomisCatalogue.
+
+        Args:
+            connection (ConnectToNomis): The connection whose API key and proxies are used.
+            cache_folder (str): Folder for the cached catalogue. Defaults to None, in which case the ``nomis_cache`` folder of the package is used.
+            ttl (timedelta): How long the cached catalogue is used before it is revalidated. Defaults to one day.
+        """
+        self.connection = connection
+        cache_folder = Path(cache_folder) if cache_folder else Path(__file__).resolve().parent / 'nomis_cache'
+        self.cache_path = cache_folder / 'catalogue.json'
+        self.ttl = ttl
+        self.tables = {}
+        self.keyword_index = {}
+        self.search_index = None
+        self.fetched_at = None
+        self._etag = None
+        self._last_modified = None
+        self._lock = threading.Lock()
+
+    def sync(self, force: bool = False) -> None:
+        """
+        Loads the catalogue from the cache or NOMIS and builds the indexes.
+
+        Args:
+            force (bool): Revalidate the catalogue with NOMIS even if the cached copy is younger than ``ttl``. Defaults to False.
+
+        Raises:
+            ConnectionError: If NOMIS cannot be reached and there is no cached catalogue.
+
+        Returns:
+            None
+        """
+        with self._lock:  # the catalogue is shared between the workers of download_many()
+            self._sync(force)
+
+    def _sync(self, force: bool) -> None:
+        """
+        Loads the catalogue from the cache or NOMIS and builds the indexes. Called by ``sync()`` while holding the lock.
+
+        Args:
+            force (bool): Revalidate the catalogue with NOMIS even if the cached copy is younger than ``ttl``.
+
+        Returns:
+            None
+        """
+        if self.tables and not force and datetime.now() - self.fetched_at < self.ttl:
+            return  # already loaded and fresh
+
+        cached = self._read_cache()
+        if cached and not force and datetime.now() - self.fetched_at < self.ttl:
+            self._build_indexes(cached)
+            return
+
+        try:
+            response = self._request_catalogue()
+        except (RequestsConnectionError, RequestsTimeout, RetryError):  # RetryError is raised once the 429/5xx retries of the session are exhausted
+            if cached is None:
+                raise ConnectionError("Could not connect to NOMIS and no cached catalogue was found.")
+            print("Could not connect to NOMIS, using the cached catalogue.")
+            self._build_indexes(cached)
+            return
+
+        self.connection.r = response
+        if response.status_code == 304 and cached is not None:
+            tables_data = cached
+        else:
+            assert response.status_code == 200, "Could not connect to NOMIS. Check your API key and proxies."
+            tables_data = response.json()['structure']['keyfamilies']['keyfamily']
+            self._etag = response.headers.get('ETag')
+            self._last_modified = response.headers.get('Last-Modified')
+
+        self.fetched_at = datetime.now()
+        self._write_cache(tables_data)
+        self._build_indexes(tables_data)
+
+    def get(self, table_id: str) -> Optional['NomisTable']:
+        """
+        Returns the table with the given dataset id.
+
+        Args:
+            table_id (str): The dataset identifier (e.g., NM_2021_1).
+
+        Returns:
+            Optional[NomisTable]: The table, or None if there is no such dataset.
+        """
+        self._ensure_loaded()
+        return self.tables.get(table_id)
+
+    def find(self, keywords: str) -> List['NomisTable']:
+        """
+        Returns the tables whose id or name contain all of the keywords.
+
+        Args:
+            keywords (str): Space separated keywords. Matching is case insensitive and on whole words.
+
+        Returns:
+            List[NomisTable]: The matching tables, sorted by dataset id.
+        """
+        self._ensure_loaded()
+        words = self._tokenise(keywords)
+        if not words:
+            return []
+        table_ids = set.intersection(*[self.keyword_index.get(word, set()) for word in words])
+        return [self.tables[table_id] for table_id in sorted(table_ids)]
+
+    def search(self, query: str, limit: int = 10) -> List['NomisTable']:
+        """
+        Returns the tables that best match the query.
+
+        Args:
+            query (str): Space separated keywords.
+            limit (int): Maximum number of tables to return. Defaults to 10.
+
+        Returns:
+            List[NomisTable]: The matching tables, best match first.
+        """
+        self._ensure_loaded()
+        if self.search_index is None:
+            self.search_index = NomisSearchIndex(self.tables.values())
+        return [self.tables[table_id] for table_id, _ in self.search_index.search(query, limit=limit)]
+
+    def _ensure_loaded(self) -> None:
+        """
+        Syncs the catalogue if it has not been loaded yet.
+
+        Returns:
+            None
+        """
+        if not self.tables:
+            self.sync()
+
+    def _request_catalogue(self) -> Any:
+        """
+        Requests the catalogue from NOMIS, sending the ETag and modification date of the cached copy so that an unchanged catalogue is answered with 304 Not Modified.
+
+        Returns:
+            requests.Response: The response from NOMIS.
+        """
+        self.connection.url_creator(dataset=None)
+        headers = {}
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        return self.connection._get(self.connection.url, headers=headers)
+
+    def _read_cache(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Reads the cached catalogue and its validators.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The cached table definitions, or None if there is no readable cache.
+        """
+        if not self.cache_path.exists():
+            return None
+        try:
+            with open(self.cache_path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        self._etag = cached.get('etag')
+        self._last_modified = cached.get('last_modified')
+        self.fetched_at = datetime.fromisoformat(cached['fetched_at'])
+        return cached['keyfamily']
+
+    def _write_cache(self, tables_data: List[Dict[str, Any]]) -> None:
+        """
+        Saves the catalogue and its validators to the cache folder.
+
+        Args:
+            tables_data (List[Dict[str, Any]]): The table definitions from NOMIS.
+
+        Returns:
+            None
+        """
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'etag': self._etag, 'last_modified': self._last_modified, 'fetched_at': self.fetched_at.isoformat(), 'keyfamily': tables_data}, f)
+        temp_path.replace(self.cache_path)
+
+    def _build_indexes(self, tables_data: List[Dict[str, Any]]) -> None:
+        """
+        Creates the ``NomisTable()`` objects and indexes them by dataset id and keyword.
+
+        Args:
+            tables_data (List[Dict[str, Any]]): The table definitions from NOMIS.
+
+        Returns:
+            None
+        """
+        self.tables = {table['id']: NomisTable(**table) for table in tables_data}
+        self.search_index = None
+        self.keyword_index = {}
+        for table_id, table in self.tables.items():
+            for word in self._tokenise(f"{table_id} {table.name.get('value', '')}"):
+                self.keyword_index.setdefault(word, set()).add(table_id)
+
+    @staticmethod
+    def _tokenise(text: str) -> List[str]:
+        """
+        Splits text into lowercase words.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[str]: The lowercase words.
+        """
+        return re.findall(r'[a-z0-9_]+', text.lower())
+
+
+class NomisSearchIndex:
+    """
+    Ranked full-text search over NOMIS table metadata.
+
+    Each table is a document made of its id, name, annotations and dimension (column) names and codelists. The words of the name count ``name_weight`` times so that tables named after the query rank above tables that only mention it. Documents are stored as an inverted index from word to (document, term frequency) postings and ranked with Okapi BM25, so a query only touches the postings of its own words.
+
+    Attributes:
+        table_ids (List[str]): Dataset id of each document.
+        postings (Dict[str, List[Tuple[int, int]]]): Inverted index from word to (document number, term frequency).
+        doc_lengths (List[int]): Number of words in each document.
+        average_length (float): Average number of words per document.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalisation.
+
+    Methods:
+        search(query: str, limit: int = 10): Returns the best matching dataset ids and their scores.
+
+    Usage:
+
+        .. code-block:: python
+
+            index = NomisSearchIndex(nomis.get_all_tables())
+            index.search('tenure households')
+    """
+
+    def __init__(self, tables: List['NomisTable'], name_weight: int = 3, k1: float = 1.2, b: float = 0.75) -> None:
+        """
+        Builds the index.
+
+        Args:
+            tables (List[NomisTable]): The tables to index.
+            name_weight (int): How many times the words in the table name count. Defaults to 3.
+            k1 (float): BM25 term frequency saturation. Defaults to 1.2.
+            b (float): BM25 document length normalisation. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.table_ids = []
+        self.doc_lengths = []
+        self.postings = {}
+
+        for doc_number, table in enumerate(tables):
+            words = self._table_words(table, name_weight)
+            self.table_ids.append(table.id)
+            self.doc_lengths.append(len(words))
+            for word, frequency in Counter(words).items():
+                self.postings.setdefault(word, []).append((doc_number, frequency))
+
+        self.average_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns the best matching dataset ids and their scores.
+
+        Args:
+            query (str): Space separated keywords.
+            limit (int): Maximum number of results. Defaults to 10.
+
+        Returns:
+            List[Tuple[str, float]]: Dataset ids and BM25 scores, best match first. Ties are ordered by dataset id.
+        """
+        n_docs = len(self.table_ids)
+        scores = {}
+        for word in set(NomisCatalogue._tokenise(query)):
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_number, frequency in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_number] / self.average_length
+                scores[doc_number] = scores.get(doc_number, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.table_ids[item[0]]))
+        return [(self.table_ids[doc_number], score) for doc_number, score in ranked[:limit]]
+
+    @staticmethod
+    def _table_words(table: 'NomisTable', name_weight: int) -> List[str]:
+        """
+        Collects the searchable words of a table.
+
+        Args:
+            table (NomisTable): The table.
+            name_weight (int): How many times the words in the table name count.
+
+        Returns:
+            List[str]: The lowercase words of the table.
+        """
+        text = [table.id] + [table.name.get('value', '')] * name_weight
+        if table.description:
+            text.append(str(table.description))
+        annotations = table.annotations.get('annotation', []) if isinstance(table.annotations, dict) else []
+        if isinstance(annotations, dict):
+            annotations = [annotations]
+        text.extend(f"{item.get('annotationtitle', '')} {item.get('annotationtext', '')}" for item in annotations)
+        dimensions = table.components.get('dimension', []) if isinstance(table.components, dict) else []
+        # codelists such as CL_2072_1_C2021_TENURE_9 are indexed whole and by their parts
+        dimension_text = ' '.join(f"{col.get('conceptref', '')} {col.get('codelist', '')}" for col in dimensions)
+        text.extend([dimension_text, dimension_text.replace('_', ' ')])
+        return NomisCatalogue._tokenise(' '.join(text))
+
+
+class NomisResultCache:
+    """
+    Local cache of NOMIS download results.
+
+    Each result is saved as a Parquet file named after a hash of its dataset id, normalised parameters, selected columns and measures, and recorded in a JSON index together with its query, size and creation and last access times. Results older than ``ttl`` are not used, and the least recently used results are removed when the total size of the cache exceeds ``max_size_bytes``.
+
+    A query that is not in the cache can still be answered from a cached superset: a result for the same dataset whose parameters include all the requested values and whose columns include the requested columns. The cached superset is filtered to the requested values locally. Bulk downloads are the superset of every geography query without other parameters.
+
+    Attributes:
+        cache_folder (Path): Folder of the cached results.
+        ttl (timedelta): How long a result is used.
+        max_size_bytes (int): Maximum total size of the cached results.
+        index (Dict[str, Dict[str, Any]]): Cached queries by key.
+
+    Methods:
+        get(dataset: str, params: Dict[str, List] = None, select: List[str] = None, bulk: bool = False): Returns the cached result for the query, or None.
+        put(dataset: str, df: pd.DataFrame, params: Dict[str, List] = None, select: List[str] = None, bulk: bool = False): Saves a result in the cache.
+        clear(): Removes all cached results.
+
+    Usage:
+
+        .. code-block:: python
+
+            cache = NomisResultCache(ttl=timedelta(days=7))
+            nomis = DownloadFromNomis(cache=cache)
+    """
+
+    geography_columns = ['GEOGRAPHY_CODE', 'geography code']
+
+    def __init__(self, cache_folder: str = None, ttl: timedelta = timedelta(days=7), max_size_bytes: int = 1024**3) -> None:
+        """
+        Initialise NomisResultCache.
+
+        Args:
+            cache_folder (str): Folder of the cached results. Defaults to None, in which case the ``nomis_cache/results`` folder of the package is used.
+            ttl (timedelta): How long a result is used. Defaults to seven days.
+            max_size_bytes (int): Maximum total size of the cached results. Defaults to 1 GB.
+        """
+        self.cache_folder = Path(cache_folder) if cache_folder else Path(__file__).resolve().parent / 'nomis_cache' / 'results'
+        self.ttl = ttl
+        self.max_size_bytes = max_size_bytes
+        self._index_path = self.cache_folder / 'index.json'
+        self.index = self._read_index()
+        self._lock = threading.RLock()
+
+    def get(self, dataset: str, params: Dict[str, List] = None, select: List[str] = None, bulk: bool = False) -> Optional[pd.DataFrame]:
+        """
+        Returns the cached result for the query, or a subset of a cached superset of the query.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            params (Dict[str, List]): Dictionary of query parameters, including measures. Defaults to None.
+            select (List[str]): Selected columns. Defaults to None.
+            bulk (bool): Whether the query is a bulk download. Defaults to False.
+
+        Returns:
+            Optional[pd.DataFrame]: The cached result, or None if the query cannot be answered from the cache.
+        """
+        with self._lock:
+            query = self._normalise(dataset, params, select, bulk)
+            key = self._key(query)
+            self._remove_expired()
+
+            if key in self.index:
+                return self._read(key)
+
+            if bulk:
+                return None
+
+            for candidate_key, entry in sorted(self.index.items(), key=lambda item: item[1]['size']):
+                if entry['query']['dataset'] == dataset:
+                    df = self._subset(candidate_key, entry['query'], query)
+                    if df is not None:
+                        return df
+            return None
+
+    def put(self, dataset: str, df: pd.DataFrame, params: Dict[str, List] = None, select: List[str] = None, bulk: bool = False) -> None:
+        """
+        Saves a result in the cache and removes the least recently used results if the cache is too large.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            df (pd.DataFrame): The downloaded result.
+            params (Dict[str, List]): Dictionary of query parameters, including measures. Defaults to None.
+            select (List[str]): Selected columns. Defaults to None.
+            bulk (bool): Whether the result is a bulk download. Defaults to False.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            query = self._normalise(dataset, params, select, bulk)
+            key = self._key(query)
+            self.cache_folder.mkdir(parents=True, exist_ok=True)
+            file_path = self.cache_folder / f"{key}.parquet"
+            df.to_parquet(file_path, index=False)
+
+            now = datetime.now().isoformat()
+            self.index[key] = {'query': query, 'file': file_path.name, 'size': file_path.stat().st_size, 'created': now, 'last_access': now}
+            self._evict()
+            self._write_index()
+
+    def clear(self) -> None:
+        """
+        Removes all cached results.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for key in list(self.index):
+                self._remove(key)
+            self._write_index()
+
+    def _subset(self, key: str, cached_query: Dict[str, Any], query: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Answers the query from a cached result if the cached result contains all of the requested rows and columns.
+
+        Args:
+            key (str): Key of the cached result.
+            cached_query (Dict[str, Any]): The normalised query of the cached result.
+            query (Dict[str, Any]): The normalised query.
+
+        Returns:
+            Optional[pd.DataFrame]: The requested rows and columns of the cached result, or None if it is not a superset of the query.
+        """
+        if cached_query['select'] is not None and (query['select'] is None or not set(query['select']) <= set(cached_query['select'])):
+            return None
+        if cached_query['bulk'] and (query['measures'] is not None or set(query['params']) - {'geography'}):
+            return None  # bulk tables are wide and can only be filtered by geography
+
+        for param, values in cached_query['params'].items():
+            if values is not None and (query['params'].get(param) is None or not set(query['params'][param]) <= set(values)):
+                return None
+        if cached_query['measures'] is not None and (query['measures'] is None or not set(query['measures']) <= set(cached_query['measures'])):
+            return None
+
+        filters = {}
+        for param, values in query['params'].items():
+            if values is not None and values != cached_query['params'].get(param):
+                filters[param] = values
+        if query['measures'] is not None and query['measures'] != cached_query['measures']:
+            filters['measures'] = query['measures']
+
+        if any(self._is_range(value) for values in filters.values() for value in values):
+            return None
+
+        df = self._read(key)
+        for param, values in filters.items():
+            column = self._filter_column(df, param, values)
+            if column is None:
+                return None
+            df = df[df[column].astype(str).isin(values)]
+        if query['select'] is not None:
+            df = df[[column for column in df.columns if column in query['select']]]
+        return df.reset_index(drop=True)
+
+    def _filter_column(self, df: pd.DataFrame, param: str, values: List[str]) -> Optional[str]:
+        """
+        Finds the column of the result that holds the values of a query parameter. Geographies given as NOMIS geography ids are matched against the ``GEOGRAPHY`` id column and GSS codes against the geography code column.
+
+        Args:
+            df (pd.DataFrame): The cached result.
+            param (str): The query parameter.
+            values (List[str]): The requested values of the parameter.
+
+        Returns:
+            Optional[str]: The column name, or None if the result has no such column or the geographies mix ids and codes.
+        """
+        if param == 'geography':
+            numeric = [value.isdigit() for value in values]
+            if any(numeric) and not all(numeric):
+                return None
+            candidates = ['GEOGRAPHY'] if all(numeric) else self.geography_columns
+        else:
+            candidates = [param.upper()]
+        for column in candidates:
+            if column in df.columns:
+                return column
+        return None
+
+    @staticmethod
+    def _is_range(value: str) -> bool:
+        """
+        Checks whether a parameter value is a NOMIS range or geography type rather than a single code.
+
+        Args:
+            value (str): The parameter value.
+
+        Returns:
+            bool: True if the value cannot be compared with the values of a column.
+        """
+        return '...' in value or 'TYPE' in value.upper()
+
+    @staticmethod
+    def _normalise(dataset: str, params: Dict[str, List] = None, select: List[str] = None, bulk: bool = False) -> Dict[str, Any]:
+        """
+        Normalises a query so that equivalent queries have the same key.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            params (Dict[str, List]): Dictionary of query parameters, including measures. Defaults to None.
+            select (List[str]): Selected columns. Defaults to None.
+            bulk (bool): Whether the query is a bulk download. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: The dataset, sorted parameter values as strings, measures, sorted selected columns and bulk flag.
+        """
+        params = {param.lower(): (sorted({str(value) for value in values}) if values is not None else None) for param, values in (params or {}).items()}
+        measures = params.pop('measures', None)
+        params = {param: values for param, values in sorted(params.items()) if values is not None}
+        return {'dataset': dataset, 'params': params, 'measures': measures, 'select': sorted({str(column) for column in select}) if select else None, 'bulk': bulk}
+
+    @staticmethod
+    def _key(query: Dict[str, Any]) -> str:
+        """
+        Hashes a normalised query.
+
+        Args:
+            query (Dict[str, Any]): The normalised query.
+
+        Returns:
+            str: The key of the query.
+        """
+        return hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+
+    def _read(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Reads a cached result and updates its last access time.
+
+        Args:
+            key (str): Key of the cached result.
+
+        Returns:
+            Optional[pd.DataFrame]: The cached result, or None if its file is missing.
+        """
+        try:
+            df = pd.read_parquet(self.cache_folder / self.index[key]['file'])
+        except (OSError, ValueError):
+            self._remove(key)
+            self._write_index()
+            return None
+        self.index[key]['last_access'] = datetime.now().isoformat()
+        self._write_index()
+        return df
+
+    def _remove_expired(self) -> None:
+        """
+        Removes results older than ``ttl``.
+
+        Returns:
+            None
+        """
+        now = datetime.now()
+        expired = [key for key, entry in self.index.items() if now - datetime.fromisoformat(entry['created']) >= self.ttl]
+        for key in expired:
+            self._remove(key)
+        if expired:
+            self._write_index()
+
+    def _evict(self) -> None:
+        """
+        Removes expired results and then the least recently used results until the cache fits in ``max_size_bytes``.
+
+        Returns:
+            None
+        """
+        self._remove_expired()
+        total_size = sum(entry['size'] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total_size <= self.max_size_bytes:
+                break
+            total_size -= entry['size']
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        """
+        Removes a result from the index and deletes its file.
+
+        Args:
+            key (str): Key of the cached result.
+
+        Returns:
+            None
+        """
+        entry = self.index.pop(key)
+        (self.cache_folder / entry['file']).unlink(missing_ok=True)
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Reads the index of the cache.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Cached queries by key. Empty if there is no readable index.
+        """
+        try:
+            with open(self._index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self) -> None:
+        """
+        Saves the index of the cache.
+
+        Returns:
+            None
+        """
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        temp_path = self._index_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f)
+        temp_path.replace(self._index_path)
+
+
+class NomisBulkStore:
+    """
+    Local DuckDB store of bulk downloaded NOMIS tables.
+
+    Each dataset is stored as a table named after its dataset id. A metadata table records when each dataset was downloaded and the date it was last updated on NOMIS according to the catalogue, so that a dataset is only downloaded again when NOMIS publishes an update. Queries filter the stored tables with SQL, so only the requested rows are read into pandas.
+
+    Attributes:
+        database_path (Path): Path of the DuckDB database.
+        conn (duckdb.DuckDBPyConnection): Connection to the database.
+
+    Methods:
+        can_answer(params: Dict[str, List] = None, table_columns: List[str] = None, value_or_percent: str = None): Checks whether a ``download()`` query can be answered from a bulk table.
+        is_current(dataset: str, last_updated: str = None): Checks whether the stored dataset is up to date.
+        load_parquet(dataset: str, parquet_path: Path, last_updated: str = None): Stores a bulk downloaded Parquet file.
+        query(dataset: str, geographies: List[str] = None): Returns the rows of a stored dataset for the given geographies.
+        datasets(): Returns the stored datasets and their update dates.
+        close(): Closes the database connection.
+
+    Usage:
+
+        .. code-block:: python
+
+            store = NomisBulkStore()
+            nomis = DownloadFromNomis(bulk_store=store)
+            df = nomis.download('NM_2072_1', params={'geography': ['E92000001']})
+    """
+
+    geography_column = 'geography code'
+
+    def __init__(self, database_path: str = None) -> None:
+        """
+        Initialise NomisBulkStore.
+
+        Args:
+            database_path (str): Path of the DuckDB database. Defaults to None, in which case ``nomis_cache/bulk.duckdb`` in the package folder is used.
+        """
+        self.database_path = Path(database_path) if database_path else Path(__file__).resolve().parent / 'nomis_cache' / 'bulk.duckdb'
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = duckdb.connect(str(self.database_path))
+        self._lock = threading.RLock()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _nomis_bulk_datasets (dataset VARCHAR PRIMARY KEY, last_updated VARCHAR, downloaded_at TIMESTAMP)")
+
+    def can_answer(self, params: Dict[str, List] = None, table_columns: List[str] = None, value_or_percent: str = None) -> bool:
+        """
+        Checks whether a ``download()`` query can be answered from a bulk table. Bulk tables have one column per category and measure and are keyed by GSS code, so only queries that filter by a list of GSS codes can be answered from them. A query without geographies asks for the whole table, which is the bulk table itself.
+
+        Args:
+            params (Dict[str, List]): Dictionary of parameters. Defaults to None.
+            table_columns (List[str]): List of columns to include in the dataset. Defaults to None.
+            value_or_percent (str): Specifies whether to download 'value' or 'percent'. Defaults to None.
+
+        Returns:
+            bool: True if the query can be answered from a bulk table.
+        """
+        if table_columns or value_or_percent:
+            return False
+        params = params or {}
+        if set(params) - {'geography'}:
+            return False
+        geographies = params.get('geography') or []
+        # NOMIS geography ids, ranges and NomisGeography() or TYPE selectors cannot be matched against the geography code column
+        return all(isinstance(code, str) and re.fullmatch(r'[A-Z]\d{8}', code) for code in geographies)
+
+    def is_current(self, dataset: str, last_updated: str = None) -> bool:
+        """
+        Checks whether the stored dataset is up to date.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            last_updated (str): The date the dataset was last updated on NOMIS. Defaults to None, in which case any stored copy is considered up to date.
+
+        Returns:
+            bool: True if the dataset is stored and was stored after its last update.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT last_updated FROM _nomis_bulk_datasets WHERE dataset = ?", [dataset]).fetchone()
+            if row is None:
+                return False
+            return last_updated is None or row[0] == last_updated
+
+    def load_parquet(self, dataset: str, parquet_path: Path, last_updated: str = None) -> None:
+        """
+        Stores a bulk downloaded Parquet file, replacing any earlier copy of the dataset.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            parquet_path (Path): Path of the Parquet file.
+            last_updated (str): The date the dataset was last updated on NOMIS. Defaults to None.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute(f"CREATE OR REPLACE TABLE {self._table(dataset)} AS SELECT * FROM read_parquet(?)", [str(parquet_path)])
+                self.conn.execute("INSERT OR REPLACE INTO _nomis_bulk_datasets VALUES (?, ?, current_timestamp)", [dataset, last_updated])
+                self.conn.execute("COMMIT")
+            except duckdb.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def query(self, dataset: str, geographies: List[str] = None) -> pd.DataFrame:
+        """
+        Returns the rows of a stored dataset for the given geographies.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+            geographies (List[str]): GSS codes to filter by. Defaults to None, in which case all rows are returned.
+
+        Returns:
+            pd.DataFrame: The matching rows.
+        """
+        with self._lock:
+            sql = f"SELECT * FROM {self._table(dataset)}"
+            if geographies is None:
+                return self.conn.execute(sql).df()
+            sql += f' WHERE "{self.geography_column}" IN (SELECT UNNEST(?::VARCHAR[]))'
+            return self.conn.execute(sql, [[str(code) for code in geographies]]).df()
+
+    def datasets(self) -> pd.DataFrame:
+        """
+        Returns the stored datasets and their update dates.
+
+        Returns:
+            pd.DataFrame: The dataset ids, the dates they were last updated on NOMIS and the times they were downloaded.
+        """
+        with self._lock:
+            return self.conn.execute("SELECT * FROM _nomis_bulk_datasets ORDER BY dataset").df()
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+
+        Returns:
+            None
+        """
+        self.conn.close()
+
+    @staticmethod
+    def _table(dataset: str) -> str:
+        """
+        Returns the quoted table name of a dataset.
+
+        Args:
+            dataset (str): The dataset identifier (e.g., NM_2021_1).
+
+        Returns:
+            str: The quoted table name.
+        """
+        return '"' + dataset.replace('"', '""') + '"'
+
+
+@dataclass
+class NomisTable:
+    """
+    A dataclass representing a structured output from NOMIS.
+
+    This class is designed to encapsulate the metadata and structure of a table retrieved from the NOMIS API.
+    It provides methods for accessing detailed descriptions, annotations, and column information in a readable format.
+
+    Attributes:
+        agencyid (str): The ID of the agency that owns the table.
+        annotations (Dict[str, Any]): A dictionary containing annotations related to the table.
+        id (str): The unique identifier of the table.
+        components (Dict[str, Any]): A dictionary containing information about the components (columns) of the table.
+        name (Dict[str, Any]): A dictionary containing the name of the table.
+        uri (str): The URI that links to more information about the table.
+        version (str): The version number of the table.
+        description (Optional[str]): An optional description of the table.
+    """
+
+    agencyid: str
+    annotations: Dict[str, Any]
+    id: str
+    components: Dict[str, Any]
+    name: Dict[str, Any]
+    uri: str
+    version: str
+    description: Optional[str] = None
+
+    def detailed_description(self) -> None:
+        """
+        Prints a detailed and cleaned overview of the table, including its ID, description, annotations, and columns.
+
+        Returns:
+            None
+        """
+        print(f"\nTable ID: {self.id}\n")
+        print(f"Table Description: {self.name['value']}\n")
+        for table_annotation in self.clean_annotations():
+            print(table_annotation)
+        print("\n")
+        for column_codes in self.table_cols():
+            print(column_codes)
+
+    def clean_annotations(self) -> List[str]:
+        """
+        Cleans the annotations for more readable presentation and returns them as a list of strings.
+
+        Returns:
+            List[str]: List of cleaned annotations
+        """
+        annotation_list = self.annotations['annotation']
+        cleaned_annotations = []
+        for item in annotation_list:
+            text_per_line = f"{item['annotationtitle']}: {item['annotationtext']}"
+            cleaned_annotations.append(text_per_line)
+        return cleaned_annotations
+
+    def table_cols(self) -> List[str]:
+        """
+        Cleans and returns the column information for the table in a readable format.
+
+        Returns:
+            List[str]: A list of column descriptions as strings
+        """
+        columns = self.components['dimension']
+        col_descriptions_and_codes = []
+        for col in columns:
+            text_per_line = f"Column: {col['conceptref']}, column code: {col['codelist']}"
+            col_descriptions_and_codes.append(text_per_line)
+        return col_descriptions_and_codes
+
+    def get_table_cols(self) -> List[Tuple[str, str]]:
+        """
+        Returns a list of tuples, where each tuple contains a column code and its corresponding description.
+
+        Returns:
+            List[Tuple[str, str]]: A list of tuples of columns
+        """
+        columns = self.components['dimension']
+        list_of_columns = [(col['conceptref'], col['codelist']) for col in columns]
+        return list_of_columns
+
+    def last_updated(self) -> Optional[str]:
+        """
+        Returns the date the table was last updated on NOMIS, from the 'LastUpdated' annotation.
+
+        Returns:
+            Optional[str]: The date as given by NOMIS, or None if the table has no such annotation.
+        """
+        annotations = self.annotations.get('annotation', []) if isinstance(self.annotations, dict) else []
+        if isinstance(annotations, dict):
+            annotations = [annotations]
+        for item in annotations:
+            if item.get('annotationtitle') == 'LastUpdated':
+                return str(item.get('annotationtext'))
+        return None
 
     def table_shorthand(self) -> None:
         """Returns a shorthand description of the table, including its ID and name.
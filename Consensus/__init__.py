@@ -2,9 +2,9 @@ from .ConfigManager import ConfigManager
 from .EsriConnector import EsriConnector, FeatureServer, Service, Layer
 from .EsriServers import OpenGeography, TFL
 from .GeocodeMerger import SmartLinker, GeoHelper
-from .LGInform import LGInform
+from .LGInform import LGInform, LGInformMetadataCache
 from .LocalMerger import DatabaseManager, GraphBuilder
-from .Nomis import DownloadFromNomis, ConnectToNomis, NomisTable
+from .Nomis import DownloadFromNomis, AsyncDownloadFromNomis, ConnectToNomis, NomisCatalogue, NomisSearchIndex, NomisResultCache, NomisBulkStore, NomisGeography, NomisGeographyHierarchy, NomisTable
 from .config_utils import load_config
 from .utils import where_clause_maker, read_lookup, read_service_table
 from .server_selector_util import get_server, get_server_name
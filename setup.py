@@ -80,7 +80,8 @@ setup(
         'twine>=5.1',
         'pytest>=7.1',
         'duckdb>=1.1',
-        'networkx>=3.2'
+        'networkx>=3.2',
+        'pyarrow>=14.0'
     ],
     python_requires='>=3.9',  # Specify your supported Python versions
     cmdclass={
@@ -4,7 +4,13 @@ sys_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, sys_path)
 
 import unittest
+from unittest.mock import patch
 from Consensus import SmartLinker, GeoHelper
+from Consensus.GeocodeMerger import BFS_SP_via, PandasPathMerger, DuckDBPathMerger, SharedTableDownloader
+from shapely.geometry import Point
+import geopandas as gpd
+import pandas as pd
+import numpy as np
 from Consensus.EsriServers import TFL, OpenGeography
 import platform
 import asyncio
@@ -74,6 +80,114 @@ class TestSmartGeocoder(unittest.IsolatedAsyncioTestCase):
         assert codes['table_data'][0]['WD22CD'].nunique() == 42
         assert codes['table_data'][0]['LSOA21NM'].nunique() == 348
 
+    def test_8_via_columns(self):
+        gss = SmartLinker(server='OGP')
+        gss.allow_geometry()
+        gss.run_graph(starting_columns=['WD22CD'], ending_columns=['LAD22CD'], via_columns=['MSOA21CD'])
+        self.assertTrue(gss.shortest_paths)
+        for path_tables in gss.path_tables:
+            fields = gss.lookup[gss.lookup['full_name'].isin(path_tables)]['matchable_fields'].explode().str.upper()
+            self.assertIn('MSOA21CD', fields.values)
+
+    def test_9_staged_search(self):
+        graph = {'A': [('B', 'X'), ('C', 'Y')],
+                 'B': [('A', 'X'), ('D', 'Z')],
+                 'C': [('A', 'Y'), ('D', 'W')],
+                 'D': [('B', 'Z'), ('C', 'W')]}
+        self.assertEqual(BFS_SP_via(graph, 'A', 'D', [{'C'}]), ['A', ('C', 'Y'), ('D', 'W')])
+        self.assertEqual(BFS_SP_via(graph, 'A', 'D', [{'B'}]), ['A', ('B', 'X'), ('D', 'Z')])
+        self.assertEqual(BFS_SP_via(graph, 'A', 'A', [{'D'}]), ['A', ('B', 'X'), ('D', 'Z'), ('B', 'Z'), ('A', 'X')])
+        self.assertEqual(BFS_SP_via(graph, 'A', 'D', [{'E'}]), 'no_connecting_path')
+
+    def test_10_merge_engines(self):
+        wards = pd.DataFrame({'WD22CD': ['W1', 'W2', 'W3', 'W3'], 'LAD22CD': ['L1', 'L1', 'L2', 'L2'], 'FID': [1, 2, 3, 3]})
+        lads = gpd.GeoDataFrame({'LAD22CD': ['L1', 'L2', 'L3'], 'lad22nm': ['x', 'y', 'z'], 'FID': [9, 8, 7]}, geometry=[Point(0, 0), Point(1, 1), Point(2, 2)], crs=27700)
+        regions = pd.DataFrame({'LAD22NM': ['x', 'y'], 'RGN22CD': ['R1', 'R2']})
+
+        outputs = []
+        for merger_class in [PandasPathMerger, DuckDBPathMerger]:
+            merger = merger_class(wards.copy())
+            merger.merge(lads.copy(), 'LAD22CD')
+            self.assertEqual(sorted(merger.unique_values('LAD22NM')[1]), ['x', 'y'])
+            merger.merge(regions.copy(), 'LAD22NM')
+            outputs.append(pd.DataFrame(merger.result()).sort_values('WD22CD').reset_index(drop=True))
+
+        self.assertEqual(outputs[0].shape, (3, 6))
+        pd.testing.assert_frame_equal(outputs[0], outputs[1], check_dtype=False)
+
+    def test_11_download_plan(self):
+        gss = SmartLinker(server='OGP')
+        gss.allow_geometry()
+        gss.run_graph(starting_columns=['WD22CD'], ending_columns=['LAD22CD'], geographic_areas=['Lewisham'], geographic_area_columns=['LAD22NM'], via_columns=['OA21CD'])
+        chosen_path = gss.shortest_paths[0]
+        self.assertEqual(gss._download_plan(chosen_path), [('*', None)] * len(chosen_path))
+
+        plan = gss._download_plan(chosen_path, output_columns=['WD22NM'])
+        self.assertEqual(len(plan), len(chosen_path))
+        for position, (output_fields, return_geometry) in enumerate(plan):
+            output_fields = output_fields.upper().split(',')
+            if position > 0:
+                self.assertIn(chosen_path[position][1], output_fields)
+            if position < len(chosen_path) - 1:
+                self.assertIn(chosen_path[position + 1][1], output_fields)
+                self.assertFalse(return_geometry)
+        self.assertIn('WD22CD', plan[0][0].upper().split(','))
+        self.assertIn('LAD22CD', plan[-1][0].upper().split(','))
+
+    async def test_12_shared_downloads(self):
+        class FakeLinker:
+            where_clauses = []
+
+            async def _get_ogp_table(self, table, where_clause='1=1', **kwargs):
+                self.where_clauses.append(where_clause)
+                codes = [f'W{i}' for i in range(10)]
+                df = pd.DataFrame({'WD22CD': codes, 'LAD22CD': ['L1'] * 5 + ['L2'] * 5})
+                if where_clause != '1=1':
+                    df = df[df['LAD22CD'].isin([value for value in ['L1', 'L2'] if f"'{value}'" in where_clause])]
+                return df
+
+        linker = FakeLinker()
+        downloader = SharedTableDownloader(linker, max_concurrent_downloads=2)
+        first, second = await asyncio.gather(downloader.download('wards', 'LAD22CD', ['L1']), downloader.download('wards', 'lad22cd', ['L1', 'L2']))
+        third = await downloader.download('wards', 'LAD22CD', ['L2', 'L1'])
+        self.assertEqual(len(first), 5)
+        self.assertEqual(len(second), 10)
+        self.assertEqual(len(third), 10)
+        self.assertEqual(downloader.download_count, 2)
+
+        full = await downloader.download('wards')
+        await downloader.download('wards')
+        self.assertEqual(len(full), 10)
+        self.assertEqual(downloader.download_count, 3)
+
+
+    def test_13_membership_matrix(self):
+        lookup = pd.DataFrame({'full_name': ['wards', 'lads', 'regions', 'points'],
+                               'fields': [['WD22CD', 'LAD22CD'], ['LAD22CD', 'lad22nm'], ['LAD22NM', 'RGN22CD'], None],
+                               'matchable_fields': [['WD22CD', 'LAD22CD'], ['LAD22CD', 'lad22nm'], ['LAD22NM', 'RGN22CD'], None],
+                               'has_geometry': [True, True, False, False]})
+        with patch('Consensus.GeocodeMerger.get_server'), patch('Consensus.GeocodeMerger.read_lookup', return_value=lookup), patch('Consensus.GeocodeMerger.FeatureServer'):
+            gss = SmartLinker(server='OGP')
+
+        self.assertEqual(gss._tables_with_columns(['LAD22CD']).tolist(), [True, True, False, False])
+        self.assertEqual(gss._tables_with_columns(['wd22cd', 'LAD22CD']).tolist(), [True, False, False, False])
+        self.assertEqual(gss._tables_with_columns(['LAD22NM']).tolist(), [False, True, True, False])  # matched regardless of case
+        self.assertEqual(gss._tables_with_columns(['OA21CD']).tolist(), [False] * 4)
+        self.assertEqual(gss._tables_with_any_column(['RGN22CD', 'WD22CD']).tolist(), [True, False, True, False])
+        self.assertEqual(gss.membership.dtype, np.uint8)
+
+        gss.starting_columns = ['LAD22CD']
+        gss.geographic_area_columns = ['LAD22NM']
+        self.assertEqual(list(gss._get_starting_point()), ['lads'])
+
+        gss.allow_geometry('connected_tables')  # force_geometry only limits the connecting tables, not the lookup
+        self.assertTrue(gss.force_geometry)
+        self.assertEqual(gss._tables_with_columns(['LAD22NM']).tolist(), [False, True, True, False])
+
+        gss.allow_geometry('geometry_only')  # the matrix is rebuilt for the smaller lookup
+        self.assertEqual(gss._tables_with_columns(['LAD22NM']).tolist(), [False, True])
+        self.assertEqual(gss._tables_with_any_column(['RGN22CD', 'WD22CD']).tolist(), [True, False])
+
 
 if __name__ == '__main__':
     unittest.main()
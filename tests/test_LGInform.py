@@ -4,10 +4,17 @@ sys_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, sys_path)
 
 import unittest
+import asyncio
+import tempfile
+import time
+import aiohttp
+from datetime import timedelta
+from unittest.mock import patch, AsyncMock, MagicMock
 from dotenv import load_dotenv
 from pathlib import Path
+import pandas as pd
 from os import environ
-from Consensus.LGInform import LGInform
+from Consensus.LGInform import LGInform, RateLimiter
 from Consensus.ConfigManager import ConfigManager
 from Consensus.config_utils import load_config
 
@@ -50,5 +57,268 @@ class TestConfigManager(unittest.TestCase):
                             drop_discontinued=False)"""
 
 
+def fake_data_json(identifier, periods=('2019', '2020'), areas=('Lewisham', 'Southwark')):
+    columns = [{'metricType': {'identifier': identifier, 'label': f'Metric {identifier}'}, 'period': {'identifier': period, 'label': period}} for period in periods]
+    rows = [{'area': {'identifier': area, 'label': area}, 'values': [{'value': float(identifier + i), 'formatted': str(identifier + i)} for i, _ in enumerate(periods)]} for area in areas]
+    return {'columns': columns, 'rows': rows}
+
+
+def fake_batch_json(identifiers, periods=('2019', '2020')):
+    outputs = [fake_data_json(identifier, periods=periods) for identifier in identifiers if identifier != 19]  # metricType 19 has no data
+    rows = [{'area': row['area'], 'values': [value for output in outputs for value in output['rows'][i]['values']]} for i, row in enumerate(outputs[0]['rows'])] if outputs else []
+    return {'columns': [column for output in outputs for column in output['columns']], 'rows': rows}
+
+
+def fake_metadata_json(identifier, discontinued=False):
+    return {'metricType': {'identifier': identifier, 'label': f'Metric {identifier}', 'discontinued': discontinued, 'helpText': 'help'}}
+
+
+class TestLGInformOffline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_folder.cleanup)
+        self.api_call = LGInform(api_key='key', api_secret='secret', area='E09000023', max_concurrent_requests=3, requests_per_second=None, cache_folder=self.cache_folder.name)
+        self.variables = {'metricType-array': [{'identifier': i} for i in [11, 12, 13, 14, 15]]}
+        self.active = 0
+        self.max_active = 0
+        self.urls = []
+        self.periods = ['2019', '2020']
+        self.metrics_per_dataset = 3
+
+        async def fake_get_json(session, limiter, url, retries=3):
+            async with limiter:
+                self.urls.append(url)
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                await asyncio.sleep(0.01)
+                self.active -= 1
+            if 'dataset=' in url:
+                dataset = int(url.split('dataset=')[1].split('&')[0])
+                if dataset == 99:
+                    raise ValueError('unknown dataset')
+                return {'metricType-array': [{'identifier': dataset * 10 + i} for i in range(1, self.metrics_per_dataset + 1)]}
+            if '/data?' in url:
+                latest_n = int(url.split('period=latest')[1].split('&')[0])
+                return fake_batch_json([int(identifier) for identifier in url.split('metricType=')[1].split('&')[0].split(',')], periods=self.periods[-latest_n:])
+            identifier = int(url.split('/metricTypes/')[1].split('?')[0])
+            return fake_metadata_json(identifier, discontinued=identifier == 13)
+
+        self.api_call._get_json = fake_get_json
+
+    def test_1_concurrent_download(self) -> None:
+        outputs, metadata = asyncio.run(self.api_call.download_dataset_async(self.variables, latest_n=2))
+        self.assertEqual([output['columns'][0]['metricType']['identifier'] for output in outputs], [11, 12, 13, 14, 15])
+        self.assertEqual(sorted(metadata), [11, 12, 13, 14, 15])
+        self.assertEqual(len(self.urls), 6)
+        self.assertEqual(self.max_active, 3)
+
+    def test_2_format_tables_with_metadata(self) -> None:
+        outputs, metadata = asyncio.run(self.api_call.download_dataset_async(self.variables, latest_n=2))
+        with tempfile.TemporaryDirectory() as folder:
+            with patch('Consensus.LGInform.requests.get') as mock_get:
+                tables = self.api_call.format_tables(outputs, drop_discontinued=True, metadata=metadata, output_folder=Path(folder), raw_data_folder=Path(folder), dataset_name='test', save_raw_data=True)
+                mock_get.assert_not_called()
+            self.assertEqual(sorted(tables), [11, 12, 14, 15])
+            self.assertEqual(len(list(Path(folder).glob('table for metricType *.csv'))), 4)
+
+    def test_3_merge_tables_in_memory(self) -> None:
+        outputs, metadata = asyncio.run(self.api_call.download_dataset_async(self.variables, latest_n=2))
+        outputs.append(fake_data_json(16, periods=('2020', '2021'), areas=('Lewisham',)))
+        metadata[16] = fake_metadata_json(16)
+        with tempfile.TemporaryDirectory() as folder:
+            tables = self.api_call.format_tables(outputs, drop_discontinued=True, metadata=metadata, output_folder=Path(folder))
+            self.assertFalse(Path(folder).joinpath('raw_data').exists())
+            df = self.api_call.merge_tables('test', output_folder=Path(folder), tables=tables, file_format='parquet')
+            self.assertEqual(list(df.columns), ['Area', 'Time period', 'Metric 11', 'Metric 12', 'Metric 14', 'Metric 15', 'Metric 16'])
+            self.assertEqual(len(df), 5)
+            self.assertEqual(df.set_index(['Area', 'Time period']).loc[('Lewisham', '2021'), 'Metric 16'], 17.0)
+            self.assertTrue(Path(folder).joinpath('data for dataset test.parquet').exists())
+            self.assertEqual(list(Path(folder).glob('*.csv')), [Path(folder).joinpath('metadata.csv')])
+
+    def test_4_rate_limiter(self) -> None:
+        async def run() -> float:
+            limiter = RateLimiter(requests_per_second=50, max_concurrent_requests=10)
+
+            async def request() -> None:
+                async with limiter:
+                    pass
+
+            start = time.perf_counter()
+            await asyncio.gather(*[request() for _ in range(6)])
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+    def test_5_worker_pool_report(self) -> None:
+        datasets = {'first': 1, 'missing': 99, 'second': 2, 'third': 3}
+        with tempfile.TemporaryDirectory() as folder:
+            report = self.api_call.mp_download(datasets, output_folder=Path(folder), latest_n=2, drop_discontinued=True, max_workers=2)
+            self.assertEqual(report['Dataset'].tolist(), list(datasets))
+            self.assertEqual(report['Status'].tolist(), ['ok', 'failed', 'ok', 'ok'])
+            self.assertIn('unknown dataset', report.loc[1, 'Error'])
+            self.assertEqual(report.loc[0, 'Metrics'], 2)  # metricType 13 is discontinued
+            self.assertEqual(report.loc[0, 'Rows'], 4)
+            for dataset in ['first', 'second', 'third']:
+                self.assertTrue(Path(folder).joinpath(dataset, f'data for dataset {dataset}.csv').exists())
+        self.assertLessEqual(self.max_active, 3)
+
+        with tempfile.TemporaryDirectory() as folder:
+            report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=2)
+            self.assertEqual(report['Status'].tolist(), ['ok'])
+
+    def test_6_metadata_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            report = self.api_call.mp_download({'first': 1}, output_folder=Path(folder), latest_n=2, drop_discontinued=True)
+            self.assertEqual(report.loc[0, 'Metrics'], 2)
+            self.assertEqual(len(self.urls), 5)
+            self.assertIn('metricType=11,12&', self.urls[-1])
+
+            self.urls.clear()
+            rerun = LGInform(api_key='key', api_secret='secret', area='E09000023', requests_per_second=None, cache_folder=self.cache_folder.name)
+            rerun._get_json = self.api_call._get_json
+            rerun.mp_download({'first': 1}, output_folder=Path(folder), latest_n=2, drop_discontinued=True)
+            self.assertEqual(len(self.urls), 1)
+            self.assertTrue(all('/data?' in url for url in self.urls))
+            self.assertTrue(rerun.metadata_cache.get_metric(13)['metricType']['discontinued'])
+
+            self.urls.clear()
+            rerun.metadata_cache.ttl = timedelta(0)
+            rerun.mp_download({'first': 1}, output_folder=Path(folder), latest_n=2, drop_discontinued=True)
+            self.assertEqual(len(self.urls), 5)
+
+    def test_7_batched_requests(self) -> None:
+        self.api_call.max_metrics_per_request = 4
+        variables = {'metricType-array': [{'identifier': i} for i in range(11, 21)]}
+        outputs, _ = asyncio.run(self.api_call.download_dataset_async(variables, latest_n=2, include_metadata=False))
+        self.assertEqual(len(self.urls), 3)
+        self.assertEqual(len(outputs), 10)
+        for identifier, output in zip(range(11, 21), outputs):
+            if identifier == 19:
+                self.assertEqual(output['columns'], [])
+                continue
+            self.assertEqual({column['metricType']['identifier'] for column in output['columns']}, {identifier})
+            self.assertEqual(output['rows'][1]['values'][1]['value'], float(identifier + 1))
+
+        self.api_call.max_url_length = len(self.api_call.sign_url(self.api_call._variable_data_url([11, 12], 2)))
+        self.assertEqual(self.api_call._batch_identifiers(list(range(11, 16)), 2), [[11, 12], [13, 14], [15]])
+
+    def test_8_incremental_refresh(self) -> None:
+        self.periods = ['2017', '2018', '2019', '2020']
+        with tempfile.TemporaryDirectory() as folder:
+            report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=4, incremental=True)
+            self.assertEqual(report.loc[0, 'Rows'], 8)
+            manifest = self.api_call._read_manifest(Path(folder).joinpath('first'))
+            self.assertEqual(manifest['periods'], {11: self.periods, 12: self.periods})
+
+            self.urls.clear()
+            report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=4, incremental=True)
+            self.assertEqual(report.loc[0, 'Status'], 'up to date')
+            self.assertEqual(len(self.urls), 1)
+            self.assertIn('period=latest1&', self.urls[0])
+
+            self.urls.clear()
+            self.periods += ['2021', '2022']
+            report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=4, incremental=True)
+            self.assertEqual([url.split('period=')[1].split('&')[0] for url in self.urls], ['latest1', 'latest2', 'latest4'])
+            self.assertEqual(report.loc[0, 'Rows'], 12)
+            df = pd.read_csv(Path(folder).joinpath('first', 'data for dataset first.csv'), dtype={'Time period': str})
+            self.assertEqual(sorted(df['Time period'].unique()), self.periods)
+            self.assertEqual(list(df.columns), ['Area', 'Time period', 'Metric 11', 'Metric 12'])
+            self.assertEqual(self.api_call._read_manifest(Path(folder).joinpath('first'))['periods'][11], self.periods)
+
+            self.urls.clear()
+            self.api_call.area = 'E09000022'
+            self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=4, incremental=True)
+            self.assertEqual([url.split('period=')[1].split('&')[0] for url in self.urls], ['latest4'])
+
+    def test_9_json_to_pandas(self) -> None:
+        json_data = fake_data_json(11, periods=('2019', '2020', '2021'), areas=('Lewisham', 'Southwark'))
+        json_data['rows'][1]['values'][2] = {'value': None, 'formatted': '-'}
+        df = self.api_call.json_to_pandas(json_data, value_name='Metric 11')
+        self.assertEqual(list(df.columns), ['Area', 'Time period', 'Metric 11'])
+        self.assertEqual(len(df), 6)
+        self.assertEqual(df['Area'].dtype, 'category')
+        self.assertEqual(df['Time period'].dtype, 'category')
+        self.assertEqual(df['Metric 11'].dtype, 'float64')
+        self.assertEqual(df['Area'].tolist(), ['Lewisham'] * 3 + ['Southwark'] * 3)
+        self.assertEqual(df['Time period'].tolist(), ['2019', '2020', '2021'] * 2)
+        self.assertEqual(df['Metric 11'].tolist()[:5], [11.0, 12.0, 13.0, 11.0, 12.0])
+        self.assertTrue(pd.isna(df['Metric 11'].iloc[5]))
+        self.assertEqual(len(self.api_call.json_to_pandas({'columns': [], 'rows': []})), 0)
+
+    def test_10_manifest_skips_dropped_metrics(self) -> None:
+        json_to_pandas = self.api_call.json_to_pandas
+
+        def failing_json_to_pandas(json_data, value_name):
+            if json_data['columns'][0]['metricType']['identifier'] == 12:
+                raise TypeError('unexpected value')
+            return json_to_pandas(json_data, value_name=value_name)
+
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.object(self.api_call, 'json_to_pandas', side_effect=failing_json_to_pandas):
+                report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=2, incremental=True)
+            self.assertEqual(report.loc[0, 'Status'], 'ok')
+            self.assertEqual(self.api_call._read_manifest(Path(folder).joinpath('first'))['periods'], {11: self.periods})
+
+            self.urls.clear()
+            self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=2, incremental=True)
+            self.assertIn('latest2', [url.split('period=')[1].split('&')[0] for url in self.urls if '/data?' in url])
+            self.assertEqual(self.api_call._read_manifest(Path(folder).joinpath('first'))['periods'], {11: self.periods, 12: self.periods})
+
+    def test_11_incremental_metadata(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=2, incremental=True)
+            metadata_path = Path(folder).joinpath('first', 'metadata.csv')
+            self.assertEqual(pd.read_csv(metadata_path, index_col=0)['MetricType'].tolist(), [11, 12])
+
+            self.metrics_per_dataset = 4
+            self.api_call.metadata_cache.ttl = timedelta(0)
+            report = self.api_call.download({'first': 1}, output_folder=Path(folder), latest_n=2, incremental=True)
+            self.assertEqual(report.loc[0, 'Status'], 'ok')
+            df = pd.read_csv(Path(folder).joinpath('first', 'data for dataset first.csv'))
+            self.assertIn('Metric 14', df.columns)
+            metadata = pd.read_csv(metadata_path, index_col=0)
+            self.assertEqual(sorted(metadata['MetricType'].tolist()), [11, 12, 14])
+            self.assertEqual(list(metadata.index), [0, 1, 2])
+
+
+    def test_12_retry_statuses(self) -> None:
+        api_call = LGInform(api_key='key', api_secret='secret', area='E09000023', requests_per_second=None, cache_folder=self.cache_folder.name)
+
+        def fake_session(*statuses):
+            responses = []
+            for status in statuses:
+                response = MagicMock()
+                if status != 200:
+                    response.raise_for_status.side_effect = aiohttp.ClientResponseError(MagicMock(), (), status=status)
+                response.json = AsyncMock(return_value={'status': status})
+                context = MagicMock()
+                context.__aenter__ = AsyncMock(return_value=response)
+                context.__aexit__ = AsyncMock(return_value=False)
+                responses.append(context)
+            return MagicMock(get=MagicMock(side_effect=responses))
+
+        async def get(session):
+            return await api_call._get_json(session, RateLimiter(requests_per_second=None), f"{api_call.base_url}/metricTypes/11?")
+
+        with patch('Consensus.LGInform.asyncio.sleep', new=AsyncMock()) as sleep:
+            session = fake_session(503, 429, 200)
+            self.assertEqual(asyncio.run(get(session)), {'status': 200})
+            self.assertEqual(session.get.call_count, 3)
+
+            for status in (401, 404):
+                session = fake_session(status, 200)
+                with self.assertRaises(aiohttp.ClientResponseError):
+                    asyncio.run(get(session))
+                self.assertEqual(session.get.call_count, 1)
+
+            session = fake_session(500, 500, 500, 500)
+            with self.assertRaises(aiohttp.ClientResponseError):
+                asyncio.run(get(session))
+            self.assertEqual(session.get.call_count, 4)
+        self.assertEqual(sleep.await_count, 5)
+
+
+
 if __name__ == '__main__':
     unittest.main()
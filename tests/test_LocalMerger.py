@@ -9,40 +9,45 @@ from Consensus.LocalMerger import GraphBuilder, DatabaseManager
 from pathlib import Path
 import pandas as pd
 import duckdb
+import pyarrow as pa
+import tempfile
 
 
 class TestGraphBuilder(unittest.TestCase):
 
-    @patch("builtins.open", new_callable=MagicMock)  # Mock the open function to simulate reading files
-    @patch("pathlib.Path.rglob", return_value=[Path("/mock/path/to/directory/table1.csv"), Path("/mock/path/to/directory/table2.xlsx")])  # Mock the rglob method for both CSV and Excel
-    @patch("pandas.read_csv", return_value=pd.DataFrame({"column1": [1, 2], "column2": [3, 4]}))  # Mock pd.read_csv to return a dummy DataFrame
-    @patch("pandas.read_excel", return_value=pd.DataFrame({"column1": [1, 2], "column2": [3, 4]}))  # Mock pd.read_excel to return a dummy DataFrame
-    def test_build_graph(self, mock_read_excel, mock_read_csv, mock_rglob, mock_open):
-        # Mock file contents, assuming the file should return some CSV-like content
-        mock_open.return_value.__enter__.return_value = ["column1,column2", "value1,value2", "value3,value4"]
-
-        # Initialize the GraphBuilder with a mock directory path
-        builder = GraphBuilder("/mock/path/to/directory")
-
-        # Ensure build_graph or equivalent is called to trigger rglob
-        builder._build_graph()  # Call the method that uses rglob to find files
-
-        # Check that rglob was called
-        mock_rglob.assert_called()  # Verify rglob was called during graph building
-
-        # Debugging: Print the actual calls to read_csv
-        print("Calls to read_csv:", mock_read_csv.call_args_list)
-
-        # Check if pandas read_csv was called with a Path object
-        mock_read_csv.assert_any_call(Path("/mock/path/to/directory/table1.csv"))  # Check the correct Path object
-
-        # Check if pandas read_excel was called with a Path object
-        mock_read_excel.assert_any_call(Path("/mock/path/to/directory/table2.xlsx"))  # Check the correct Path object
-
-        # Debugging: Print the graph's nodes
-        print("Graph nodes:", builder.graph.nodes)  # Inspect the graph structure
-        # Test: There should be 4 nodes in the graph: two tables and two columns
-        self.assertEqual(len(builder.graph.nodes), 4)  # Expected 4 nodes: two tables and two columns
+    def test_build_graph(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            (folder / 'data').mkdir()
+            pd.DataFrame({"column1": range(1000), "column2": range(1000)}).to_csv(folder / 'data' / 'table1.csv', index=False)
+            pd.DataFrame({"column1": [1, 2], "column2": [3, 4]}).to_excel(folder / 'data' / 'table2.xlsx', index=False)
+            pd.DataFrame({"column2": [1, 2], "column3": [3, 4]}).to_parquet(folder / 'data' / 'table3.parquet', index=False)
+            cache_path = folder / 'schemas.json'
+
+            with patch("pandas.read_csv", wraps=pd.read_csv) as mock_read_csv, patch("pandas.read_excel", wraps=pd.read_excel) as mock_read_excel:
+                builder = GraphBuilder(folder / 'data', cache_path=cache_path)
+                # only the headers are read
+                mock_read_csv.assert_called_once_with(folder / 'data' / 'table1.csv', nrows=0)
+                mock_read_excel.assert_called_once_with(folder / 'data' / 'table2.xlsx', nrows=0)
+
+            # three tables and three columns
+            self.assertEqual(len(builder.graph.nodes), 6)
+            self.assertEqual(builder.graph.nodes['table3']['columns'], ['COLUMN2', 'COLUMN3'])
+            self.assertEqual(sorted(builder.get_table_paths()), ['table1', 'table2', 'table3'])
+            self.assertTrue(cache_path.exists())
+
+            # unchanged files are not read again
+            with patch("pandas.read_csv") as mock_read_csv, patch("pandas.read_excel") as mock_read_excel, patch("pyarrow.parquet.read_schema") as mock_read_schema:
+                builder = GraphBuilder(folder / 'data', cache_path=cache_path)
+                mock_read_csv.assert_not_called()
+                mock_read_excel.assert_not_called()
+                mock_read_schema.assert_not_called()
+            self.assertEqual(len(builder.graph.nodes), 6)
+
+            # changed files are read again
+            pd.DataFrame({"column1": [1], "column4": [2]}).to_csv(folder / 'data' / 'table1.csv', index=False)
+            builder._build_graph()
+            self.assertEqual(builder.graph.nodes['table1']['columns'], ['COLUMN1', 'COLUMN4'])
 
     def test_bfs_paths(self):
         # Arrange
@@ -73,74 +78,87 @@ class TestGraphBuilder(unittest.TestCase):
 
 class TestDatabaseManager(unittest.TestCase):
 
-    @patch('pandas.DataFrame.to_sql')
-    @patch('pandas.read_csv')
-    @patch('duckdb.connect')  # Mocking duckdb.connect (not sqlite3.connect)
-    def test_create_database(self, mock_connect, mock_read_csv, mock_to_sql):
-        # Create mock return values for read_csv and connect
-        mock_df = pd.DataFrame({'col1': [1, 2], 'col2': [3, 4]})  # Mocked DataFrame
-        mock_conn = MagicMock()  # Mocked database connection
-
-        mock_read_csv.return_value = mock_df  # When read_csv is called, return mock_df
-        mock_connect.return_value = mock_conn  # When duckdb.connect is called, return mock_conn
-
-        # Create an instance of DatabaseManager
-        db_manager = DatabaseManager('path_to_db.db')  # Adjust the database path as needed
-
-        # Mock input for create_database method (using the dictionary format expected)
-        table_paths = {'table1': Path('path_to_csv.csv'), 'table2': Path('path_to_csv.csv')}
-
-        # Call the method you're testing
-        db_manager.create_database(table_paths)
-
-        # Print out all calls to to_sql to inspect what arguments were passed
-        print("Calls to to_sql:", mock_to_sql.call_args_list)
-
-        # Now assert that to_sql was called with the correct arguments for 'table1'
-        mock_to_sql.assert_any_call(mock_df, mock_conn, 'table1', if_exists='replace', index=False)
-        mock_to_sql.assert_any_call(mock_df, mock_conn, 'table2', if_exists='replace', index=False)
-
-        # Additional checks: Ensure the mock methods were called correctly
-        mock_connect.assert_called_once_with('path_to_db.db')  # Check the connection string
-        mock_read_csv.assert_any_call('path_to_csv.csv')  # Check the CSV file path
-
-        # Optionally, check the number of times to_sql was called (one per table)
-        self.assertEqual(mock_to_sql.call_count, 2)  # Two tables (table1, table2) should be processed
-
-    @patch("duckdb.connect")
-    @patch("pandas.read_csv")
-    @patch("pandas.read_excel")
-    def test_query_tables_from_path(self, mock_read_excel, mock_read_csv, mock_connect):
-        # Mock the connection and methods
-        mock_conn = MagicMock()
-        mock_connect.return_value = mock_conn
-
-        # Mock DataFrames for the CSV and Excel files
-        mock_read_csv.return_value = pd.DataFrame({'col1': [1, 2], 'col2': [3, 4]})
-        mock_read_excel.return_value = pd.DataFrame({'col1': [1, 2], 'col2': [7, 8]})
-
-        db_manager = DatabaseManager("test_db.duckdb")
-
-        # Mock table_paths dictionary
-        table_paths = {"table1": Path("test.csv"), "table2": Path("test.xlsx")}
-
-        # Act
-        path = ["table1", "table2"]  # Example path for testing
-        result_df = db_manager.query_tables_from_path(path, table_paths)
-
-        # Debugging prints to check the data loaded
-        print("Loaded DataFrame for table1 (CSV):")
-        print(mock_read_csv.return_value)
-        print("Loaded DataFrame for table2 (Excel):")
-        print(mock_read_excel.return_value)
-
-        # Assert the result is as expected
-        print("Resulting DataFrame after inner join:")
-        print(result_df)
-
-        # Assert that the shape is (2, 2), as the join should result in 2 rows and 2 columns.
-        # The join is inner by default, and 'col1' should match between both DataFrames.
+    def test_create_database(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            pd.DataFrame({'col1': [1, 2], 'col2': ['a', 'b']}).to_csv(folder / 'table1.csv', index=False)
+            pd.DataFrame({'col1': [1, 2, 3], 'col3': [0.5, 1.5, 2.5]}).to_parquet(folder / 'table2.parquet', index=False)
+            pd.DataFrame({'col2': ['a', 'b'], 'col4': [7, 8]}).to_excel(folder / 'table3.xlsx', index=False)
+
+            db_manager = DatabaseManager(str(folder / 'test.duckdb'))
+            table_paths = {'table1': folder / 'table1.csv', 'table2': folder / 'table2.parquet', 'table3': folder / 'table3.xlsx', 'missing': folder / 'missing.csv'}
+
+            with patch('pandas.read_csv') as mock_read_csv, patch('pandas.DataFrame.to_sql') as mock_to_sql:
+                db_manager.create_database(table_paths, max_workers=3)
+                mock_read_csv.assert_not_called()  # files are parsed by DuckDB
+                mock_to_sql.assert_not_called()
+
+            self.assertEqual(sorted(db_manager.list_all_tables()), ['table1', 'table2', 'table3'])
+            self.assertEqual(db_manager.conn.execute('SELECT col2 FROM table1 ORDER BY col1').fetchall(), [('a',), ('b',)])
+            self.assertEqual(db_manager.conn.execute('SELECT SUM(col3) FROM table2').fetchone()[0], 4.5)
+            self.assertEqual(db_manager.conn.execute('SELECT col4 FROM table3 WHERE col2 = ?', ['b']).fetchone()[0], 8)
+
+            # reloading replaces the tables
+            pd.DataFrame({'col1': [5], 'col2': ['c']}).to_csv(folder / 'table1.csv', index=False)
+            db_manager.create_database({'table1': folder / 'table1.csv'})
+            self.assertEqual(db_manager.conn.execute('SELECT * FROM table1').fetchall(), [(5, 'c')])
+            db_manager.close()
+
+    def test_create_database_type_fallbacks(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            codes = [str(i) for i in range(50000)] + ['E09000023']
+            pd.DataFrame({'code': codes, 'value': range(len(codes))}).to_csv(folder / 'lookup.csv', index=False)
+            pd.DataFrame({'col1': [1, 2]}).to_excel(folder / 'table.xlsx', index=False)
+
+            db_manager = DatabaseManager(':memory:')
+            db_manager.conn.execute("SET autoinstall_known_extensions = false")
+            # an Excel extension without read_xlsx() falls back to pandas
+            with patch.object(DatabaseManager, '_excel_extension_available', return_value=True):
+                db_manager.create_database({'lookup': folder / 'lookup.csv', 'table': folder / 'table.xlsx'})
+
+            self.assertEqual(db_manager.conn.execute('SELECT COUNT(*) FROM lookup').fetchone()[0], 50001)
+            self.assertEqual(db_manager.conn.execute("SELECT value FROM lookup WHERE code = 'E09000023'").fetchone()[0], 50000)
+            self.assertEqual(db_manager.conn.execute('SELECT SUM(col1) FROM "table"').fetchone()[0], 3)
+            db_manager.close()
+
+    def test_query_tables_from_path(self):
+        db_manager = DatabaseManager(":memory:")
+        db_manager.conn.register('df1', pd.DataFrame({'col1': [1, 2], 'col2': [3, 4]}))
+        db_manager.conn.register('df2', pd.DataFrame({'COL1': [1, 2], 'col2': [7, 8]}))
+        db_manager.conn.register('df3', pd.DataFrame({'col2': [3, 5], 'code': ['E09000023', 'E09000022']}))
+        for table, df in [('table1', 'df1'), ('table2', 'df2'), ('table3', 'df3')]:
+            db_manager.conn.execute(f'CREATE TABLE {table} AS SELECT * FROM {df}')
+
+        with patch("pandas.read_csv") as mock_read_csv, patch("pandas.read_excel") as mock_read_excel:
+            result_df = db_manager.query_tables_from_path(["table1", "table2"], {"table1": Path("test.csv"), "table2": Path("test.xlsx")})
+            mock_read_csv.assert_not_called()  # the stored tables are used
+            mock_read_excel.assert_not_called()
+
+        # joined on col1; the second col2 is suffixed with the table name
         self.assertEqual(result_df.shape, (2, 3))
+        self.assertEqual(list(result_df.columns), ['col1', 'col2', 'col2_table2'])
+        self.assertEqual(result_df.sort_values('col1')['col2_table2'].tolist(), [7, 8])
+
+        # projection and filters are pushed into the query
+        result = db_manager.query_tables_from_path(["table1", "table3"], columns=['col1', 'CODE'], filters={'code': ['E09000023'], 'col1': 1}, output='arrow')
+        self.assertIsInstance(result, pa.Table)
+        self.assertEqual(result.to_pylist(), [{'col1': 1, 'CODE': 'E09000023'}])
+        sql, params = db_manager._join_sql(["table1", "table3"], 'inner', columns=['code'], filters={'col1': [1, 2]})
+        self.assertIn('INNER JOIN "table3" AS t1 ON t0."col2" = t1."col2"', sql)
+        self.assertTrue(sql.startswith('SELECT t1."code" AS "code" FROM'))
+        self.assertEqual(params, [[1, 2]])
+
+        outer = db_manager.query_tables_from_path(["table1", "table3"], join_type='outer')
+        self.assertEqual(sorted(outer['col2'].tolist()), [3, 4, 5])
+
+        with self.assertRaises(ValueError):
+            db_manager.query_tables_from_path(["table1", "table2"], columns=['missing'])
+        with self.assertRaises(ValueError):
+            db_manager.query_tables_from_path(["unknown"])
+        with self.assertRaises(ValueError):
+            db_manager.query_tables_from_path(["table1", "table3"], output='polars')
+        db_manager.close()
 
     @patch("duckdb.connect")
     def test_list_all_tables(self, mock_connect):
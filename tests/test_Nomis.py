@@ -1,8 +1,19 @@
 import unittest
+import asyncio
+import tempfile
+import io
+import json
+import aiohttp
+import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest.mock import patch, MagicMock, AsyncMock
+from requests.exceptions import ConnectionError as RequestsConnectionError, RetryError
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from Consensus.Nomis import DownloadFromNomis
+from Consensus.Nomis import DownloadFromNomis, AsyncDownloadFromNomis, NomisResultCache, NomisBulkStore, NomisGeography
 from Consensus.ConfigManager import ConfigManager
 from dotenv import load_dotenv
 from pathlib import Path
@@ -55,5 +66,538 @@ class TestNomis(unittest.TestCase):
         self.assertEqual(df.shape, (30, 28))
 
 
+class TestAsyncNomis(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = AsyncDownloadFromNomis(api_key='test', proxies={}, max_concurrent_requests=3, record_limit=10)
+        self.data = pd.DataFrame({'row': range(47)})
+        self.requested_offsets = []
+
+        async def fake_fetch_page(session, semaphore, url, offset):
+            self.requested_offsets.append(offset)
+            async with semaphore:
+                await asyncio.sleep(0.01 * (offset % 3))  # finish out of order
+            return self.data.iloc[offset:offset + self.conn.record_limit].reset_index(drop=True)
+
+        self.conn._fetch_page = fake_fetch_page
+
+    def test_1_paged_download(self) -> None:
+        df = asyncio.run(self.conn.download('NM_2072_1', params={'geography': ['E92000001']}))
+        self.assertTrue(df.equals(self.data))
+        self.assertEqual(sorted(self.requested_offsets), [0, 10, 20, 30, 40, 50, 60])
+
+    def test_2_single_page(self) -> None:
+        self.data = self.data.head(4)
+        df = asyncio.run(self.conn.download('NM_2072_1', params={'geography': ['E92000001']}))
+        self.assertTrue(df.equals(self.data))
+        self.assertEqual(self.requested_offsets, [0])
+
+
+class TestAsyncNomisPages(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = AsyncDownloadFromNomis(api_key='test', proxies={}, max_retries=2, record_limit=10)
+
+    def fake_session(self, *statuses: int) -> MagicMock:
+        responses = []
+        for status in statuses:
+            response = MagicMock()
+            if status != 200:
+                response.raise_for_status.side_effect = aiohttp.ClientResponseError(MagicMock(), (), status=status)
+            response.read = AsyncMock(return_value=b'GEOGRAPHY,GEOGRAPHY_CODE,OBS_VALUE\n00123,E00000001,5\n00124,E00000002,6\n')
+            context = MagicMock()
+            context.__aenter__ = AsyncMock(return_value=response)
+            context.__aexit__ = AsyncMock(return_value=False)
+            responses.append(context)
+        return MagicMock(get=MagicMock(side_effect=responses))
+
+    def fetch(self, session: MagicMock) -> pd.DataFrame:
+        return asyncio.run(self.conn._fetch_page(session, asyncio.Semaphore(1), 'http://www.nomisweb.co.uk/api/v01/dataset/NM_2072_1.data.csv?uid=test', 0))
+
+    def test_1_typed_parse(self) -> None:
+        df = self.fetch(self.fake_session(200))
+        self.assertEqual(df['GEOGRAPHY'].astype(str).tolist(), ['00123', '00124'])
+        self.assertEqual(df['GEOGRAPHY_CODE'].dtype, 'category')
+        self.assertEqual(df['OBS_VALUE'].dtype, 'float64')
+
+    def test_2_retries(self) -> None:
+        with patch('Consensus.Nomis.asyncio.sleep', new=AsyncMock()) as sleep:
+            session = self.fake_session(503, 429, 200)
+            self.assertEqual(len(self.fetch(session)), 2)
+            self.assertEqual(session.get.call_count, 3)
+
+            session = self.fake_session(404, 200)
+            with self.assertRaises(aiohttp.ClientResponseError):
+                self.fetch(session)
+            self.assertEqual(session.get.call_count, 1)
+
+            session = self.fake_session(500, 500, 500)
+            with self.assertRaises(aiohttp.ClientResponseError):
+                self.fetch(session)
+            self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(sleep.await_count, 4)
+
+
+def fake_catalogue_response(status_code=200, etag='"v1"', last_updated='2023-03-28 09:30:00'):
+    tables = [{'agencyid': 'NOMIS', 'annotations': {'annotation': [{'annotationtitle': 'MetadataTitle0', 'annotationtext': 'Census 2021'},
+                                                                   {'annotationtitle': 'LastUpdated', 'annotationtext': last_updated}]}, 'id': 'NM_2072_1',
+               'components': {'dimension': [{'conceptref': 'GEOGRAPHY', 'codelist': 'CL_2072_1_GEOGRAPHY'}]}, 'name': {'value': 'TS054 - Tenure'}, 'uri': 'Nm-2072d1', 'version': '1.0'},
+              {'agencyid': 'NOMIS', 'annotations': {'annotation': []}, 'id': 'NM_2021_1',
+               'components': {'dimension': [{'conceptref': 'GEOGRAPHY', 'codelist': 'CL_2021_1_GEOGRAPHY'}]}, 'name': {'value': 'TS001 - Number of usual residents'}, 'uri': 'Nm-2021d1', 'version': '1.0'}]
+    response = MagicMock(status_code=status_code, headers={'ETag': etag})
+    response.json.return_value = {'structure': {'keyfamilies': {'keyfamily': tables}}}
+    return response
+
+
+class TestGeographyCompression(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = DownloadFromNomis(api_key='test', proxies={})
+
+    def test_1_prefix_ranges(self) -> None:
+        codes = ['E00000003', 'E00000001', 'E00000002', 'W01000001', 'W01000002', 'S12000033', 'E01000001', 'E00000009', 'E00000010', '2092957699']
+        self.assertEqual(self.conn._compress_geography(codes),
+                         ['E00000001...E00000003', 'E00000009', 'E00000010', 'E01000001', 'S12000033', 'W01000001', 'W01000002', '2092957699'])
+
+    def test_2_url_splitting(self) -> None:
+        codes = [f"E0{i:07}" for i in range(0, 4000, 2)]  # no consecutive codes, so nothing compresses
+        self.conn.url_creator('NM_2072_1', {'geography': codes, 'measures': ['20100']})
+        self.assertGreater(len(self.conn.urls), 1)
+        self.assertTrue(all(len(url) <= self.conn.max_url_length for url in self.conn.urls))
+        self.assertTrue(all('measures=20100&' in url for url in self.conn.urls))
+        split_codes = [code for url in self.conn.urls for code in url.split('geography=')[1].split('&')[0].split(',')]
+        self.assertEqual(split_codes, codes)
+
+        self.conn.url_creator('NM_2072_1', {'geography': codes[:3]})
+        self.assertEqual(self.conn.urls, [self.conn.url])
+
+    def test_3_split_download(self) -> None:
+        codes = [f"E0{i:07}" for i in range(0, 4000, 2)]
+
+        def fake_get(url, **kwargs):
+            url_codes = url.split('geography=')[1].split('&')[0].split(',')
+            rows = ['GEOGRAPHY_CODE,OBS_VALUE'] + [f"{code},1" for code in url_codes]
+            response = MagicMock(raw=io.BytesIO(('\n'.join(rows) + '\n').encode()))
+            response.__enter__.return_value = response
+            return response
+
+        with patch('Consensus.Nomis.Session.get', side_effect=fake_get) as mock_get:
+            df = self.conn.download('NM_2072_1', params={'geography': codes})
+        self.assertGreater(mock_get.call_count, 1)
+        self.assertEqual(df['GEOGRAPHY_CODE'].astype(str).tolist(), codes)
+
+
+def fake_codelist_response(codes):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'structure': {'codelists': {'codelist': [{'code': codes}]}}}
+    return response
+
+
+class TestGeographySelectors(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name)
+        self.types = [{'value': 'TYPE153', 'description': {'value': '2022 wards'}},
+                      {'value': 'TYPE154', 'description': {'value': 'local authorities: district / unitary (as of April 2021)'}},
+                      {'value': 'TYPE155', 'description': {'value': 'local authorities: district / unitary (as of April 2023)'}}]
+
+        def fake_get(url, **kwargs):
+            if 'geography/TYPE.def.sdmx.json' in url:
+                return fake_codelist_response(self.types)
+            return fake_codelist_response([{'value': 1778384899, 'description': {'value': 'Lewisham'}}])
+
+        self.patcher = patch('Consensus.Nomis.Session.get', side_effect=fake_get)
+        self.mock_get = self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.folder.cleanup()
+
+    def test_1_selector_in_url(self) -> None:
+        self.conn.url_creator('NM_2072_1', {'geography': [NomisGeography(type='wards', parent='E09000023')]})
+        self.assertIn('geography=1778384899TYPE153&', self.conn.url)
+        self.conn.url_creator('NM_2072_1', {'geography': [NomisGeography(type=480), 'E92000001']})
+        self.assertIn('geography=E92000001,TYPE480&', self.conn.url)
+
+    def test_2_cached_hierarchy(self) -> None:
+        self.assertEqual(self.conn.geography_types('NM_2072_1')[153], '2022 wards')
+        self.conn.url_creator('NM_2072_1', {'geography': [NomisGeography(type='wards', parent='E09000023')]})
+        calls = self.mock_get.call_count
+
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name)
+        conn.url_creator('NM_2072_1', {'geography': [NomisGeography(type='wards', parent='E09000023')]})
+        self.assertEqual(self.mock_get.call_count, calls)
+        self.assertIn('1778384899TYPE153', conn.url)
+
+    def test_3_ambiguous_type(self) -> None:
+        with self.assertRaises(ValueError):
+            self.conn.url_creator('NM_2072_1', {'geography': [NomisGeography(type='local authorities')]})
+
+    def test_4_ids_by_dataset(self) -> None:
+        hierarchy = self.conn.geography_hierarchy
+        self.assertEqual(hierarchy.geography_id('NM_2072_1', 'E09000023'), '1778384899')
+        calls = self.mock_get.call_count
+        hierarchy.geography_id('NM_2072_1', 'E09000023')
+        self.assertEqual(self.mock_get.call_count, calls)
+        hierarchy.geography_id('NM_2021_1', 'E09000023')  # the id of another dataset is requested again
+        self.assertEqual(self.mock_get.call_count, calls + 1)
+        with open(hierarchy.cache_path) as f:
+            self.assertEqual(json.load(f)['ids'], {'NM_2072_1': {'E09000023': '1778384899'}, 'NM_2021_1': {'E09000023': '1778384899'}})
+
+        with open(hierarchy.cache_path, 'w') as f:
+            json.dump({'types': {}, 'ids': {'E09000023': '1'}}, f)  # ids cached by an earlier version
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name)
+        self.assertEqual(conn.geography_hierarchy.geography_id('NM_2072_1', 'E09000023'), '1778384899')
+
+    def test_5_shared_between_threads(self) -> None:
+        datasets = [f"NM_{i}_1" for i in range(40)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda dataset: self.conn.geography_hierarchy.selector(dataset, NomisGeography(type=153, parent='E09000023')), datasets))
+        with open(self.conn.geography_hierarchy.cache_path) as f:
+            self.assertEqual(sorted(json.load(f)['ids']), sorted(datasets))
+
+    def test_6_bulk_fallback(self) -> None:
+        def fake_get(url, **kwargs):
+            if 'geography/TYPE.def.sdmx.json' in url:
+                return fake_codelist_response(self.types)
+            if '.def.sdmx.json' in url:
+                return fake_codelist_response([{'value': 1778384899, 'description': {'value': 'Lewisham'}}])
+            if '.bulk.csv' in url:
+                return fake_csv_response(n_rows=40)
+            return fake_csv_response(n_rows=0)  # the API returns no rows
+
+        self.mock_get.side_effect = fake_get
+        df = self.conn.download('NM_2072_1', params={'geography': [NomisGeography(type='wards', parent='E09000023')]})
+        self.assertEqual(len(df), 40)  # the selector cannot be matched against the bulk table, so it is not filtered
+        df = self.conn.download('NM_2072_1', params={'geography': ['E00000003', 'E00000005']})
+        self.assertEqual(sorted(df['geography code'].unique()), ['E00000003', 'E00000005'])
+
+
+class TestNomisSession(unittest.TestCase):
+    def test_1_shared_session(self) -> None:
+        conn = DownloadFromNomis(api_key='test', proxies={'http': 'http://proxy:8080', 'https': None}, timeout=(5, 60), max_retries=2)
+        self.assertEqual(conn.session.proxies, {'http': 'http://proxy:8080'})
+        retry = conn.session.get_adapter('http://www.nomisweb.co.uk').max_retries
+        self.assertEqual(retry.total, 2)
+        self.assertIn(503, retry.status_forcelist)
+
+        with patch('Consensus.Nomis.Session.get', return_value=fake_csv_response(n_rows=3)) as mock_get:
+            conn.url_creator('NM_2072_1', {'geography': ['E92000001']})
+            conn._download_to_pandas()
+            conn._download_to_pandas()
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], (5, 60))
+        self.assertTrue(mock_get.call_args.kwargs['stream'])
+
+
+class TestDownloadMany(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name)
+        self.urls = []
+
+        def fake_get(url, **kwargs):
+            if 'def.sdmx.json' in url:
+                return fake_catalogue_response()
+            self.urls.append(url)
+            dataset = url.split('/dataset/')[1].split('.data.csv')[0]
+            rows = ['GEOGRAPHY_CODE,OBS_VALUE', f"E92000001,{dataset[3:7]}"]
+            response = MagicMock(raw=io.BytesIO(('\n'.join(rows) + '\n').encode()))
+            response.__enter__.return_value = response
+            return response
+
+        self.patcher = patch('Consensus.Nomis.Session.get', side_effect=fake_get)
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.folder.cleanup()
+
+    def test_1_dict_output(self) -> None:
+        params = {'geography': ['E92000001']}
+        frames = self.conn.download_many(['NM_2072_1', 'NM_2021_1'], params=params)
+        self.assertEqual(list(frames), ['NM_2072_1', 'NM_2021_1'])
+        self.assertEqual(frames['NM_2021_1']['OBS_VALUE'].tolist(), [2021])
+        self.assertEqual(params, {'geography': ['E92000001']})  # params are not modified
+
+        select = {url.split('/dataset/')[1][:9]: url.split('select=')[1].split('&')[0] for url in self.urls}
+        self.assertEqual(select['NM_2072_1'], 'DATE,GEOGRAPHY_CODE,GEOGRAPHY_NAME,MEASURES_NAME,OBS_VALUE')
+
+    def test_2_long_output(self) -> None:
+        df = self.conn.download_many(['NM_2072_1', 'NM_2021_1'], params={'geography': ['E92000001']}, select=['GEOGRAPHY_CODE', 'OBS_VALUE'], output='long')
+        self.assertEqual(list(df.columns), ['dataset', 'GEOGRAPHY_CODE', 'OBS_VALUE'])
+        self.assertEqual(df['dataset'].tolist(), ['NM_2072_1', 'NM_2021_1'])
+        self.assertTrue(all('select=GEOGRAPHY_CODE,OBS_VALUE&' in url for url in self.urls))
+
+    def test_3_workers_do_not_share_state(self) -> None:
+        self.conn.catalogue.sync()
+        url, urls = self.conn.url, list(self.conn.urls)
+        self.conn.download_many(['NM_2072_1', 'NM_2021_1'], params={'geography': ['E92000001']})
+        self.assertEqual((self.conn.url, self.conn.urls), (url, urls))
+
+        worker = self.conn._worker()
+        worker.url_creator('NM_2021_1', params={'geography': ['E92000001']})
+        self.assertIn('NM_2021_1', worker.url)
+        worker.catalogue.sync(force=True)
+        self.assertIs(worker.catalogue.connection, worker)
+        self.assertIs(worker.session, self.conn.session)
+        self.assertEqual((self.conn.url, self.conn.urls), (url, urls))
+
+
+class TestNomisCatalogue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.cache_folder.name)
+
+    def tearDown(self) -> None:
+        self.cache_folder.cleanup()
+
+    def test_1_indexed_lookup(self) -> None:
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response()) as mock_get:
+            self.conn.connect()
+            self.assertEqual(self.conn.catalogue.get('NM_2072_1').name['value'], 'TS054 - Tenure')
+            self.assertEqual(self.conn.get_table_columns('NM_2072_1'), [('GEOGRAPHY', 'CL_2072_1_GEOGRAPHY')])
+            self.assertEqual([table.id for table in self.conn.catalogue.find('Tenure')], ['NM_2072_1'])
+            self.assertEqual([table.id for table in self.conn.catalogue.find('usual residents')], ['NM_2021_1'])
+            self.assertEqual(self.conn.catalogue.find('tenure residents'), [])
+            self.assertEqual(mock_get.call_count, 1)
+
+    def test_4_search(self) -> None:
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response()):
+            self.conn.connect()
+        self.assertEqual([table.id for table in self.conn.search_tables('tenure')], ['NM_2072_1'])
+        self.assertEqual(self.conn.search_tables('census 2021')[0].id, 'NM_2072_1')  # annotation ranks above the 2021 in NM_2021_1
+        self.assertEqual(sorted(table.id for table in self.conn.search_tables('residents tenure')), ['NM_2021_1', 'NM_2072_1'])
+        self.assertEqual(len(self.conn.search_tables('geography')), 2)  # codelist
+        self.assertEqual(len(self.conn.search_tables('geography', limit=1)), 1)
+        self.assertEqual(self.conn.search_tables('unemployment'), [])
+
+    def test_2_cache_and_revalidation(self) -> None:
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response()):
+            self.conn.connect()
+
+        # a fresh cache is used without contacting NOMIS
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.cache_folder.name)
+        with patch('Consensus.Nomis.Session.get') as mock_get:
+            conn.connect()
+            mock_get.assert_not_called()
+        self.assertEqual(len(conn.get_all_tables()), 2)
+
+        # a stale cache is revalidated with the ETag and kept if NOMIS answers 304
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.cache_folder.name, catalogue_ttl=timedelta(0))
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response(status_code=304)) as mock_get:
+            conn.connect()
+            self.assertEqual(mock_get.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+        self.assertIsNotNone(conn.catalogue.get('NM_2021_1'))
+
+    def test_3_offline(self) -> None:
+        with patch('Consensus.Nomis.Session.get', side_effect=RequestsConnectionError()):
+            with self.assertRaises(ConnectionError):
+                self.conn.connect()
+
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response()):
+            self.conn.connect()
+
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.cache_folder.name, catalogue_ttl=timedelta(0))
+        with patch('Consensus.Nomis.Session.get', side_effect=RequestsConnectionError()):
+            conn.connect()
+        self.assertIsNotNone(conn.catalogue.get('NM_2072_1'))
+
+    def test_4_retries_exhausted(self) -> None:
+        with patch('Consensus.Nomis.Session.get', side_effect=RetryError()):
+            with self.assertRaises(ConnectionError):
+                self.conn.connect()
+
+        with patch('Consensus.Nomis.Session.get', return_value=fake_catalogue_response()):
+            self.conn.connect()
+
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.cache_folder.name, catalogue_ttl=timedelta(0))
+        with patch('Consensus.Nomis.Session.get', side_effect=RetryError()):
+            conn.connect()
+        self.assertIsNotNone(conn.catalogue.get('NM_2072_1'))
+
+
+def fake_csv_response(n_rows=5000):
+    rows = ['date,geography,geography code,Tenure: Total; measures: Value'] + [f"2021,Area {i % 40},E0{i % 40:07d},{i}" for i in range(n_rows)]
+    response = MagicMock(raw=io.BytesIO(('\n'.join(rows) + '\n').encode()))
+    response.__enter__.return_value = response
+    return response
+
+
+class TestNomisStreaming(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name)
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_1_categorical_pandas(self) -> None:
+        with patch('Consensus.Nomis.Session.get', return_value=fake_csv_response()):
+            df = self.conn.bulk_download('NM_2072_1')
+        self.assertEqual(df.shape, (5000, 4))
+        self.assertIsInstance(df['geography code'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['Tenure: Total; measures: Value'].sum(), sum(range(5000)))
+
+    def test_2_parquet_row_groups(self) -> None:
+        with patch('Consensus.Nomis.Session.get', return_value=fake_csv_response()):
+            self.conn._bulk_download_url('NM_2072_1')
+            self.conn._download_to_parquet(Path(self.folder.name) / 'NM_2072_1_bulk.parquet', block_size=1 << 12)
+        parquet_file = pq.ParquetFile(Path(self.folder.name) / 'NM_2072_1_bulk.parquet')
+        self.assertGreater(parquet_file.metadata.num_row_groups, 1)
+        df = parquet_file.read().to_pandas()
+        self.assertEqual(df.shape, (5000, 4))
+        self.assertIsInstance(df['geography'].dtype, pd.CategoricalDtype)
+
+    def test_3_type_change_after_first_block(self) -> None:
+        rows = ['DATE,GEOGRAPHY_CODE,RURAL_URBAN_NAME,OBS_VALUE']
+        rows += [f"2021,{i},,{i}" for i in range(2000)]
+        rows += ['2021,E09000023,Urban,2.5', '2021-03,W06000001,Rural,']
+        stream = io.BytesIO(('\n'.join(rows) + '\n').encode())
+        df = self.conn._csv_stream_to_pandas(stream, block_size=1 << 10)
+        self.assertEqual(df.shape, (2002, 4))
+        self.assertEqual(df['GEOGRAPHY_CODE'].iloc[-2], 'E09000023')
+        self.assertEqual(df['RURAL_URBAN_NAME'].iloc[-1], 'Rural')
+        self.assertEqual(df['DATE'].iloc[-1], '2021-03')
+        self.assertEqual(df['OBS_VALUE'].dtype, 'float64')
+        self.assertEqual(df['OBS_VALUE'].iloc[-2], 2.5)
+        self.assertTrue(pd.isna(df['OBS_VALUE'].iloc[-1]))
+
+    def test_4_failed_parquet_stream(self) -> None:
+        class FailingStream(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() > 1 << 18:
+                    raise OSError('connection reset')
+                return super().read(size)
+
+        file_path = Path(self.folder.name) / 'NM_2072_1_bulk.parquet'
+        stream = FailingStream(fake_csv_response(n_rows=50000).raw.getvalue())
+        with self.assertRaises(OSError):
+            self.conn._csv_stream_to_parquet(stream, file_path, block_size=1 << 12)
+        self.assertEqual(list(Path(self.folder.name).glob('*.parquet*')), [])
+
+
+class TestNomisResultCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = NomisResultCache(cache_folder=self.folder.name)
+        self.df = pd.DataFrame({'GEOGRAPHY_CODE': ['E00000001', 'E00000002', 'E00000003'] * 2,
+                                'MEASURES': [20100] * 3 + [20301] * 3,
+                                'OBS_VALUE': [1.0, 2.0, 3.0, 10.0, 20.0, 30.0]})
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_1_exact_hit(self) -> None:
+        self.cache.put('NM_1_1', self.df, {'geography': ['E00000003', 'E00000001', 'E00000002']})
+        cached = NomisResultCache(cache_folder=self.folder.name).get('NM_1_1', {'GEOGRAPHY': ['E00000001', 'E00000002', 'E00000003']})
+        self.assertTrue(cached.equals(self.df))
+        self.assertIsNone(self.cache.get('NM_2_1', {'geography': ['E00000001']}))
+
+    def test_2_subset_from_superset(self) -> None:
+        self.cache.put('NM_1_1', self.df, {'geography': ['E00000001', 'E00000002', 'E00000003']})
+        subset = self.cache.get('NM_1_1', {'geography': ['E00000002'], 'measures': ['20301']}, ['GEOGRAPHY_CODE', 'OBS_VALUE'])
+        self.assertEqual(subset.to_dict('list'), {'GEOGRAPHY_CODE': ['E00000002'], 'OBS_VALUE': [20.0]})
+        self.assertIsNone(self.cache.get('NM_1_1', {'geography': ['E00000004']}))
+        self.assertIsNone(self.cache.get('NM_1_1', {'geography': ['E00000001...E00000002']}))
+
+        self.cache.put('NM_2_1', pd.DataFrame({'geography code': ['E1', 'E2'], 'value': [1, 2]}), bulk=True)
+        self.assertEqual(self.cache.get('NM_2_1', {'geography': ['E2']})['value'].tolist(), [2])
+        self.assertIsNone(self.cache.get('NM_2_1', {'geography': ['E2'], 'measures': ['20100']}))
+
+    def test_3_ttl_and_lru(self) -> None:
+        expired = NomisResultCache(cache_folder=self.folder.name, ttl=timedelta(0))
+        expired.put('NM_1_1', self.df, {'geography': ['E00000001']})
+        self.assertIsNone(expired.get('NM_1_1', {'geography': ['E00000001']}))
+
+        self.cache.put('NM_1_1', self.df, {'geography': ['E00000001']})
+        self.cache.max_size_bytes = self.cache.index[next(iter(self.cache.index))]['size'] * 2
+        self.cache.put('NM_2_1', self.df, {'geography': ['E00000001']})
+        self.cache.get('NM_1_1', {'geography': ['E00000001']})  # NM_2_1 is now the least recently used
+        self.cache.put('NM_3_1', self.df, {'geography': ['E00000001']})
+        self.assertEqual(sorted(entry['query']['dataset'] for entry in self.cache.index.values()), ['NM_1_1', 'NM_3_1'])
+        self.assertEqual(len(list(Path(self.folder.name).glob('*.parquet'))), 2)
+
+    def test_4_download_uses_cache(self) -> None:
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name, cache=self.cache)
+        with patch('Consensus.Nomis.Session.get', return_value=fake_csv_response(n_rows=40)) as mock_get:
+            bulk = conn.bulk_download('NM_2072_1')
+            df = conn.download('NM_2072_1', params={'geography': ['E00000003']})
+            self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(len(bulk), 40)
+        self.assertEqual(df['geography code'].astype(str).unique().tolist(), ['E00000003'])
+
+    def test_5_value_and_percent_do_not_collide(self) -> None:
+        conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name, cache=self.cache)
+        params = {'geography': ['E00000001', 'E00000002']}
+        with patch('Consensus.Nomis.Session.get', side_effect=[fake_csv_response(n_rows=10), fake_csv_response(n_rows=20)]) as mock_get:
+            value = conn.download('NM_2072_1', params=params, value_or_percent='value')
+            percent = conn.download('NM_2072_1', params=params, value_or_percent='percent')
+            self.assertEqual(mock_get.call_count, 2)
+            self.assertEqual(len(conn.download('NM_2072_1', params=params, value_or_percent='percent')), 20)
+            self.assertEqual(len(conn.download('NM_2072_1', params=params, value_or_percent='value')), 10)
+            self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual((len(value), len(percent)), (10, 20))
+        self.assertEqual(params, {'geography': ['E00000001', 'E00000002']})  # the caller's parameters are not changed
+
+    def test_6_geography_ids(self) -> None:
+        df = self.df.assign(GEOGRAPHY=['2092957699', '2092957700', '2092957701'] * 2)
+        self.cache.put('NM_1_1', df, {'geography': ['2092957699', '2092957700', '2092957701']})
+        subset = self.cache.get('NM_1_1', {'geography': ['2092957699']})
+        self.assertEqual(subset['GEOGRAPHY_CODE'].tolist(), ['E00000001'] * 2)
+        self.assertIsNone(self.cache.get('NM_1_1', {'geography': ['2092957699', 'E00000002']}))
+
+        self.cache.put('NM_2_1', self.df, {'geography': ['2092957699', '2092957700']})
+        self.assertIsNone(self.cache.get('NM_2_1', {'geography': ['2092957699']}))  # the result has no id column
+
+
+class TestNomisBulkStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = NomisBulkStore(database_path=Path(self.folder.name) / 'bulk.duckdb')
+        self.conn = DownloadFromNomis(api_key='test', proxies={}, cache_folder=self.folder.name, catalogue_ttl=timedelta(0), bulk_store=self.store)
+        self.last_updated = '2023-03-28 09:30:00'
+        self.bulk_downloads = 0
+
+        def fake_get(url, **kwargs):
+            if 'def.sdmx.json' in url:
+                return fake_catalogue_response(last_updated=self.last_updated)
+            self.bulk_downloads += 1
+            return fake_csv_response(n_rows=40)
+
+        self.patcher = patch('Consensus.Nomis.Session.get', side_effect=fake_get)
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.store.close()
+        self.folder.cleanup()
+
+    def test_1_download_once(self) -> None:
+        df = self.conn.download('NM_2072_1', params={'geography': ['E00000003', 'E00000005']})
+        self.assertEqual(sorted(df['geography code'].unique()), ['E00000003', 'E00000005'])
+        self.assertEqual(len(df), 2)
+        self.assertEqual(len(self.conn.download('NM_2072_1')), 40)
+        self.assertEqual(self.bulk_downloads, 1)
+        self.assertEqual(self.store.datasets()['last_updated'].tolist(), [self.last_updated])
+
+    def test_2_refresh_on_update(self) -> None:
+        self.conn.download('NM_2072_1', params={'geography': ['E00000003']})
+        self.last_updated = '2024-01-01 09:30:00'
+        self.conn.download('NM_2072_1', params={'geography': ['E00000003']})
+        self.assertEqual(self.bulk_downloads, 2)
+        self.assertTrue(self.store.is_current('NM_2072_1', self.last_updated))
+
+    def test_3_other_queries_use_api(self) -> None:
+        self.assertFalse(self.store.can_answer({'geography': ['E00000003'], 'c2021_tenure_9': ['0']}))
+        self.assertFalse(self.store.can_answer({'geography': ['E00000001...E00000009']}))
+        self.assertFalse(self.store.can_answer({'geography': ['TYPE480']}))
+        self.assertFalse(self.store.can_answer({'geography': ['1778384899type153']}))
+        self.assertFalse(self.store.can_answer({'geography': [NomisGeography(type='wards', parent='E09000023')]}))
+        self.assertFalse(self.store.can_answer({'geography': ['E00000003', 'Prototype Area']}))
+        self.assertFalse(self.store.can_answer({'geography': ['2092957699']}))
+        self.assertTrue(self.store.can_answer({'geography': ['E00000003', 'W06000015']}))
+        self.assertTrue(self.store.can_answer({'geography': []}))
+        self.assertFalse(self.store.can_answer({'geography': ['E00000003']}, value_or_percent='percent'))
+        self.assertTrue(self.store.can_answer(None))
+
+
 if __name__ == '__main__':
     unittest.main()